@@ -9,11 +9,15 @@
 #   fctl [OPTIONS] COMMAND [ARGS]...
 #
 # Options:
+#   --trace PATH       Writes a Chrome trace of the run to PATH and prints a summary of where time was spent.
+#   --timings          Prints a summary of where time was spent.
+#   --output FORMAT    Prints 'text', or 'json' events, one per line, for automation.
 #   --help             Show this message and exit.
 #
 # Commands:
 #   compose            Foundation on Compose commands.
 #   kubernetes         Foundation on Kubernetes commands.
+#   render             Generates the Docker Compose file and Kubernetes manifests from 'foundation.yml'.
 #
 # Subcommands:
 #   compose build      Builds the container images.
@@ -25,8 +29,17 @@
 #   kubernetes down    Stops Foundation on Kubernetes mode and deletes all services, deployments and pods.
 # ======================================================================================================================
 
+import atexit
+import sys
 from os import path
+from typing import Optional
 import typer
+from typing_extensions import Annotated
+
+from lib.console import console
+from lib.directories import RENDER_DIR
+from lib.trace import tracer
+from lib.utils import Environments, Utils
 
 import platforms.compose as compose
 import platforms.kubernetes as kubernetes
@@ -37,10 +50,57 @@ app.add_typer(compose.app, name="compose", help="Foundation on Compose commands.
 app.add_typer(kubernetes.app, name="kubernetes", help="Foundation on Kubernetes commands.")
 app.add_typer(kubernetes.app, name="k8s", help="Foundation on Kubernetes commands.")
 
+@app.callback()
+def main(
+    trace: Annotated[Optional[str], typer.Option("--trace", help="Writes a Chrome trace of the run to this file.")] = None,
+    timings: Annotated[bool, typer.Option("--timings", help="Prints a summary of where time was spent.")] = False,
+    output: Annotated[str, typer.Option("--output", help="Output format: 'text', or 'json' for one JSON event per line.")] = "text",
+):
+    """Foundation Control Tool."""
+    if (output not in console.outputs):
+        console.error(f"Invalid value '{output}' for --output. Expected one of: {', '.join(console.outputs)}.")
+        exit(1)
+
+    console.set_output(output)
+    if (trace is None and not timings):
+        return
+
+    tracer.enable()
+    run = tracer.begin("fctl", "fctl", argv=" ".join(sys.argv[1:]))
+
+    # Also reported when a command fails and exits early.
+    def report() -> None:
+        tracer.finish(run)
+        console.print(tracer.summary())
+
+        if (trace is not None):
+            tracer.write(trace)
+            console.log("Wrote trace to " + trace + ".")
+
+    atexit.register(report)
+
+@app.command("render")
+def render_command(
+    output: Annotated[Optional[str], typer.Option("-o", help="Directory to write the generated files to.", show_default=RENDER_DIR)] = None,
+    compose: Annotated[bool, typer.Option(help="Generates the Docker Compose file.")] = True,
+    kubernetes: Annotated[bool, typer.Option(help="Generates the Kubernetes manifests.")] = True,
+    env: Environments = None,
+):
+    """Generates the Docker Compose file and Kubernetes manifests from 'foundation.yml'."""
+    from lib.configuration import get_configuration
+    from lib.render import Renderer, render_dir
+
+    environment = Utils.select_environment(env)
+    files = Renderer(get_configuration(environment), path.abspath(output or render_dir(environment))).render(compose, kubernetes)
+
+    for file in files:
+        if (file.changed):
+            console.log("* Wrote " + path.relpath(file.path) + ".")
+        else:
+            console.log("[italic bright_black]* " + path.relpath(file.path) + " is up to date.")
+
+    console.done(f"Rendered {len([file for file in files if file.changed])} of {len(files)} files.")
+
 # Run the app.
 if __name__ == "__main__":
     app()
-
-# TODO: Create an unified configuration file for both Docker Compose and Kubernetes mode.
-# TODO: Create an utility class that parses this configuration file and generates the Docker Compose and Kubernetes files on demand.
-# TODO: Implement this newly created utility class on both Docker Compose and Kubernetes mode commands.
\ No newline at end of file
@@ -0,0 +1,248 @@
+# ======================================================================================================================
+# Local stand-ins for the tools and APIs fctl talks to, used by the benchmark suite.
+#
+# * Stub 'docker' and 'kubectl' executables, whose latency and output volume are set with the FCTL_STUB_LATENCY
+#   (seconds) and FCTL_STUB_LINES environment variables.
+# * A fake Docker Engine API and a fake Kubernetes API, served over HTTP on localhost.
+# * Synthetic 'foundation.yml' files with any number of components.
+#
+# Nothing here touches the network or a real daemon or cluster.
+# ======================================================================================================================
+
+import json
+import os
+import stat
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Tuple
+from urllib.parse import parse_qs, urlparse
+
+STUBS = ["docker", "docker-compose", "kubectl"]
+
+# Shell script of the stubs, which are kept out of Python so their startup doesn't dominate what is measured.
+STUB_SCRIPT = """#!/bin/sh
+sleep "${FCTL_STUB_LATENCY:-0}"
+awk -v n="${FCTL_STUB_LINES:-0}" -v name="%s $1 $2" 'BEGIN {
+    for (i = 0; i < n; i++) printf "#%%d [%%s] step %%d/%%d: sha256:%%064d\\n", i, name, i, n, i
+}'
+case "$*" in *version*) echo "%s version 0.0.0-stub";; esac
+exit "${FCTL_STUB_EXIT:-0}"
+"""
+
+def install_stubs(directory: str) -> str:
+    """ Writes the stub executables to a directory. Returns the PATH to run them with, ahead of the real tools. """
+    os.makedirs(directory, exist_ok=True)
+    for name in STUBS:
+        path = os.path.join(directory, name)
+        with open(path, "w") as f:
+            f.write(STUB_SCRIPT % (name, name))
+        os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+
+    return directory + os.pathsep + os.environ.get("PATH", "")
+
+class FakeServer:
+    """ Serves a fake API on a random localhost port, on a background thread, with keep-alive connections. """
+
+    def __init__(self, handler: type) -> None:
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.server.daemon_threads = True
+        self.server.requests = 0
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_port}"
+
+    def __enter__(self) -> "FakeServer":
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def reply(self, status: int, data, content_type: str = "application/json") -> None:
+        self.server.requests += 1
+        content = data if isinstance(data, bytes) else json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def stream(self, status: int, chunks: List[bytes]) -> None:
+        """ Replies with chunked transfer encoding, the way the Docker daemon streams progress. """
+        self.server.requests += 1
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for chunk in chunks:
+            self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+class DockerAPIHandler(_Handler):
+    """ Answers the Docker Engine API requests made by builds and pushes: inspections, histories and pushes. """
+
+    # Layers reported by every push.
+    layers: int = 5
+
+    def do_GET(self) -> None:
+        self.body()
+        path = urlparse(self.path).path
+        if (path.endswith("/_ping")):
+            self.reply(200, b"OK", "text/plain")
+        elif (path.endswith("/version")):
+            self.reply(200, {"ApiVersion": "1.43", "Version": "0.0.0-stub"})
+        elif ("/distribution/" in path):
+            self.reply(404, {"message": "manifest unknown"})
+        elif (path.startswith("/v") and "/images/" in path and path.endswith("/json")):
+            self.reply(200, {"Id": "sha256:" + "0" * 64, "RepoDigests": [], "Size": self.layers * 1000,
+                             "RootFS": {"Type": "layers", "Layers": [f"sha256:{layer:064x}" for layer in range(self.layers)]}})
+        elif (path.startswith("/v") and "/images/" in path and path.endswith("/history")):
+            history = [{"Id": "<missing>", "CreatedBy": f"RUN step {layer}", "Size": 1000} for layer in range(self.layers)]
+            self.reply(200, list(reversed(history + [{"Id": "<missing>", "CreatedBy": "CMD [\"run\"]", "Size": 0}])))
+        else:
+            self.reply(404, {"message": "not found"})
+
+    def do_POST(self) -> None:
+        self.body()
+        path = urlparse(self.path).path
+        if (path.endswith("/push")):
+            events = []
+            for layer in range(self.layers):
+                id = f"{layer:012x}"
+                events.append({"status": "Preparing", "id": id})
+                for current in range(1, 4):
+                    events.append({"status": "Pushing", "id": id, "progressDetail": {"current": current * 1000, "total": 3000}})
+                events.append({"status": "Pushed", "id": id})
+
+            events.append({"aux": {"Tag": "latest", "Digest": "sha256:" + "1" * 64, "Size": 1234}})
+            self.stream(200, [json.dumps(event).encode() + b"\r\n" for event in events])
+        elif (path.endswith("/auth")):
+            self.reply(200, {"Status": "Login Succeeded"})
+        elif ("/tag" in path):
+            self.reply(201, b"", "text/plain")
+        else:
+            self.reply(404, {"message": "not found"})
+
+class KubernetesAPIHandler(_Handler):
+    """ Keeps objects in memory, answering server-side applies, deletes and lists like the API server would. """
+
+    objects: Dict[Tuple[str, str], dict] = {}
+    lock = threading.Lock()
+
+    def do_PATCH(self) -> None:
+        path = urlparse(self.path).path
+        manifest = json.loads(self.body() or b"{}")
+        with self.lock:
+            live = self.objects.setdefault((path.rsplit("/", 1)[0], path.rsplit("/", 1)[1]), {})
+            live.update(manifest)
+            live.setdefault("metadata", {})["resourceVersion"] = str(len(self.objects))
+
+        self.reply(200, live)
+
+    def do_DELETE(self) -> None:
+        self.body()
+        path = urlparse(self.path).path
+        with self.lock:
+            live = self.objects.pop((path.rsplit("/", 1)[0], path.rsplit("/", 1)[1]), None)
+
+        if (live is None):
+            self.reply(404, {"kind": "Status", "message": "not found"})
+        else:
+            self.reply(200, {"kind": "Status", "status": "Success"})
+
+    def do_GET(self) -> None:
+        self.body()
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        with self.lock:
+            items = [item for (collection, _), item in self.objects.items() if collection == url.path]
+
+        for selector in query.get("labelSelector", [""])[0].split(","):
+            if ("=" in selector):
+                key, value = selector.split("=", 1)
+                items = [item for item in items if item.get("metadata", {}).get("labels", {}).get(key) == value]
+
+        self.reply(200, {"items": items, "metadata": {"resourceVersion": str(len(self.objects))}})
+
+def synthetic_configuration(path: str, components: int, tier_size: int = 8) -> None:
+    """
+    Writes a 'foundation.yml' with the given number of microservices, deployed in tiers of 'tier_size'. Every
+    component depends on a couple of components of the tier before its own.
+    """
+    names = [f"service{index:04d}" for index in range(components)]
+    tiers = [names[start:start + tier_size] for start in range(0, components, tier_size)]
+
+    entries = []
+    for index, tier in enumerate(tiers):
+        for name in tier:
+            dependencies = tiers[index - 1][:2] if index > 0 else []
+            entries.append({
+                "name": name,
+                "type": "microservice",
+                "path": f"infra/kubernetes/{name}.fndtn_service.yml",
+                "build": {
+                    "context": "services",
+                    "dockerfile": f"{name}/Dockerfile",
+                    "args": {"SERVICE": name, "DEBUG": False},
+                    "platforms": {
+                        "compose": {"build": True, "push": False},
+                        "kubernetes": {"build": True, "push": True},
+                    },
+                },
+                "depends_on": [{"name": dependency, "type": "microservice"} for dependency in dependencies],
+                "replicas": 2,
+                "ports": [{"expose": 8000 + index, "containerPort": 80}],
+            })
+
+    document = {
+        "api": "bench",
+        "settings": {"kubectl_command": ["kubectl"], "registry": "registry.local", "secrets_file": "./secrets.yml"},
+        "order": [[{"name": name, "type": "microservice"} for name in tier] for tier in tiers],
+        "components": entries,
+    }
+
+    # Written as JSON, which is valid YAML, so no YAML library is needed to generate it.
+    with open(path, "w") as f:
+        json.dump(document, f, indent=2)
+
+def manifests(components: int) -> List[Tuple[str, dict]]:
+    """ Returns a Deployment and a Service for each of the given number of components, as (owner, manifest) pairs. """
+    objects = []
+    for index in range(components):
+        name = f"service{index:04d}"
+        labels = {"app": name}
+        objects.append((name, {
+            "apiVersion": "apps/v1",
+            "kind": "Deployment",
+            "metadata": {"name": name},
+            "spec": {
+                "replicas": 2,
+                "selector": {"matchLabels": labels},
+                "template": {
+                    "metadata": {"labels": labels},
+                    "spec": {"containers": [{"name": name, "image": f"registry.local/{name}",
+                                             "ports": [{"containerPort": 80}]}]},
+                },
+            },
+        }))
+        objects.append((name, {
+            "apiVersion": "v1",
+            "kind": "Service",
+            "metadata": {"name": name + "-service"},
+            "spec": {"selector": labels, "ports": [{"port": 80, "targetPort": 80}]},
+        }))
+
+    return objects
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+# ======================================================================================================================
+# Startup benchmark for fctl.
+#
+# Runs 'fctl --help' under 'python -X importtime' and fails when the CLI imports modules that must only be loaded by
+# the commands that use them, or when its startup time exceeds the budget.
+#
+# Usage:
+#   python benchmarks/startup.py [--runs N] [--budget SECONDS] [ARGS...]
+# ======================================================================================================================
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Tuple
+
+FCTL_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that are only needed by some commands and must never be imported at startup.
+LAZY_MODULES = ["docker", "kubernetes", "yaml"]
+
+def measure(args: List[str]) -> Tuple[float, Dict[str, int]]:
+    """ Runs fctl once. Returns the wall time in seconds and the cumulative import time (in us) of each module. """
+    start = time.perf_counter()
+    step = subprocess.run([sys.executable, "-X", "importtime", os.path.join(FCTL_DIR, "__main__.py")] + args,
+                          cwd=FCTL_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    elapsed = time.perf_counter() - start
+
+    if (step.returncode != 0):
+        raise RuntimeError("fctl exited with code " + str(step.returncode) + ".")
+
+    imports = {}
+    for line in step.stderr.splitlines():
+        if (not line.startswith("import time:") or "cumulative" in line):
+            continue
+
+        _, cumulative, name = line[len("import time:"):].split("|")
+        imports[name.strip()] = int(cumulative)
+
+    return elapsed, imports
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Measures and guards the startup time of fctl.")
+    parser.add_argument("--runs", type=int, default=5, help="Number of runs to take the median from.")
+    parser.add_argument("--budget", type=float, default=1.0, help="Maximum median startup time, in seconds.")
+    parser.add_argument("args", nargs="*", default=["--help"], help="Arguments passed to fctl.")
+    options = parser.parse_args()
+
+    timings = []
+    for _ in range(options.runs):
+        elapsed, imports = measure(options.args)
+        timings.append(elapsed)
+
+    median = statistics.median(timings)
+    print(f"fctl {' '.join(options.args)}: median {median * 1000:.0f} ms over {options.runs} runs.")
+
+    top_level = sorted(((cumulative, name) for name, cumulative in imports.items() if "." not in name), reverse=True)
+    for cumulative, name in top_level[:10]:
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+    failed = False
+
+    eager = [name for name in LAZY_MODULES if name in imports]
+    if (eager):
+        print("Imported at startup, but should be lazy: " + ", ".join(eager) + ".")
+        failed = True
+
+    if (median > options.budget):
+        print(f"Startup time exceeds the budget of {options.budget * 1000:.0f} ms.")
+        failed = True
+
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
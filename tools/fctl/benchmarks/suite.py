@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+
+# ======================================================================================================================
+# Benchmark suite for the hot paths of fctl.
+#
+# Runs every case against local stand-ins (see fakes.py), so no network, daemon or cluster is needed, and compares
+# the median time of each case with the baseline stored in 'baselines.json'. The run fails when a case is slower than
+# its baseline by more than the tolerance. Baselines are only compared when they were taken with the same parameters.
+#
+# Usage:
+#   python benchmarks/suite.py [--runs N] [--tolerance FRACTION] [--components N] [--latency SECONDS]
+#                              [--lines N] [--only CASE ...] [--save]
+# ======================================================================================================================
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, List, Tuple
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+FCTL_DIR = os.path.dirname(BENCHMARKS_DIR)
+BASELINES_PATH = os.path.join(BENCHMARKS_DIR, "baselines.json")
+
+sys.path.insert(0, FCTL_DIR)
+
+import fakes
+import startup
+
+# A case gets the options and a scratch directory, does its setup, and returns the function to time.
+Case = Callable[[argparse.Namespace, str], Callable[[], None]]
+CASES: Dict[str, Tuple[str, Case]] = {}
+
+def case(name: str, description: str) -> Callable[[Case], Case]:
+    def register(function: Case) -> Case:
+        CASES[name] = (description, function)
+        return function
+
+    return register
+
+@case("startup", "fctl --help, in a new interpreter")
+def startup_case(options: argparse.Namespace, scratch: str) -> Callable[[], None]:
+    return lambda: startup.measure(["--help"])
+
+@case("config-parse", "parsing a synthetic foundation.yml")
+def config_parse_case(options: argparse.Namespace, scratch: str) -> Callable[[], None]:
+    from lib.configuration import Configuration
+
+    path = os.path.join(scratch, "foundation.yml")
+    fakes.synthetic_configuration(path, options.components)
+    return lambda: Configuration.from_file(path)
+
+@case("config-snapshot", "loading a synthetic foundation.yml from its snapshot")
+def config_snapshot_case(options: argparse.Namespace, scratch: str) -> Callable[[], None]:
+    from lib.configuration import Configuration
+
+    path = os.path.join(scratch, "foundation.yml")
+    snapshot = os.path.join(scratch, "configuration.pickle")
+    fakes.synthetic_configuration(path, options.components)
+    Configuration.from_file(path, snapshot)
+    return lambda: Configuration.from_file(path, snapshot)
+
+@case("discovery", "probing the stub tools, without the probe cache")
+def discovery_case(options: argparse.Namespace, scratch: str) -> Callable[[], None]:
+    import lib.configuration
+    from lib.checks import Checks
+
+    configuration = load_synthetic(options, scratch)
+    lib.configuration.get_configuration = lambda: configuration
+    Checks.cache_path = os.path.join(scratch, "tools.json")
+
+    def run() -> None:
+        Checks._tools = {}
+        if (os.path.exists(Checks.cache_path)):
+            os.remove(Checks.cache_path)
+
+        tools = Checks.discover()
+        if (not all(found for found, _ in tools.values())):
+            raise RuntimeError("The stub tools were not found: " + json.dumps(tools))
+
+    return run
+
+@case("shell", "streaming the output of a stub build through Shell.execute")
+def shell_case(options: argparse.Namespace, scratch: str) -> Callable[[], None]:
+    from lib.shell import Shell
+
+    def run() -> None:
+        lines = []
+        code, _, _ = Shell.execute(["docker", "build", "."], env={"FCTL_STUB_LINES": str(options.lines * 10)},
+                                   on_output=lines.append)
+        if (code != 0 or len(lines) < options.lines * 10):
+            raise RuntimeError("The stub build failed.")
+
+    return run
+
+@case("build-schedule", "building and pushing every synthetic component with stub tools, 8 jobs")
+def build_schedule_case(options: argparse.Namespace, scratch: str) -> Callable[[], None]:
+    from lib.scheduler import BuildScheduler
+    from lib.shell import Shell
+
+    configuration = load_synthetic(options, scratch)
+
+    def step(*cmd: str) -> Callable:
+        def run(component, cancel: threading.Event) -> None:
+            code, _, error = Shell.execute(["docker"] + list(cmd) + [component.id], cancel=cancel, on_output=lambda _: None)
+            if (code != 0):
+                raise RuntimeError(error)
+
+        return run
+
+    scheduler = BuildScheduler(step("build", "-t"), step("push"), jobs=8, push_jobs=4)
+    return lambda: scheduler.run(configuration.components)
+
+@case("apply", "applying a Deployment and a Service per synthetic component to the fake Kubernetes API")
+def apply_case(options: argparse.Namespace, scratch: str) -> Callable[[], None]:
+    from kubernetes import client
+
+    from platforms.kubernetes.apply import ApplyEngine
+
+    server = fakes.FakeServer(fakes.KubernetesAPIHandler).__enter__()
+    api_configuration = client.Configuration()
+    api_configuration.host = server.url
+    engine = ApplyEngine(client.ApiClient(api_configuration), ["kubectl"], api="bench")
+    objects = fakes.manifests(options.components)
+
+    def run() -> None:
+        failures = [result for result in engine.apply_many(objects) if result.error is not None]
+        if (failures):
+            raise RuntimeError(str(failures[0].error) + " " + failures[0].error.output)
+
+    return run
+
+@case("push", "pushing an image per 10 synthetic components to the fake Docker API")
+def push_case(options: argparse.Namespace, scratch: str) -> Callable[[], None]:
+    import docker
+
+    from lib.push import ImagePusher
+
+    server = fakes.FakeServer(fakes.DockerAPIHandler).__enter__()
+    pusher = ImagePusher(docker.DockerClient(base_url=server.url.replace("http", "tcp"), version="1.43"), retries=0,
+                         on_progress=lambda tag, line: None)
+    tags = [f"registry.local/service{index:04d}:latest" for index in range(max(1, options.components // 10))]
+
+    return lambda: pusher.push_all(tags)
+
+def load_synthetic(options: argparse.Namespace, scratch: str):
+    from lib.configuration import Configuration
+
+    path = os.path.join(scratch, "foundation.yml")
+    if (not os.path.exists(path)):
+        fakes.synthetic_configuration(path, options.components)
+
+    return Configuration.from_file(path)
+
+def measure(function: Callable[[], None], runs: int) -> List[float]:
+    function()
+
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+
+    return timings
+
+def parameters(options: argparse.Namespace) -> dict:
+    return {"components": options.components, "latency": options.latency, "lines": options.lines}
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmarks the hot paths of fctl against local stand-ins.")
+    parser.add_argument("--runs", type=int, default=5, help="Number of timed runs of each case, after a warmup run.")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="Slowdown over the baseline that fails the run, as a fraction.")
+    parser.add_argument("--components", type=int, default=300, help="Number of components of the synthetic configuration.")
+    parser.add_argument("--latency", type=float, default=0.01, help="Seconds every stub tool invocation takes.")
+    parser.add_argument("--lines", type=int, default=100, help="Lines of output of every stub tool invocation.")
+    parser.add_argument("--only", nargs="+", choices=list(CASES.keys()), help="Cases to run. Defaults to all.")
+    parser.add_argument("--save", action="store_true", help="Stores the results as the new baselines.")
+    options = parser.parse_args()
+
+    try:
+        with open(BASELINES_PATH) as f:
+            baselines = json.load(f)
+    except (OSError, ValueError):
+        baselines = {}
+
+    scratch = tempfile.mkdtemp(prefix="fctl-bench-")
+    os.environ["PATH"] = fakes.install_stubs(os.path.join(scratch, "bin"))
+    os.environ["FCTL_STUB_LATENCY"] = str(options.latency)
+    os.environ["FCTL_STUB_LINES"] = str(options.lines)
+
+    failed = False
+    try:
+        for name in options.only or CASES.keys():
+            description, setup = CASES[name]
+            timings = measure(setup(options, scratch), options.runs)
+            median = statistics.median(timings)
+
+            baseline = baselines.get(name)
+            comparable = baseline is not None and baseline["parameters"] == parameters(options)
+            verdict = ""
+            if (comparable):
+                change = median / baseline["median"] - 1
+                verdict = f"{change:+7.1%} vs. baseline"
+                if (change > options.tolerance):
+                    verdict += "  REGRESSION"
+                    failed = True
+            elif (baseline is not None):
+                verdict = "baseline taken with other parameters"
+
+            print(f"{name:16} {median * 1000:10.1f} ms  (min {min(timings) * 1000:.1f} ms)  {verdict}")
+            print(f"{'':16} {description}")
+
+            if (options.save):
+                baselines[name] = {"median": median, "parameters": parameters(options)}
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    if (options.save):
+        with open(BASELINES_PATH, "w") as f:
+            json.dump(baselines, f, indent=2)
+            f.write("\n")
+
+        print("Saved the baselines to " + os.path.relpath(BASELINES_PATH) + ".")
+        return 0
+
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,153 @@
+import json
+import os
+from typing import Dict, List, Optional, Tuple
+
+from lib.directories import CACHE_DIR
+
+class Layer:
+    def __init__(self, id: str, size: Optional[int], created_by: str = "") -> None:
+        # Digest of the uncompressed layer content, which is the same in every image that shares the layer.
+        self.id: str = id
+        self.size: Optional[int] = size
+        self.created_by: str = created_by
+
+class ImageReport:
+    def __init__(self, component: str, tag: str, image_id: str, size: int, layers: List[Layer]) -> None:
+        self.component: str = component
+        self.tag: str = tag
+        self.image_id: str = image_id
+        self.size: int = size
+        self.layers: List[Layer] = layers
+
+        # Compared with the last pushed image of the component, if any.
+        self.previous: Optional[dict] = None
+
+    @property
+    def delta(self) -> Optional[int]:
+        return self.size - self.previous["size"] if self.previous is not None else None
+
+    def new_layers(self) -> List[Layer]:
+        """ Returns the layers that were not part of the last pushed image, which are the ones a push uploads. """
+        previous = set(self.previous["layers"]) if self.previous is not None else set()
+        return [layer for layer in self.layers if layer.id not in previous]
+
+    def to_dict(self) -> dict:
+        return {"image_id": self.image_id, "size": self.size, "layers": [layer.id for layer in self.layers]}
+
+class ImageAnalyzer:
+    """
+    Inspects built images through the Docker SDK: their size, their layers and the size each layer adds, taken from
+    the image history. History entries can't always be matched with layers, in which case layer sizes are unknown.
+    """
+
+    def __init__(self, client) -> None:
+        self.client = client
+
+    def analyze(self, component: str, tag: str) -> ImageReport:
+        """ Returns the report of an image. Raises docker.errors.APIError if it can't be inspected. """
+        image = self.client.api.inspect_image(tag)
+        history = list(reversed(self.client.api.history(tag)))
+        ids = image.get("RootFS", {}).get("Layers") or []
+
+        # Instructions that only change metadata have no layer, but show up in the history with no size.
+        entries = history if len(history) == len(ids) else [entry for entry in history if entry.get("Size")]
+        if (len(entries) != len(ids)):
+            entries = [{} for _ in ids]
+
+        layers = [Layer(id, entry.get("Size"), (entry.get("CreatedBy") or "").strip()) for id, entry in zip(ids, entries)]
+        return ImageReport(component, tag, image["Id"], image.get("Size", 0), layers)
+
+    @staticmethod
+    def shared(reports: List[ImageReport]) -> Dict[str, int]:
+        """ Returns how many of the images include each layer that appears in more than one of them. """
+        counts = {}
+        for report in reports:
+            for id in set(layer.id for layer in report.layers):
+                counts[id] = counts.get(id, 0) + 1
+
+        return {id: count for id, count in counts.items() if count > 1}
+
+class ImageHistory:
+    """ Remembers the analysis of the last image pushed for every component, to report size changes against it. """
+
+    def __init__(self, path: str = os.path.join(CACHE_DIR, "images.json")) -> None:
+        self.path = path
+        try:
+            with open(path) as f:
+                self.entries: Dict[str, dict] = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def get(self, component: str) -> Optional[dict]:
+        return self.entries.get(component)
+
+    def record(self, report: ImageReport) -> None:
+        self.entries[report.component] = report.to_dict()
+
+    def save(self) -> None:
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, "w") as f:
+                json.dump(self.entries, f)
+        except OSError:
+            pass
+
+def format_size(size: Optional[int], sign: bool = False) -> str:
+    """ Formats a size in bytes with SI units, as Docker does. """
+    if (size is None):
+        return "-"
+
+    prefix = ("+" if size > 0 else "-" if size < 0 else "±") if sign else ""
+    value = float(abs(size) if sign else size)
+    for unit in ["B", "kB", "MB", "GB"]:
+        if (value < 1000 or unit == "GB"):
+            return prefix + (f"{value:.0f}{unit}" if unit == "B" else f"{value:.1f}{unit}")
+        value /= 1000
+
+def over_budget(report: ImageReport, budget: Optional[int]) -> Optional[Tuple[str, str]]:
+    """ Returns the message and details (its largest layers) of an image over its size budget, or None if it isn't. """
+    if (budget is None or report.size <= budget):
+        return None
+
+    message = (f"The image of {report.component} is {format_size(report.size)}, over its budget of "
+               f"{format_size(budget)} by {format_size(report.size - budget)}.")
+    largest = sorted([layer for layer in report.layers if layer.size], key=lambda layer: -layer.size)[:5]
+    return message, message + "\n\nLargest layers:\n" + "\n".join(
+        f"{format_size(layer.size):>9}  {layer.created_by[:100]}" for layer in largest)
+
+def analysis_table(reports: List[ImageReport], budgets: Dict[str, Optional[int]]):
+    """ Returns a table with the size of every image, its change since the last push, and its shared layers. """
+    from rich.table import Table
+
+    shared = ImageAnalyzer.shared(reports)
+
+    table = Table(title="Images")
+    table.add_column("Component")
+    table.add_column("Size", justify="right")
+    table.add_column("Since push", justify="right")
+    table.add_column("Layers", justify="right")
+    table.add_column("New layers", justify="right")
+    table.add_column("Shared", justify="right")
+    table.add_column("Budget", justify="right")
+
+    for report in reports:
+        new = report.new_layers()
+        shared_layers = [layer for layer in report.layers if layer.id in shared]
+        shared_size = sum(layer.size or 0 for layer in shared_layers)
+
+        delta = report.delta
+        style = "red" if delta is not None and delta > 0 else "green" if delta is not None and delta < 0 else ""
+        budget = budgets.get(report.component)
+        over = budget is not None and report.size > budget
+
+        table.add_row(
+            report.component,
+            format_size(report.size),
+            f"[{style}]{format_size(delta, sign=True)}[/{style}]" if style else format_size(delta, sign=True),
+            str(len(report.layers)),
+            f"{len(new)} ({format_size(sum(layer.size or 0 for layer in new))})" if report.previous is not None else "-",
+            f"{len(shared_layers)} ({format_size(shared_size)})" if shared_layers else "-",
+            "-" if budget is None else (f"[red]{format_size(budget)}[/red]" if over else format_size(budget)),
+        )
+
+    return table
@@ -0,0 +1,134 @@
+import json
+import os
+import threading
+from typing import Callable, Dict, List, Optional
+
+from lib.builder import ImageBuilder
+from lib.component import Component
+from lib.directories import CACHE_DIR, ROOT_DIR
+from lib.scheduler import BuildError
+from lib.shell import Shell
+
+class BakeGroup:
+    def __init__(self, key: str, components: List[Component]) -> None:
+        self.key: str = key
+        self.components: List[Component] = components
+        self.baked: bool = False
+        self.error: Optional[BuildError] = None
+        self.digests: Dict[str, str] = {}
+        self.lock = threading.Lock()
+
+class BakeBuilder:
+    """
+    Builds the components that share a build context with a single 'docker buildx bake' invocation, from a generated
+    bake definition. BuildKit then loads the context once for all of them and builds the stages they share only once.
+    Components are only grouped with others that have exactly the same dependencies, so a group can be built as soon
+    as they are, and never alongside one of its own dependencies.
+
+    'build' is meant to be used as the build step of a BuildScheduler, with the groups of 'plan' as its units: the
+    first component of a group runs the bake for the whole group, and the others reuse its result, so results are
+    still reported per component.
+    """
+
+    def __init__(self, builder: ImageBuilder, tags: Dict[str, str], path: str = os.path.join(CACHE_DIR, "bake"),
+                 on_output: Callable[[str], None] = None) -> None:
+        self.builder = builder
+        self.tags = tags
+        self.path = path
+        self.on_output = on_output
+        self.groups: Dict[str, BakeGroup] = {}
+
+    def plan(self, components: List[Component]) -> List[BakeGroup]:
+        """ Groups the components by build context and by the dependencies they have among the components. """
+        ids = set(component.id for component in components)
+
+        groups: Dict[str, BakeGroup] = {}
+        for component in components:
+            dependencies = sorted(id for id in component.depends_on if id in ids)
+            key = f"{os.path.normpath(component.build.context)}@{','.join(dependencies)}"
+            groups.setdefault(key, BakeGroup(key, [])).components.append(component)
+
+        for group in groups.values():
+            for component in group.components:
+                self.groups[component.id] = group
+
+        return list(groups.values())
+
+    def definition(self, group: BakeGroup) -> dict:
+        """ Returns the bake definition building every component of the group, loading the images into Docker. """
+        targets = {}
+        for component in group.components:
+            tag = self.tags[component.id]
+            target = {
+                "context": os.path.join(ROOT_DIR, component.build.context),
+                "dockerfile": component.build.dockerfile,
+                "tags": [tag],
+                "output": ["type=docker"],
+            }
+
+            if (component.build.target is not None):
+                target["target"] = component.build.target
+            if (component.build.args):
+                target["args"] = dict(component.build.args)
+
+            cache_from = self.builder.cache_from(component, tag)
+            cache_to = self.builder.cache_to(component)
+            if (cache_from):
+                target["cache-from"] = cache_from
+            if (cache_to):
+                target["cache-to"] = cache_to
+
+            targets[component.id] = target
+
+        return {"group": {"default": {"targets": list(targets.keys())}}, "target": targets}
+
+    def build(self, component: Component, cancel: threading.Event) -> None:
+        """ Builds the group of the component, unless another of its components already did. """
+        group = self.groups[component.id]
+
+        with group.lock:
+            if (not group.baked):
+                try:
+                    self._bake(group, cancel)
+                except Exception as error:
+                    group.error = error if isinstance(error, BuildError) else BuildError(str(error))
+                finally:
+                    group.baked = True
+
+        if (group.error is not None):
+            raise BuildError("Failed to build " + component.id + ".", group.error.output)
+
+    def _bake(self, group: BakeGroup, cancel: threading.Event) -> None:
+        name = group.components[0].id
+        os.makedirs(self.path, exist_ok=True)
+        definition = os.path.join(self.path, name + ".json")
+        metadata = os.path.join(self.path, name + ".metadata.json")
+
+        with open(definition, "w") as f:
+            json.dump(self.definition(group), f, indent=2)
+
+        if (os.path.exists(metadata)):
+            os.remove(metadata)
+
+        cmd = ["docker", "buildx", "bake", "-f", definition, "--progress", "plain", "--metadata-file", metadata]
+        if (self.builder.builder is not None):
+            cmd += ["--builder", self.builder.builder]
+
+        code, _, error = Shell.execute(cmd, cwd=ROOT_DIR, cancel=cancel, on_output=self.on_output)
+        if (code != 0):
+            raise BuildError("Failed to build " + ", ".join(c.id for c in group.components) + ".", error)
+
+        try:
+            with open(metadata) as f:
+                results = json.load(f)
+        except (OSError, ValueError):
+            results = {}
+
+        for component in group.components:
+            digest = results.get(component.id, {}).get("containerimage.digest")
+            if (digest is not None):
+                group.digests[component.id] = digest
+
+    def digest(self, component: Component) -> Optional[str]:
+        group = self.groups.get(component.id)
+        return group.digests.get(component.id) if group is not None else None
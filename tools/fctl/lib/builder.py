@@ -0,0 +1,131 @@
+import os
+from typing import Dict, List, Optional
+
+from lib.component import Component
+from lib.configuration import Configuration
+from lib.directories import CACHE_DIR, ROOT_DIR
+from lib.shell import Shell
+
+class ImageBuilder:
+    """
+    Builds the command lines that build the image of each component. When buildx is available, images are built by
+    BuildKit, which imports and exports the layer caches set in 'cache_from' and 'cache_to', so layers are reused
+    across runners and branches. Otherwise the classic builder is used, which can only use images as cache sources.
+
+    Cache settings can be 'registry' (a 'buildcache' tag next to the image in the configured registry), 'local' (a
+    directory under .fctl), 'inline' (cache metadata embedded in the image itself), or a raw buildx cache value.
+    """
+
+    # Builder created to export caches when none is configured, since the default 'docker' driver can't export them.
+    builder_name: str = "fctl"
+
+    def __init__(self, configuration: Configuration, buildx: bool) -> None:
+        self.configuration = configuration
+        self.buildx = buildx
+        self.builder: Optional[str] = configuration.settings["builder"]
+
+    def tag(self, component: Component, username: Optional[str]) -> str:
+        """ Returns the tag the image of the component is built as: in the configured registry, or under 'username' if any. """
+        registry = self.configuration.settings["registry"]
+        namespace = registry or username
+        return f"{namespace}/{component.id}" if namespace else component.id
+
+    def cache_ref(self, component: Component) -> Optional[str]:
+        registry = self.configuration.settings["registry"]
+        return f"{registry}/{component.id}:buildcache" if registry else None
+
+    def cache_dir(self, component: Component) -> str:
+        return os.path.join(CACHE_DIR, "buildx", component.id)
+
+    def cache_from(self, component: Component, tag: str) -> List[str]:
+        sources = []
+        for cache in component.build.cache_from:
+            if (cache == "registry"):
+                ref = self.cache_ref(component)
+                if (ref is not None):
+                    sources.append(f"type=registry,ref={ref}" if self.buildx else ref)
+            elif (cache == "local"):
+                # BuildKit only warns when a local cache was never exported.
+                if (self.buildx):
+                    sources.append(f"type=local,src={self.cache_dir(component)}")
+            elif (cache == "inline"):
+                sources.append(f"type=registry,ref={tag}" if self.buildx else tag)
+            elif (self.buildx or "=" not in cache):
+                sources.append(cache)
+
+        return sources
+
+    def cache_to(self, component: Component) -> List[str]:
+        destinations = []
+        for cache in component.build.cache_to:
+            if (cache == "registry"):
+                ref = self.cache_ref(component)
+                if (ref is not None):
+                    destinations.append(f"type=registry,ref={ref},mode=max")
+            elif (cache == "local"):
+                destinations.append(f"type=local,dest={self.cache_dir(component)},mode=max")
+            elif (cache == "inline"):
+                destinations.append("type=inline")
+            else:
+                destinations.append(cache)
+
+        return destinations
+
+    def exports_cache(self, components: List[Component]) -> bool:
+        """ Returns whether any of the components exports a cache that the default 'docker' driver can't write. """
+        return self.buildx and any(cache != "type=inline" for component in components
+                                   for cache in self.cache_to(component))
+
+    def prepare(self, components: List[Component]) -> None:
+        """
+        Makes sure a builder able to export the caches of the components exists, creating a 'docker-container'
+        builder when none is configured. Raises RuntimeError if it can't be created.
+        """
+        if (self.builder is not None or not self.exports_cache(components)):
+            return
+
+        code, _, _ = Shell.execute(["docker", "buildx", "inspect", self.builder_name], cwd=ROOT_DIR)
+        if (code != 0):
+            code, _, error = Shell.execute(["docker", "buildx", "create", "--name", self.builder_name,
+                                            "--driver", "docker-container"], cwd=ROOT_DIR)
+            if (code != 0):
+                raise RuntimeError("Failed to create the '" + self.builder_name + "' builder.\n" + error)
+
+        self.builder = self.builder_name
+
+    def digest_args(self, component: Component) -> Dict[str, str]:
+        """ Returns the build settings that change the built image, to be hashed with its context. """
+        args = dict(component.build.args)
+        if (component.build.target is not None):
+            args["--target"] = component.build.target
+
+        return args
+
+    def command(self, component: Component, tag: str) -> List[str]:
+        """ Returns the command building the image of the component as 'tag', from its build context. """
+        if (self.buildx):
+            cmd = ["docker", "buildx", "build", "--load"]
+            if (self.builder is not None):
+                cmd += ["--builder", self.builder]
+        else:
+            cmd = ["docker", "build"]
+
+        cmd += [".", "-f", component.build.dockerfile, "-t", tag]
+
+        if (component.build.target is not None):
+            cmd += ["--target", component.build.target]
+
+        for key, value in component.build.args.items():
+            cmd += ["--build-arg", f"{key}={value}"]
+
+        for cache in self.cache_from(component, tag):
+            cmd += ["--cache-from", cache]
+
+        if (self.buildx):
+            for cache in self.cache_to(component):
+                cmd += ["--cache-to", cache]
+        elif ("inline" in component.build.cache_to):
+            # The classic builder only supports inline caches, enabled through a build argument.
+            cmd += ["--build-arg", "BUILDKIT_INLINE_CACHE=1"]
+
+        return cmd
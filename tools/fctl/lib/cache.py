@@ -0,0 +1,369 @@
+import hashlib
+import json
+import os
+import posixpath
+import re
+from typing import Dict, List, Optional, Pattern, Tuple
+
+from lib.directories import CACHE_DIR
+
+class DockerIgnore:
+    """ Matches paths relative to a build context against the patterns of a .dockerignore file. """
+
+    def __init__(self, patterns: List[str]) -> None:
+        self.rules: List[Tuple[bool, Pattern]] = []
+
+        for pattern in patterns:
+            pattern = pattern.strip()
+            if (not pattern or pattern.startswith("#")):
+                continue
+
+            negated = pattern.startswith("!")
+            if (negated):
+                pattern = pattern[1:].strip()
+
+            pattern = os.path.normpath(pattern).replace(os.sep, "/").lstrip("/")
+            if (pattern == "."):
+                continue
+
+            self.rules.append((negated, DockerIgnore._compile(pattern)))
+
+        self.has_exceptions = any(negated for negated, _ in self.rules)
+
+    @staticmethod
+    def from_context(context: str, dockerfile: str) -> "DockerIgnore":
+        """ Loads the ignore file used by Docker: '<dockerfile>.dockerignore' if present, otherwise '.dockerignore'. """
+        for candidate in [os.path.join(context, dockerfile + ".dockerignore"), os.path.join(context, ".dockerignore")]:
+            if (os.path.isfile(candidate)):
+                with open(candidate) as f:
+                    return DockerIgnore(f.read().splitlines())
+
+        return DockerIgnore([])
+
+    def is_excluded(self, path: str) -> bool:
+        excluded = False
+        for negated, regex in self.rules:
+            if (regex.match(path)):
+                excluded = not negated
+
+        return excluded
+
+    @staticmethod
+    def _compile(pattern: str) -> Pattern:
+        regex = ""
+        i = 0
+
+        while i < len(pattern):
+            char = pattern[i]
+
+            if (pattern.startswith("**", i)):
+                i += 2
+                if (pattern.startswith("/", i)):
+                    i += 1
+                    regex += "(?:.*/)?"
+                else:
+                    regex += ".*"
+                continue
+
+            if (char == "*"):
+                regex += "[^/]*"
+            elif (char == "?"):
+                regex += "[^/]"
+            elif (char == "[" and "]" in pattern[i + 1:]):
+                end = pattern.index("]", i + 1)
+                regex += "[" + pattern[i + 1:end].replace("\\", "\\\\") + "]"
+                i = end
+            else:
+                regex += re.escape(char)
+
+            i += 1
+
+        # A pattern matching a directory also excludes everything inside it.
+        return re.compile("^" + regex + "(?:/.*)?$")
+
+class DockerfileInputs:
+    """
+    Finds the paths of a build context that a Dockerfile reads: the sources of its COPY and ADD instructions and of
+    its bind mounts. Sources are relative to the context, where Docker clamps leading '..' to the context root.
+    """
+
+    # Flags of COPY and ADD, which come before the sources.
+    flag = re.compile(r"^--[a-z-]+(=.*)?$")
+
+    @staticmethod
+    def parse(path: str) -> Optional[List[str]]:
+        """
+        Returns the sources read by the Dockerfile at 'path', which may be glob patterns. Returns None when they can't
+        be known, such as when they use variables, meaning that the whole context may be read.
+        """
+        try:
+            with open(path) as f:
+                lines = f.read().splitlines()
+        except OSError:
+            return None
+
+        sources = []
+        for instruction in DockerfileInputs._instructions(lines):
+            parts = instruction.split(None, 1)
+            keyword = parts[0].upper()
+            arguments = parts[1] if len(parts) > 1 else ""
+
+            if (keyword in ["COPY", "ADD"]):
+                found = DockerfileInputs._copy_sources(arguments)
+            elif (keyword == "RUN" and "--mount=" in arguments):
+                found = DockerfileInputs._mount_sources(arguments)
+            else:
+                continue
+
+            if (found is None):
+                return None
+            sources += found
+
+        return list(dict.fromkeys(sources))
+
+    @staticmethod
+    def _instructions(lines: List[str]) -> List[str]:
+        """ Joins continued lines, and drops comments and heredoc bodies. """
+        instructions = []
+        current = ""
+        heredoc = None
+
+        for line in lines:
+            if (heredoc is not None):
+                if (line.strip() == heredoc):
+                    heredoc = None
+                continue
+
+            if (not current and (not line.strip() or line.lstrip().startswith("#"))):
+                continue
+
+            if (line.rstrip().endswith("\\")):
+                current += line.rstrip()[:-1] + " "
+                continue
+
+            current += line
+            match = re.search(r"<<-?[\"']?([A-Za-z0-9_]+)", current)
+            if (match is not None):
+                heredoc = match.group(1)
+
+            instructions.append(current.strip())
+            current = ""
+
+        if (current.strip()):
+            instructions.append(current.strip())
+
+        return instructions
+
+    @staticmethod
+    def _copy_sources(arguments: str) -> Optional[List[str]]:
+        if (arguments.lstrip().startswith("[")):
+            try:
+                words = json.loads(arguments)
+            except ValueError:
+                return None
+        else:
+            words = arguments.split()
+
+        flags = [word for word in words if DockerfileInputs.flag.match(word)]
+        words = [word for word in words if not DockerfileInputs.flag.match(word)]
+
+        # Copies from other stages or images don't read the context.
+        if (any(flag.startswith("--from=") for flag in flags)):
+            return []
+
+        sources = []
+        for source in words[:-1]:
+            if (source.startswith("<<") or re.match(r"^[a-z]+://", source) or source.startswith("git@")):
+                continue
+
+            if ("$" in source):
+                return None
+
+            sources.append(DockerfileInputs._normalize(source))
+
+        return sources
+
+    @staticmethod
+    def _mount_sources(arguments: str) -> Optional[List[str]]:
+        sources = []
+        for mount in re.findall(r"--mount=(\S+)", arguments):
+            options = dict(option.split("=", 1) if "=" in option else (option, "") for option in mount.split(","))
+            if (options.get("type", "bind") != "bind" or "from" in options):
+                continue
+
+            source = options.get("source", options.get("src", "."))
+            if ("$" in source):
+                return None
+
+            sources.append(DockerfileInputs._normalize(source))
+
+        return sources
+
+    @staticmethod
+    def _normalize(source: str) -> str:
+        return posixpath.normpath("/" + source).lstrip("/")
+
+class BuildCache:
+    """
+    Remembers the content hash of every image built by fctl, so components whose inputs, Dockerfile and build
+    arguments did not change since their last successful build (and push) can be skipped. Inputs are the files of the
+    build context that the Dockerfile reads, so a change to one service doesn't invalidate the others sharing its
+    context. Dockerfiles whose sources can't be known, e.g. because they use variables, hash the whole context.
+    """
+
+    version: int = 2
+
+    def __init__(self, path: str = os.path.join(CACHE_DIR, "build-cache.json")) -> None:
+        self.path = path
+        self.entries: Dict[str, dict] = {}
+
+        # Per-file digests keyed by path, reused while the file size and modification time stay the same.
+        self.files: Dict[str, list] = {}
+
+        self.load()
+
+    def load(self) -> None:
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+
+        if (data.get("version") != self.version):
+            return
+
+        self.entries = data.get("entries", {})
+        self.files = data.get("files", {})
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+        temporary = self.path + ".tmp"
+        with open(temporary, "w") as f:
+            json.dump({"version": self.version, "entries": self.entries, "files": self.files}, f)
+
+        os.replace(temporary, self.path)
+
+    def inputs(self, context: str, dockerfile: str) -> Optional[List[str]]:
+        """
+        Returns the paths of the context that the build reads, relative to it, or None when the whole context may be.
+        Several components usually share a context, and each only reads its own part of it.
+        """
+        sources = DockerfileInputs.parse(os.path.join(context, dockerfile))
+        if (sources is None or "" in sources):
+            return None
+
+        return sources
+
+    def input_roots(self, context: str, dockerfile: str) -> List[str]:
+        """
+        Returns the paths of the context under which every file the build reads lives, relative to it: the fixed
+        part of each source and the Dockerfile. Returns [""], the whole context, when the sources can't be known.
+        """
+        sources = self.inputs(context, dockerfile)
+        if (sources is None):
+            return [""]
+
+        return list(dict.fromkeys(["/".join(BuildCache._prefix(source)) for source in sources]
+                                  + [DockerfileInputs._normalize(dockerfile)]))
+
+    def digest(self, context: str, dockerfile: str, args: Optional[Dict[str, str]] = None) -> str:
+        """
+        Hashes the files of the context that the build reads and that are sent to the Docker daemon, plus the
+        Dockerfile and the build arguments.
+        """
+        ignore = DockerIgnore.from_context(context, dockerfile)
+        digest = hashlib.sha256()
+
+        for relative in self._walk(context, ignore, self.inputs(context, dockerfile)):
+            digest.update(relative.encode() + b"\0")
+            digest.update(self._file_digest(os.path.join(context, relative)).encode() + b"\0")
+
+        # The Dockerfile is always sent, even when it is excluded or lives outside of the context.
+        digest.update(b"dockerfile\0" + self._file_digest(os.path.join(context, dockerfile)).encode() + b"\0")
+        digest.update(json.dumps(args or {}, sort_keys=True).encode())
+
+        return digest.hexdigest()
+
+    def is_fresh(self, key: str, digest: str, tag: str, push: bool) -> bool:
+        """ Returns whether the image for 'key' was already built from 'digest' as 'tag' (and pushed, if required). """
+        entry = self.entries.get(key)
+        if (entry is None):
+            return False
+
+        return entry["digest"] == digest and entry["tag"] == tag and (entry["pushed"] or not push)
+
+    def record(self, key: str, digest: str, tag: str, pushed: bool) -> None:
+        self.entries[key] = {"digest": digest, "tag": tag, "pushed": pushed}
+
+    def _walk(self, context: str, ignore: DockerIgnore, sources: Optional[List[str]] = None) -> List[str]:
+        if (sources is None):
+            return self._walk_directory(context, context, ignore)
+
+        # Only the part of the context under the fixed prefix of each source is walked.
+        files = set()
+        for source in sources:
+            pattern = DockerIgnore._compile(source)
+            prefix = BuildCache._prefix(source)
+
+            start = os.path.join(context, *prefix)
+            if (os.path.isfile(start)):
+                candidates = ["/".join(prefix)]
+            elif (os.path.isdir(start)):
+                candidates = self._walk_directory(context, start, ignore)
+            else:
+                continue
+
+            files.update(relative for relative in candidates if pattern.match(relative) and not ignore.is_excluded(relative))
+
+        return sorted(files)
+
+    @staticmethod
+    def _prefix(source: str) -> List[str]:
+        """ Returns the parts of a source before its first wildcard. """
+        prefix = []
+        for part in source.split("/"):
+            if (re.search(r"[*?\[]", part)):
+                break
+            prefix.append(part)
+
+        return prefix
+
+    def _walk_directory(self, context: str, directory: str, ignore: DockerIgnore) -> List[str]:
+        files = []
+
+        for root, directories, names in os.walk(directory):
+            relative_root = os.path.relpath(root, context).replace(os.sep, "/")
+            prefix = "" if relative_root == "." else relative_root + "/"
+
+            # fctl's own cache is never part of an image, but would otherwise change the hash of every build.
+            directories[:] = [d for d in directories if os.path.join(os.path.abspath(root), d) != CACHE_DIR]
+
+            # Excluded directories can only be skipped entirely when no '!' pattern may re-include their content.
+            if (not ignore.has_exceptions):
+                directories[:] = [d for d in directories if not ignore.is_excluded(prefix + d)]
+
+            for name in names:
+                relative = prefix + name
+                if (not ignore.is_excluded(relative)):
+                    files.append(relative)
+
+        return sorted(files)
+
+    def _file_digest(self, path: str) -> str:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return ""
+
+        cached = self.files.get(path)
+        if (cached is not None and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns):
+            return cached[2]
+
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+
+        self.files[path] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+        return self.files[path][2]
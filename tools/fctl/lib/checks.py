@@ -1,54 +1,171 @@
-from typing import List, Tuple
+import json
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
 
-from lib.directories import ROOT_DIR
-from lib.shell import Shell
+from lib.directories import CACHE_DIR, ROOT_DIR
+from lib.shell import Shell, ShellTimeoutError
 
 class Checks:
+    cache_path: str = os.path.join(CACHE_DIR, "tools.json")
+
+    # Seconds a version probe may take before the tool is considered broken.
+    probe_timeout: float = 10
+
+    # Tools that can be probed, in the order they are reported.
+    tools: List[str] = ["docker", "docker_compose", "buildx", "kubectl"]
+
+    _tools: Dict[str, Tuple[bool, List[str]]] = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def discover(tools: Optional[List[str]] = None) -> Dict[str, Tuple[bool, List[str]]]:
+        """
+        Probes the given tools (all of them by default) concurrently, each at most once per invocation, so a command
+        only waits for the tools it uses. Successful probes are cached on disk by binary path and modification time,
+        so later invocations don't need to run them again.
+        """
+        tools = tools or Checks.tools
+
+        with Checks._lock:
+            missing = [tool for tool in tools if tool not in Checks._tools]
+            if (missing):
+                cache = Checks._load_cache()
+                known = dict(cache)
+
+                if (len(missing) == 1):
+                    Checks._tools[missing[0]] = Checks._find(missing[0], cache)
+                else:
+                    with ThreadPoolExecutor(max_workers=len(missing), thread_name_prefix="fctl-checks") as pool:
+                        futures = {tool: pool.submit(Checks._find, tool, cache) for tool in missing}
+                        Checks._tools.update({tool: future.result() for tool, future in futures.items()})
+
+                if (cache != known):
+                    Checks._save_cache(cache)
+
+            return {tool: Checks._tools[tool] for tool in tools}
+
+    @staticmethod
+    def _find(tool: str, cache: Dict[str, dict]) -> Tuple[bool, List[str]]:
+        if (tool == "docker"):
+            return Checks._find_docker()
+        if (tool == "docker_compose"):
+            return Checks._find_docker_compose(cache)
+        if (tool == "buildx"):
+            return Checks._find_buildx(cache)
+
+        # The kubectl command is configurable, so foundation.yml is only loaded when kubectl is needed.
+        from lib.configuration import get_configuration
+        return Checks._find_kubectl(get_configuration().settings["kubectl_command"], cache)
+
     @staticmethod
     def get_docker() -> Tuple[bool, List[str]]:
         """ Checks if Docker is installed. Returns a bool indicating if it's installed and the command to use it."""
-        import shutil
-
-        path = shutil.which("docker")
-        if (path):
-            return True, ["docker"]
-        else:
-            return False, []
+        return Checks.discover(["docker"])["docker"]
 
     @staticmethod
     def get_docker_compose() -> Tuple[bool, List[str]]:
         """ Checks if Docker Compose is installed. Returns a bool indicating if it's installed and the command to use it."""
-        import shutil
+        return Checks.discover(["docker_compose"])["docker_compose"]
+
+    @staticmethod
+    def get_buildx() -> Tuple[bool, List[str]]:
+        """ Checks if the buildx plugin is installed. Returns a bool indicating if it's installed and the command to use it."""
+        return Checks.discover(["buildx"])["buildx"]
+
+    @staticmethod
+    def get_kubernetes() -> Tuple[bool, List[str]]:
+        """ Checks if the configured kubectl command is installed. Returns a bool indicating if it's installed and the command to use it."""
+        return Checks.discover(["kubectl"])["kubectl"]
+
+    @staticmethod
+    def check_kubernetes(cmd: List[str]) -> Tuple[bool, List[str]]:
+        """ Checks if Kubectl is installed. Returns a bool indicating if it's installed and the command to use it."""
+        cache = Checks._load_cache()
+        known = dict(cache)
+
+        result = Checks._find_kubectl(cmd, cache)
+        if (cache != known):
+            Checks._save_cache(cache)
+
+        return result
+
+    @staticmethod
+    def _find_docker() -> Tuple[bool, List[str]]:
+        if (shutil.which("docker")):
+            return True, ["docker"]
 
+        return False, []
+
+    @staticmethod
+    def _find_docker_compose(cache: Dict[str, dict]) -> Tuple[bool, List[str]]:
         # First check for an older docker-compose command.
-        path = shutil.which("docker-compose")
-        if (path):
+        if (shutil.which("docker-compose")):
             return True, ["docker-compose"]
-        
-        docker_exists, _ = Checks.get_docker()
-        if (not docker_exists):
-            return False, []
 
         # Then, check for the newer docker compose command.
-        try:
-            code, _, _ = Shell.execute(["docker", "compose", "version"], cwd=ROOT_DIR)
-            if (code == 0):
-                return True, ["docker", "compose"]
-        except Exception:
-            pass
+        if (Checks._probe(["docker", "compose", "version"], cache)):
+            return True, ["docker", "compose"]
 
         return False, []
-    
+
     @staticmethod
-    def check_kubernetes(cmd: List[str]) -> Tuple[bool, List[str]]:
-        """ Checks if Kubectl is installed. Returns a bool indicating if it's installed and the command to use it."""
+    def _find_buildx(cache: Dict[str, dict]) -> Tuple[bool, List[str]]:
+        if (Checks._probe(["docker", "buildx", "version"], cache)):
+            return True, ["docker", "buildx"]
+
+        return False, []
+
+    @staticmethod
+    def _find_kubectl(cmd: List[str], cache: Dict[str, dict]) -> Tuple[bool, List[str]]:
+        # Only the client version is requested, so the probe doesn't depend on the cluster being reachable.
+        if (Checks._probe(cmd + ["version", "--client"], cache)):
+            return True, cmd
+
+        return False, []
+
+    @staticmethod
+    def _probe(cmd: List[str], cache: Dict[str, dict]) -> bool:
+        """ Returns whether the command exits successfully, reusing a cached success while the binary is unchanged. """
+        binary = shutil.which(cmd[0])
+        if (not binary):
+            return False
+
+        key = " ".join(cmd)
+        mtime = os.stat(binary).st_mtime_ns
+
+        entry = cache.get(key)
+        if (entry is not None and entry["path"] == binary and entry["mtime"] == mtime):
+            return True
+
         try:
-            code, _, _ = Shell.execute(cmd + ["version"], cwd=ROOT_DIR)
-            if (code == 0):
-                return True, cmd
-            else:
-                return False, []
-        except Exception:
-            pass
+            code, _, _ = Shell.execute(cmd, cwd=ROOT_DIR, timeout=Checks.probe_timeout)
+        except (OSError, ShellTimeoutError):
+            return False
+
+        # Failures are not cached, so installing a missing plugin is picked up on the next run.
+        if (code != 0):
+            cache.pop(key, None)
+            return False
 
-        return False, []
\ No newline at end of file
+        cache[key] = {"path": binary, "mtime": mtime}
+        return True
+
+    @staticmethod
+    def _load_cache() -> Dict[str, dict]:
+        try:
+            with open(Checks.cache_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    @staticmethod
+    def _save_cache(cache: Dict[str, dict]) -> None:
+        try:
+            os.makedirs(os.path.dirname(Checks.cache_path), exist_ok=True)
+            with open(Checks.cache_path, "w") as f:
+                json.dump(cache, f)
+        except OSError:
+            pass
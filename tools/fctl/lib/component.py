@@ -1,29 +1,61 @@
+from dataclasses import dataclass, field
+from typing import ClassVar, Dict, List, Optional
+
+@dataclass(slots=True)
 class ComponentPlatformBuildSettings:
-    def __init__(self, build_on_compose: bool, build_on_kubernetes: bool, push_on_compose: bool, push_on_kubernetes: bool) -> None:
-        self.build_on_compose: bool = build_on_compose
-        self.build_on_kubernetes: bool = build_on_kubernetes
-        self.push_on_compose: bool = push_on_compose
-        self.push_on_kubernetes: bool = push_on_kubernetes
+    build_on_compose: bool
+    build_on_kubernetes: bool
+    push_on_compose: bool
+    push_on_kubernetes: bool
 
+@dataclass(slots=True)
 class ComponentBuildSettings:
-    def __init__(self, context: str, dockerfile: str, platforms: ComponentPlatformBuildSettings) -> None:
-        self.context: str = context
-        self.dockerfile: str = dockerfile
-        self.platforms: ComponentPlatformBuildSettings = platforms
+    context: str
+    dockerfile: str
+    platforms: ComponentPlatformBuildSettings
+    target: Optional[str] = None
+    args: Dict[str, str] = field(default_factory=dict)
+
+    # BuildKit cache sources and destinations: 'registry', 'local', 'inline', or a raw '--cache-from'/'--cache-to' value.
+    cache_from: List[str] = field(default_factory=list)
+    cache_to: List[str] = field(default_factory=list)
 
+@dataclass(slots=True)
+class ComponentPort:
+    expose: int
+    container_port: int
+
+@dataclass(slots=True, eq=False)
 class Component:
-    types: list = ["database", "microservice", "application"]
+    types: ClassVar[list] = ["database", "microservice", "application"]
+
+    id: str
+    name: str
+    type: str
+    path: str
+    build: ComponentBuildSettings
+    depends_on: List[str] = field(default_factory=list)
+    replicas: int = 1
+    ports: List[ComponentPort] = field(default_factory=list)
+    image: Optional[str] = None
+
+    # Registries the image is pushed to besides the configured 'registry'.
+    registries: List[str] = field(default_factory=list)
+
+    # Seconds 'up --wait' waits for the component to be ready, overriding '--timeout'.
+    ready_timeout: Optional[int] = None
+
+    # Largest size of the image in bytes. Builds of larger images fail before they are pushed.
+    size_budget: Optional[int] = None
 
-    def __init__(self, id: str, name: str, type: str, path: str, build: ComponentBuildSettings):
-        self.id = id
-        self.name = name
-        self.path = path
-        self.build = build
+    def __post_init__(self) -> None:
+        if (self.type not in self.types):
+            raise ValueError("Invalid component type '" + self.type + "'.")
 
-        if (type not in self.types):
-            raise ValueError("Invalid component type '" + type + "'.")
-        
-        self.type = type
+    @property
+    def service_name(self) -> str:
+        """ Name of the Compose service and of the Kubernetes Service of this component. """
+        return self.name + ("-app-service" if self.type == "application" else "-service")
 
     def __str__(self) -> str:
-        return self.id
\ No newline at end of file
+        return self.id
@@ -1,78 +1,490 @@
-from typing import List
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple, Union
+import hashlib
 import os
-import yaml
-from yaml.loader import SafeLoader
+import pickle
+import re
 
-from lib.component import Component, ComponentBuildSettings, ComponentPlatformBuildSettings
-from lib.directories import ROOT_DIR
+from lib.component import Component, ComponentBuildSettings, ComponentPlatformBuildSettings, ComponentPort
+from lib.directories import CACHE_DIR, ROOT_DIR
+
+Location = Tuple[Union[str, int], ...]
+
+class ConfigurationError(ValueError):
+    """ Raised when foundation.yml doesn't match the expected schema. Points at the offending entry. """
+
+    def __init__(self, message: str, location: Location = (), file: str = None, line: int = None) -> None:
+        self.message = message
+        self.location = location
+        self.file = file
+        self.line = line
+        super().__init__(str(self))
+
+    def __str__(self) -> str:
+        where = ConfigurationError.format_location(self.location)
+        prefix = ""
+        if (self.file is not None):
+            prefix = self.file + (f":{self.line}" if self.line is not None else "") + ": "
+
+        return prefix + (where + ": " if where else "") + self.message
+
+    @staticmethod
+    def format_location(location: Location) -> str:
+        text = ""
+        for part in location:
+            text += f"[{part}]" if isinstance(part, int) else ("." if text else "") + part
+
+        return text
 
 class Configuration:
+    # Files whose changes invalidate snapshots, since they define the shape of the pickled model.
+    model_files: list = [os.path.abspath(__file__), os.path.join(os.path.dirname(os.path.abspath(__file__)), "component.py")]
+
+    # Fields of a component that an environment can override.
+    overridable: list = ["replicas", "registries", "ready_timeout", "image"]
+
+    # Overridable fields that only reach the cluster through rendered manifests, since hand-written ones set their own.
+    rendered_only: list = ["replicas", "image"]
+
     def __init__(self):
         self.api: str = ""
+        self.environment: Optional[str] = None
+        self.environments: List[str] = []
+
+        # Fields overridden by the environment, by component id.
+        self.overrides: Dict[str, List[str]] = {}
         self.settings = {
             "kubectl_command": ["kubectl"],
             "registry": None,
-            "secrets_file": "./secrets.yml"
+            "image_namespace": None,
+            "secrets_file": "./secrets.yml",
+            "builder": None,
+            "credentials_file": None,
+            "login_ttl": 43200,
+            "context": None,
+            "namespace": None,
         }
         self.components: List[Component] = []
+        self.tiers: List[List[Component]] = []
+
+        # Indexes of every component declared in the file, including the ones missing from 'order'.
+        self.by_id: Dict[str, Component] = {}
+        self.by_key: Dict[Tuple[str, str], Component] = {}
+
+    def get(self, name: str, type: str) -> Optional[Component]:
+        return self.by_key.get((name, type))
 
-    def load_from_file(self, path: str):
+    def get_by_id(self, id: str) -> Optional[Component]:
+        return self.by_id.get(id)
+
+    def find(self, reference: str) -> List[Component]:
+        """ Returns the components matching an id, a service name, or a name of any type. """
+        if (reference in self.by_id):
+            return [self.by_id[reference]]
+
+        return [component for component in self.components
+                if reference in [component.name, component.service_name]]
+
+    def dependencies(self, component: Component) -> List[Component]:
+        """ Returns what a component needs to run: its 'depends_on' if it has any, or else the tier before its own. """
+        if (component.depends_on):
+            return [self.by_id[id] for id in component.depends_on]
+
+        for index, tier in enumerate(self.tiers):
+            if (component in tier):
+                return list(self.tiers[index - 1]) if index > 0 else []
+
+        return []
+
+    def dependents(self, component: Component) -> List[Component]:
+        return [other for other in self.by_id.values() if component in self.dependencies(other)]
+
+    def closure(self, components: List[Component], dependencies: bool = True,
+                dependents: bool = False) -> List[Component]:
+        """ Expands components with everything they depend on and/or depend on them, transitively, in 'order'. """
+        found = set(components)
+        pending = list(components)
+        while pending:
+            component = pending.pop()
+            related = (self.dependencies(component) if dependencies else []) + \
+                      (self.dependents(component) if dependents else [])
+
+            for other in related:
+                if (other not in found):
+                    found.add(other)
+                    pending.append(other)
+
+        ordered = self.components + [component for component in self.by_id.values() if component not in self.components]
+        return [component for component in ordered if component in found]
+
+    def load_from_file(self, path: str, environment: str = None):
         if (not os.path.isfile(path)):
             raise FileNotFoundError("No foundation.yml file found in " + path + ".")
 
-        with open(path) as f:
-            data = yaml.load(f, Loader=SafeLoader)
-
-            if (not data["api"] or data["api"] == ""):
-                raise ValueError("Invalid API name.")
-            
-            # Load other data.
-            self.api = data["api"]
-
-            # Load settings.
-            settings = data["settings"]
-            kubectl_command = settings["kubectl_command"]
-            registry = settings["registry"]
-            secrets_file = settings["secrets_file"]
-
-            self.settings["kubectl_command"] = kubectl_command
-            self.settings["registry"] = registry
-            self.settings["secrets_file"] = secrets_file
-
-            components = []
-
-            # Append components to respective lists.
-            for entry in data["components"]:
-                if (entry["type"] not in ["database", "microservice", "application"]):
-                    raise ValueError(f"Invalid component type '{entry['type']}'.")
-
-                _id = f"{data['api']}-{entry['type']}-{entry['name']}"
-                name = entry["name"]
-                _type = entry["type"]
-                path = entry["path"]
-
-                context = entry["build"]["context"]
-                dockerfile = entry["build"]["dockerfile"]
-                build_on_compose = entry["build"]["platforms"]["compose"]["build"]
-                push_on_compose = entry["build"]["platforms"]["compose"]["push"]
-                build_on_kubernetes = entry["build"]["platforms"]["kubernetes"]["build"]
-                push_on_kubernetes = entry["build"]["platforms"]["kubernetes"]["push"]
-
-                platform_build_settings = ComponentPlatformBuildSettings(build_on_compose, build_on_kubernetes,
-                                                                         push_on_compose, push_on_kubernetes)
-                
-                build_settings = ComponentBuildSettings(context, dockerfile, platform_build_settings)
-
-                component = Component(_id, name, _type, path, build_settings)
-
-                components.append(component)
-            
-            # Append all components to the ordered all list.
-            for entry in data["order"]:
-                component = [component for (_, component) in enumerate(components) if component.name == entry["name"] and component.type == entry["type"]]
-                if (not component):
-                    continue
-                self.components.append(component[0])
-
-configuration = Configuration()
-configuration.load_from_file(os.path.join(ROOT_DIR, 'foundation.yml'))
\ No newline at end of file
+        import yaml
+        try:
+            from yaml import CSafeLoader as SafeLoader
+        except ImportError:
+            from yaml import SafeLoader
+
+        with open(path, "rb") as f:
+            content = f.read()
+
+        try:
+            data = yaml.load(content, Loader=SafeLoader)
+        except yaml.YAMLError as error:
+            mark = getattr(error, "problem_mark", None)
+            raise ConfigurationError(str(getattr(error, "problem", None) or error), (), path,
+                                     mark.line + 1 if mark is not None else None)
+
+        try:
+            self.load_from_data(data, environment)
+        except ConfigurationError as error:
+            error.file = path
+            error.line = Configuration._find_line(content, error.location)
+            raise
+
+    def load_from_data(self, data: Any, environment: str = None):
+        data = _expect(data, dict, ())
+
+        environments = _expect(data.get("environments"), dict, ("environments",), optional=True) or {}
+        self.environments = list(environments.keys())
+        overrides: Dict[Tuple[str, str], List[str]] = {}
+        if (environment is not None):
+            data, overrides = Configuration._overlay(data, environments, environment)
+            self.environment = environment
+
+        api = _expect(data.get("api"), str, ("api",))
+        if (not api):
+            raise ConfigurationError("Invalid API name.", ("api",))
+
+        # Load other data.
+        self.api = api
+
+        # Load settings.
+        settings = _expect(data.get("settings"), dict, ("settings",))
+        self.settings["kubectl_command"] = _expect_list(settings.get("kubectl_command"), str, ("settings", "kubectl_command"))
+        self.settings["registry"] = _expect(settings.get("registry"), str, ("settings", "registry"), optional=True)
+        self.settings["image_namespace"] = _expect(settings.get("image_namespace"), str, ("settings", "image_namespace"),
+                                                   optional=True)
+        self.settings["secrets_file"] = _expect(settings.get("secrets_file"), str, ("settings", "secrets_file"))
+        self.settings["builder"] = _expect(settings.get("builder"), str, ("settings", "builder"), optional=True)
+        self.settings["context"] = _expect(settings.get("context"), str, ("settings", "context"), optional=True)
+        self.settings["namespace"] = _expect(settings.get("namespace"), str, ("settings", "namespace"), optional=True)
+        self.settings["credentials_file"] = _expect(settings.get("credentials_file"), str, ("settings", "credentials_file"),
+                                                    optional=True)
+
+        login_ttl = _expect(settings.get("login_ttl"), int, ("settings", "login_ttl"), optional=True)
+        if (login_ttl is not None):
+            if (login_ttl < 0):
+                raise ConfigurationError("Expected a non-negative number of seconds.", ("settings", "login_ttl"))
+
+            self.settings["login_ttl"] = login_ttl
+
+        if (not self.settings["kubectl_command"]):
+            raise ConfigurationError("Expected at least one item.", ("settings", "kubectl_command"))
+
+        # Index components by (name, type) and by id.
+        for index, entry in enumerate(_expect(data.get("components"), list, ("components",))):
+            location = ("components", index)
+            component = Configuration._load_component(api, _expect(entry, dict, location), location)
+
+            if (component.id in self.by_id):
+                raise ConfigurationError(f"Duplicate component '{component.name}' of type '{component.type}'.", location)
+
+            self.by_id[component.id] = component
+            self.by_key[(component.name, component.type)] = component
+
+        self.overrides = {self.by_key[key].id: sorted(fields) for key, fields in overrides.items()}
+
+        for index, component in enumerate(self.by_id.values()):
+            for dependency_index, dependency in enumerate(component.depends_on):
+                if (dependency not in self.by_id):
+                    raise ConfigurationError(f"Unknown component '{dependency}'.",
+                                             ("components", index, "depends_on", dependency_index))
+
+        # Reject circular dependencies, pointing at the dependency that closes the cycle.
+        indices = {component.id: index for index, component in enumerate(self.by_id.values())}
+        visited = set()
+        for start in self.by_id:
+            if (start in visited):
+                continue
+            path = [start]
+            stack = [iter(self.by_id[start].depends_on)]
+            visited.add(start)
+            while (stack):
+                dependency = next(stack[-1], None)
+                if (dependency is None):
+                    stack.pop()
+                    path.pop()
+                elif (dependency in path):
+                    cycle = path[path.index(dependency):] + [dependency]
+                    raise ConfigurationError(f"Circular 'depends_on' between components: {' -> '.join(cycle)}.",
+                                             ("components", indices[path[-1]], "depends_on",
+                                              self.by_id[path[-1]].depends_on.index(dependency)))
+                elif (dependency not in visited):
+                    visited.add(dependency)
+                    path.append(dependency)
+                    stack.append(iter(self.by_id[dependency].depends_on))
+
+        # Append all components to the ordered all list.
+        # An entry in 'order' can also be a list of components, forming a tier that is deployed concurrently.
+        ordered = set()
+        for index, entry in enumerate(_expect(data.get("order"), list, ("order",))):
+            tier = []
+            items = entry if isinstance(entry, list) else [entry]
+
+            for item_index, item in enumerate(items):
+                location = ("order", index, item_index) if isinstance(entry, list) else ("order", index)
+                key = Configuration._load_reference(item, location)
+
+                component = self.by_key.get(key)
+                if (component is None):
+                    raise ConfigurationError(f"Unknown component '{key[0]}' of type '{key[1]}'.", location)
+
+                if (component.id in ordered):
+                    raise ConfigurationError(f"Component '{component.id}' appears more than once.", location)
+
+                ordered.add(component.id)
+                tier.append(component)
+                self.components.append(component)
+
+            if (tier):
+                self.tiers.append(tier)
+
+    @staticmethod
+    def _load_component(api: str, entry: dict, location: Location) -> Component:
+        name = _expect(entry.get("name"), str, location + ("name",))
+        _type = _expect(entry.get("type"), str, location + ("type",))
+        path = _expect(entry.get("path"), str, location + ("path",))
+
+        if (_type not in Component.types):
+            raise ConfigurationError(f"Invalid component type '{_type}'.", location + ("type",))
+
+        build_location = location + ("build",)
+        build = _expect(entry.get("build"), dict, build_location)
+        context = _expect(build.get("context"), str, build_location + ("context",))
+        dockerfile = _expect(build.get("dockerfile"), str, build_location + ("dockerfile",))
+
+        platforms_location = build_location + ("platforms",)
+        platforms = _expect(build.get("platforms"), dict, platforms_location)
+        flags = {}
+        for platform in ["compose", "kubernetes"]:
+            platform_location = platforms_location + (platform,)
+            settings = _expect(platforms.get(platform), dict, platform_location)
+            for flag in ["build", "push"]:
+                flags[flag + "_on_" + platform] = _expect(settings.get(flag), bool, platform_location + (flag,))
+
+        platform_build_settings = ComponentPlatformBuildSettings(**flags)
+
+        target = _expect(build.get("target"), str, build_location + ("target",), optional=True)
+
+        # Build arguments are passed to Docker as strings.
+        args = {}
+        for key, value in (_expect(build.get("args"), dict, build_location + ("args",), optional=True) or {}).items():
+            if (not isinstance(value, (str, int, float, bool))):
+                raise ConfigurationError("Expected a string or a number.", build_location + ("args", str(key)))
+            args[str(key)] = str(value).lower() if isinstance(value, bool) else str(value)
+
+        caches = {}
+        for key in ["cache_from", "cache_to"]:
+            cache = build.get(key)
+            caches[key] = [cache] if isinstance(cache, str) else \
+                _expect_list(cache, str, build_location + (key,)) if cache is not None else []
+
+        build_settings = ComponentBuildSettings(context, dockerfile, platform_build_settings, target, args, **caches)
+
+        # Dependencies are referenced by name and type, just like the entries in 'order'.
+        depends_on = []
+        dependencies = _expect(entry.get("depends_on"), list, location + ("depends_on",), optional=True) or []
+        for index, dependency in enumerate(dependencies):
+            dependency_name, dependency_type = Configuration._load_reference(dependency, location + ("depends_on", index))
+            depends_on.append(f"{api}-{dependency_type}-{dependency_name}")
+
+        replicas = _expect(entry.get("replicas"), int, location + ("replicas",), optional=True)
+        if (replicas is not None and replicas < 0):
+            raise ConfigurationError("Expected a non-negative number of replicas.", location + ("replicas",))
+
+        ports = []
+        for index, port in enumerate(_expect(entry.get("ports"), list, location + ("ports",), optional=True) or []):
+            port_location = location + ("ports", index)
+            port = _expect(port, dict, port_location)
+            ports.append(ComponentPort(_expect(port.get("expose"), int, port_location + ("expose",)),
+                                       _expect(port.get("containerPort"), int, port_location + ("containerPort",))))
+
+        image = _expect(entry.get("image"), str, location + ("image",), optional=True)
+
+        ready_timeout = _expect(entry.get("ready_timeout"), int, location + ("ready_timeout",), optional=True)
+        if (ready_timeout is not None and ready_timeout <= 0):
+            raise ConfigurationError("Expected a positive number of seconds.", location + ("ready_timeout",))
+
+        registries = _expect(entry.get("registries"), list, location + ("registries",), optional=True) or []
+        _expect_list(registries, str, location + ("registries",))
+
+        size_budget = _parse_size(entry.get("size_budget"), location + ("size_budget",))
+
+        return Component(f"{api}-{_type}-{name}", name, _type, path, build_settings, depends_on,
+                         1 if replicas is None else replicas, ports, image, registries, ready_timeout, size_budget)
+
+    @staticmethod
+    def _overlay(data: dict, environments: dict, environment: str) -> Tuple[dict, Dict[Tuple[str, str], List[str]]]:
+        """
+        Returns the data of the file with the overlay of an environment merged over it, and the fields overridden for
+        each component by (name, type). Settings are merged key by key, and components are matched by name and type,
+        only overriding the fields in 'overridable'.
+        """
+        if (environment not in environments):
+            raise ConfigurationError(f"Unknown environment '{environment}'.", ("environments",))
+
+        location = ("environments", environment)
+        overlay = _expect(environments[environment] or {}, dict, location)
+
+        merged = dict(data)
+        settings = _expect(overlay.get("settings"), dict, location + ("settings",), optional=True) or {}
+        merged["settings"] = {**(data.get("settings") or {}), **settings}
+
+        components = [dict(entry) if isinstance(entry, dict) else entry for entry in data.get("components") or []]
+        overridden: Dict[Tuple[str, str], List[str]] = {}
+        overrides = _expect(overlay.get("components"), list, location + ("components",), optional=True) or []
+        for index, override in enumerate(overrides):
+            override_location = location + ("components", index)
+            key = Configuration._load_reference(override, override_location)
+
+            entry = next((entry for entry in components if isinstance(entry, dict)
+                          and (entry.get("name"), entry.get("type")) == key), None)
+            if (entry is None):
+                raise ConfigurationError(f"Unknown component '{key[0]}' of type '{key[1]}'.", override_location)
+
+            for field in override.keys() - {"name", "type"}:
+                if (field not in Configuration.overridable):
+                    raise ConfigurationError("Can't be overridden per environment.", override_location + (field,))
+
+                entry[field] = override[field]
+                overridden.setdefault(key, []).append(field)
+
+        merged["components"] = components
+        return merged, overridden
+
+    @staticmethod
+    def _load_reference(entry: Any, location: Location) -> Tuple[str, str]:
+        entry = _expect(entry, dict, location)
+        return _expect(entry.get("name"), str, location + ("name",)), _expect(entry.get("type"), str, location + ("type",))
+
+    @staticmethod
+    def _find_line(content: bytes, location: Location) -> Optional[int]:
+        """ Finds the line of the node at 'location'. Only used to report errors, so it can afford a slow parse. """
+        import yaml
+
+        try:
+            node = yaml.compose(content, Loader=yaml.SafeLoader)
+        except yaml.YAMLError:
+            return None
+
+        line = node.start_mark.line if node is not None else None
+        for part in location:
+            if (isinstance(node, yaml.MappingNode) and isinstance(part, str)):
+                node = next((value for key, value in node.value if key.value == part), None)
+            elif (isinstance(node, yaml.SequenceNode) and isinstance(part, int) and part < len(node.value)):
+                node = node.value[part]
+            else:
+                node = None
+
+            if (node is None):
+                break
+            line = node.start_mark.line
+
+        return line + 1 if line is not None else None
+
+    @staticmethod
+    def from_file(path: str, snapshot: str = None, environment: str = None) -> "Configuration":
+        """
+        Loads a configuration file, with the overlay of an environment if one is given, reusing a pickled snapshot of
+        the parsed model while the file is unchanged. The snapshot is keyed on the file's size and modification time,
+        falling back to its content hash.
+        """
+        if (snapshot is None):
+            return Configuration._parse(path, environment)
+
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return Configuration._parse(path, environment)
+
+        key = {
+            "path": os.path.abspath(path),
+            "environment": environment,
+            "size": stat.st_size,
+            "mtime": stat.st_mtime_ns,
+            "model": [os.stat(file).st_mtime_ns for file in Configuration.model_files],
+        }
+
+        cached = None
+        try:
+            with open(snapshot, "rb") as f:
+                cached = pickle.load(f)
+        except Exception:
+            pass
+
+        if (cached is not None and cached["key"] == key):
+            return cached["configuration"]
+
+        with open(path, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+
+        if (cached is not None and cached["digest"] == digest and cached["key"]["model"] == key["model"]):
+            configuration = cached["configuration"]
+        else:
+            configuration = Configuration._parse(path, environment)
+
+        try:
+            os.makedirs(os.path.dirname(snapshot), exist_ok=True)
+            temporary = snapshot + ".tmp"
+            with open(temporary, "wb") as f:
+                pickle.dump({"key": key, "digest": digest, "configuration": configuration}, f)
+            os.replace(temporary, snapshot)
+        except OSError:
+            pass
+
+        return configuration
+
+    @staticmethod
+    def _parse(path: str, environment: str = None) -> "Configuration":
+        configuration = Configuration()
+        configuration.load_from_file(path, environment)
+        return configuration
+
+def _expect(value: Any, expected: type, location: Location, optional: bool = False) -> Any:
+    if (value is None and optional):
+        return None
+
+    if (not isinstance(value, expected) or (expected is not bool and isinstance(value, bool))):
+        names = {dict: "a mapping", list: "a list", str: "a string", bool: "a boolean", int: "an integer"}
+        found = "nothing" if value is None else type(value).__name__
+        raise ConfigurationError(f"Expected {names.get(expected, expected.__name__)}, found {found}.", location)
+
+    return value
+
+def _parse_size(value: Any, location: Location) -> Optional[int]:
+    """ Parses a size in bytes, given as a number or a string with a unit such as '250MB' or '1.5GiB'. """
+    if (value is None):
+        return None
+
+    units = {"": 1, "B": 1, "KB": 1000, "MB": 1000 ** 2, "GB": 1000 ** 3, "KIB": 1024, "MIB": 1024 ** 2, "GIB": 1024 ** 3}
+    match = re.fullmatch(r"\s*([0-9]+(?:\.[0-9]+)?)\s*([A-Za-z]*)\s*", str(value)) if not isinstance(value, bool) else None
+    if (match is None or match.group(2).upper() not in units or float(match.group(1)) <= 0):
+        raise ConfigurationError("Expected a positive size, such as 250MB or 1.5GiB.", location)
+
+    return int(float(match.group(1)) * units[match.group(2).upper()])
+
+def _expect_list(value: Any, expected: type, location: Location) -> list:
+    items = _expect(value, list, location)
+    for index, item in enumerate(items):
+        _expect(item, expected, location + (index,))
+
+    return items
+
+@lru_cache(maxsize=None)
+def get_configuration(environment: str = None) -> Configuration:
+    """ Returns the configuration of the repository, loading foundation.yml on first use, with an environment's overlay. """
+    snapshot = "configuration.pickle" if environment is None else f"configuration.{environment}.pickle"
+    return Configuration.from_file(os.path.join(ROOT_DIR, 'foundation.yml'), os.path.join(CACHE_DIR, snapshot), environment)
@@ -1,11 +1,48 @@
+import json
+import threading
+import time
+from typing import Callable, Optional
+
 from rich import console
+from rich.errors import MarkupError
+from rich.markup import escape
 from rich.panel import Panel
-from rich.segment import Segment
+from rich.text import Text
+from rich.status import Status
+
+class QuietStatus:
+    """ Stands in for a spinner when output is JSON, ignoring every update. """
+
+    def update(self, *args, **kwargs) -> None:
+        pass
+
+    def start(self) -> None:
+        pass
+
+    def stop(self) -> None:
+        pass
+
+    def __enter__(self) -> "QuietStatus":
+        return self
+
+    def __exit__(self, *args) -> None:
+        pass
 
 class Console(console.Console):
+    """
+    Writes styled text for humans, or, once the output is set to 'json', one JSON object per line for automation.
+    In JSON mode, every message becomes a 'log' event, tables become 'table' events with a mapping per row, and
+    spinners are not drawn. Commands report what happened to each component with 'event', which is silent otherwise.
+    """
+
+    outputs: list = ["text", "json"]
+
     def __init__(self, *args, **kwargs) -> None:
         super().__init__(*args, **kwargs)
 
+        self.json = False
+        self._events_lock = threading.Lock()
+
         self.texts = {
             "welcome": "Welcome to [magenta]fctl[/magenta]!",
 
@@ -14,6 +51,70 @@ class Console(console.Console):
             "kubectl_not_found": "Kubectl was not found. Please install it and try again.",
         }
 
+    def set_output(self, output: str) -> None:
+        self.json = output == "json"
+
+    def event(self, phase: str, component: str = None, **fields) -> None:
+        """
+        Reports a phase of a component, such as its build or its rollout, in JSON mode. Usual fields are 'status',
+        'duration' (seconds), 'digest' and 'error'. Fields that are None are left out.
+        """
+        if (self.json):
+            self.emit({"event": "component", "phase": phase, "component": component, **fields})
+
+    def emit(self, data: dict) -> None:
+        fields = {key: value for key, value in data.items() if value is not None}
+        line = json.dumps({"time": round(time.time(), 3), **fields}, default=str)
+
+        # Events are written by many threads at once, and each must stay on its own line.
+        with self._events_lock:
+            self.file.write(line + "\n")
+            self.file.flush()
+
+    def log(self, *objects, style=None, level: str = "info", **kwargs) -> None:
+        if (self.json):
+            self.emit({"event": "log", "level": level, "message": " ".join(Console.plain(o) for o in objects)})
+        else:
+            super().log(*objects, style=style, **kwargs)
+
+    def print(self, *objects, **kwargs) -> None:
+        if (not self.json):
+            return super().print(*objects, **kwargs)
+
+        from rich.table import Table
+
+        for item in objects:
+            if (isinstance(item, Table)):
+                self.emit_table(item)
+            elif (isinstance(item, Panel)):
+                self.emit({"event": "log", "level": "info", "title": Console.plain(item.title),
+                           "message": Console.plain(item.renderable)})
+            else:
+                self.emit({"event": "log", "level": "info", "message": Console.plain(item)})
+
+    def emit_table(self, table) -> None:
+        headers = [Console.plain(column.header) for column in table.columns]
+        rows = zip(*[[Console.plain(cell) for cell in column.cells] for column in table.columns])
+        self.emit({"event": "table", "title": Console.plain(table.title),
+                   "rows": [dict(zip(headers, row)) for row in rows]})
+
+    def status(self, *args, **kwargs):
+        return QuietStatus() if self.json else super().status(*args, **kwargs)
+
+    @staticmethod
+    def plain(value) -> Optional[str]:
+        """ Returns the text of a renderable without its markup. """
+        if (value is None):
+            return None
+
+        if (isinstance(value, Text)):
+            return value.plain
+
+        try:
+            return Text.from_markup(str(value)).plain
+        except MarkupError:
+            return str(value)
+
     def welcome(self) -> None:
         self.print(self.texts["welcome"], style="bold blue")
 
@@ -21,21 +122,34 @@ class Console(console.Console):
         self.log(message, style="bold blue")
 
     def done(self, message: str) -> None:
-        self.log(message, style="bold green")
+        self.log(message, style="bold green", level="done")
 
     def warn(self, message: str) -> None:
-        self.log(message, style="bold dark_orange3")
+        self.log(message, style="bold dark_orange3", level="warning")
 
     def error(self, message: str) -> None:
-        self.log(message, style="bold red")
+        self.log(message, style="bold red", level="error")
 
     def error_panel(self, message) -> None:
-        segment = Segment(message, style="white")
-        panel = Panel(segment, title="Error", border_style="red")
+        if (self.json):
+            self.emit({"event": "log", "level": "error", "message": str(message)})
+            return
+
+        text = Text(message, style="white")
+        panel = Panel(text, title="Error", border_style="red")
         self.print(panel)
 
     def debug(self, message: str) -> None:
-        self.log(message, style="bold magenta")
+        self.log(message, style="bold magenta", level="debug")
+
+    def stream(self, status: Status, message: str) -> Callable[[str], None]:
+        """ Returns a callback that shows each line written by a command next to the status message. """
+        def update(line: str) -> None:
+            line = line.strip()
+            if (line):
+                status.update(message + " [bright_black]" + escape(line[:120]))
+
+        return update
 
 
     def alert_docker_not_found(self) -> None:
@@ -47,4 +161,4 @@ class Console(console.Console):
     def alert_kubectl_not_found(self) -> None:
         self.error(self.texts["kubectl_not_found"])
 
-console = Console(log_path=False)
\ No newline at end of file
+console = Console(log_path=False)
@@ -0,0 +1,166 @@
+import hashlib
+import hmac
+import json
+import os
+import sys
+import time
+from typing import Callable, List, Optional
+
+from lib.directories import CACHE_DIR, ROOT_DIR
+
+class Credentials:
+    def __init__(self, username: str, password: str, source: str) -> None:
+        self.username: str = username
+        self.password: str = password
+        self.source: str = source
+
+    def fingerprint(self, key: bytes) -> str:
+        """ Returns a keyed hash of the credentials, which can't be checked against guessed passwords without the key. """
+        return hmac.new(key, (self.username + "\0" + self.password).encode(), hashlib.sha256).hexdigest()
+
+class CredentialChain:
+    """
+    Finds the credentials of a registry from, in order: the FCTL_REGISTRY_USERNAME and FCTL_REGISTRY_PASSWORD
+    environment variables, the Docker config (including its credential helpers and store), the credentials file set
+    in 'settings', and finally an interactive prompt, which is skipped when there is no terminal.
+    """
+
+    username_variable: str = "FCTL_REGISTRY_USERNAME"
+    password_variable: str = "FCTL_REGISTRY_PASSWORD"
+
+    def __init__(self, registry: Optional[str], credentials_file: Optional[str] = None) -> None:
+        self.registry = registry
+        self.credentials_file = credentials_file
+
+    def providers(self) -> List[Callable[[], Optional[Credentials]]]:
+        return [self.from_environment, self.from_docker_config, self.from_file, self.from_prompt]
+
+    def resolve(self) -> Optional[Credentials]:
+        for provider in self.providers():
+            credentials = provider()
+            if (credentials is not None):
+                return credentials
+
+        return None
+
+    def from_environment(self) -> Optional[Credentials]:
+        username = os.environ.get(self.username_variable)
+        password = os.environ.get(self.password_variable)
+        if (not username or password is None):
+            return None
+
+        return Credentials(username, password, "environment")
+
+    def from_docker_config(self) -> Optional[Credentials]:
+        """ Reads ~/.docker/config.json, asking its credential helpers when it uses any. """
+        from docker import auth
+        from docker.errors import DockerException
+
+        try:
+            config = auth.load_config().resolve_authconfig(self.registry)
+        except (DockerException, OSError, ValueError):
+            return None
+
+        if (not config or not config.get("username") or config.get("password") is None):
+            return None
+
+        return Credentials(config["username"], config["password"], "docker config")
+
+    def from_file(self) -> Optional[Credentials]:
+        """
+        Reads a YAML or JSON file with 'username' and 'password', either at its top level or under the host of the
+        registry ('docker.io' for Docker Hub).
+        """
+        if (self.credentials_file is None):
+            return None
+
+        import yaml
+
+        try:
+            with open(os.path.join(ROOT_DIR, self.credentials_file)) as f:
+                data = yaml.safe_load(f) or {}
+        except (OSError, yaml.YAMLError):
+            return None
+
+        if (isinstance(data, dict) and "username" not in data):
+            data = data.get(self.registry or "docker.io")
+
+        if (not isinstance(data, dict) or "username" not in data or "password" not in data):
+            return None
+
+        return Credentials(str(data["username"]), str(data["password"]), "credentials file")
+
+    def from_prompt(self) -> Optional[Credentials]:
+        if (not sys.stdin.isatty()):
+            return None
+
+        from rich.prompt import Prompt
+
+        username = Prompt.ask("Enter your registry username: ", show_default=False)
+        password = Prompt.ask("Enter your registry password: ", show_default=False, password=True)
+
+        return Credentials(username, password, "prompt")
+
+class LoginCache:
+    """
+    Remembers successful logins for a while, so later runs can hand the credentials to the Docker client without
+    asking the daemon to check them again. Only a fingerprint of the credentials is stored, never the password. The
+    fingerprint is keyed with a random key kept in the user's configuration directory, outside of the repository, and
+    logins are not remembered when that key can't be read or created.
+    """
+
+    key_path: str = os.path.join(os.environ.get("XDG_CONFIG_HOME") or os.path.join(os.path.expanduser("~"), ".config"),
+                                 "fctl", "login.key")
+
+    def __init__(self, ttl: float, path: str = os.path.join(CACHE_DIR, "logins.json")) -> None:
+        self.ttl = ttl
+        self.path = path
+        self.key = LoginCache.machine_key()
+        try:
+            with open(path) as f:
+                self.entries: dict = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    @staticmethod
+    def machine_key() -> Optional[bytes]:
+        """ Returns the key of this machine, creating it readable by the user only on first use. """
+        try:
+            with open(LoginCache.key_path, "rb") as f:
+                key = f.read()
+            if (len(key) >= 32):
+                return key
+        except OSError:
+            pass
+
+        try:
+            os.makedirs(os.path.dirname(LoginCache.key_path), mode=0o700, exist_ok=True)
+            key = os.urandom(32)
+
+            # Written to a temporary file first, so concurrent runs never read a partial key.
+            temporary = f"{LoginCache.key_path}.{os.getpid()}"
+            descriptor = os.open(temporary, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(descriptor, "wb") as f:
+                f.write(key)
+            os.replace(temporary, LoginCache.key_path)
+            return key
+        except OSError:
+            return None
+
+    def is_valid(self, registry: str, credentials: Credentials) -> bool:
+        entry = self.entries.get(registry)
+        return (self.key is not None and entry is not None and entry["fingerprint"] == credentials.fingerprint(self.key)
+                and time.time() - entry["time"] < self.ttl)
+
+    def record(self, registry: str, credentials: Credentials) -> None:
+        if (self.key is None):
+            return
+
+        self.entries[registry] = {"fingerprint": credentials.fingerprint(self.key), "time": time.time()}
+
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, "w") as f:
+                json.dump(self.entries, f)
+        except OSError:
+            pass
@@ -0,0 +1,156 @@
+import os
+import time
+from threading import Event
+from typing import Callable, Dict, List, Optional, Set
+
+from lib.cache import BuildCache
+from lib.component import Component
+from lib.console import console
+from lib.directories import ROOT_DIR
+from lib.trace import tracer
+from lib.watch import FileWatcher
+
+class DevError(Exception):
+    def __init__(self, message: str, output: str = "") -> None:
+        super().__init__(message)
+        self.output = output
+
+# Redeploys a component, rebuilding its image first when the second argument is set. Raises DevError when it fails.
+Handler = Callable[[Component, bool], None]
+
+class DevLoop:
+    """
+    Watches the files each component's Dockerfile reads from its build context (and optionally its manifest). Once
+    changes settle for 'debounce' seconds, the components whose inputs changed are rebuilt and redeployed, and the
+    ones whose manifest changed are redeployed, in the order of the configuration. Components sharing a context are
+    only rebuilt for changes to their own inputs. Contents are compared by hash, so changes to files excluded by
+    '.dockerignore', or saves that don't change anything, don't trigger builds.
+    """
+
+    # Seconds after the first pending change after which changes are handled, even if more keep coming.
+    max_delay: float = 5.0
+
+    def __init__(self, components: List[Component], handler: Handler, cache: BuildCache, debounce: float = 0.5,
+                 manifests: bool = True, watched: Optional[List[str]] = None, interval: float = 1.0,
+                 on_idle: Callable[[], None] = None) -> None:
+        self.components = components
+        self.handler = handler
+        self.cache = cache
+        self.debounce = debounce
+        self.manifests = manifests
+        self.on_idle = on_idle
+
+        # Files that can't be reloaded while running, such as 'foundation.yml', by modification time.
+        self.watched = {os.path.abspath(file): self.mtime(file) for file in watched or []}
+
+        self.digests: Dict[str, str] = {c.id: self.digest(c) for c in components}
+
+        directories = [self.directory(root, self.context(c)) for c in components for root in self.inputs(c)]
+        if (manifests):
+            directories += [os.path.dirname(self.manifest(c)) for c in components]
+        self.watcher = FileWatcher.create(DevLoop.outermost([d for d in directories if os.path.isdir(d)]), interval)
+
+    def context(self, component: Component) -> str:
+        return os.path.join(ROOT_DIR, component.build.context)
+
+    def inputs(self, component: Component) -> List[str]:
+        """ Returns the absolute paths under which the files read by the build of the component live. """
+        context = self.context(component)
+        return [os.path.normpath(os.path.join(context, root))
+                for root in self.cache.input_roots(context, component.build.dockerfile)]
+
+    @staticmethod
+    def directory(path: str, context: str) -> str:
+        """ Returns the directory to watch for a path: itself, or its closest existing parent inside the context. """
+        while (not os.path.isdir(path) and path != context and os.path.dirname(path) != path):
+            path = os.path.dirname(path)
+
+        return path
+
+    @staticmethod
+    def outermost(directories: List[str]) -> List[str]:
+        """ Leaves out the directories inside others, since watchers already watch roots recursively. """
+        directories = sorted(set(directories))
+        return [d for d in directories if not any(d.startswith(other + os.sep) for other in directories)]
+
+    def manifest(self, component: Component) -> str:
+        return os.path.join(ROOT_DIR, component.path)
+
+    def digest(self, component: Component) -> str:
+        return self.cache.digest(self.context(component), component.build.dockerfile)
+
+    @staticmethod
+    def mtime(file: str) -> int:
+        try:
+            return os.stat(file).st_mtime_ns
+        except OSError:
+            return 0
+
+    def run(self, stop: Event = None) -> None:
+        """ Handles changes until 'stop' is set or the process is interrupted. """
+        pending: Set[str] = set()
+        first = 0.0
+
+        try:
+            while stop is None or not stop.is_set():
+                changed = self.watcher.changes(self.debounce if pending else 1.0)
+                self.check_watched()
+
+                if (changed and not pending):
+                    first = time.monotonic()
+                pending |= changed
+
+                if (pending and (not changed or time.monotonic() - first >= self.max_delay)):
+                    self.dispatch(pending)
+                    pending = set()
+                    if (self.on_idle is not None):
+                        self.on_idle()
+        finally:
+            self.watcher.close()
+
+    def affected(self, paths: Set[str]) -> List[tuple]:
+        """ Returns the components affected by the paths, with the new digest of the ones that must be rebuilt. """
+        affected = []
+        for component in self.components:
+            # Inputs are found again every time, since the Dockerfile may have changed.
+            inputs = self.inputs(component)
+            digest = None
+            if (any(path == root or path.startswith(root + os.sep) for path in paths for root in inputs)):
+                # Only rebuilt when the content sent to the builder changed.
+                digest = self.digest(component)
+                if (digest == self.digests[component.id]):
+                    digest = None
+
+            if (digest is not None or (self.manifests and self.manifest(component) in paths)):
+                affected.append((component, digest))
+
+        return affected
+
+    def check_watched(self) -> None:
+        for file, mtime in self.watched.items():
+            current = self.mtime(file)
+            if (current != mtime):
+                self.watched[file] = current
+                console.warn(f"{os.path.relpath(file)} changed. Restart to apply its changes.")
+
+    def dispatch(self, paths: Set[str]) -> None:
+        for component, digest in self.affected(paths):
+            rebuild = digest is not None
+            start = time.monotonic()
+            try:
+                with tracer.span(component.id, "dev", rebuild=rebuild):
+                    self.handler(component, rebuild)
+            except DevError as error:
+                console.event("redeploy", component.id, status="failed", rebuilt=rebuild,
+                              duration=round(time.monotonic() - start, 3), error=str(error))
+                console.error(str(error))
+                if (error.output):
+                    console.error_panel(error.output)
+                continue
+
+            # Files changed during the build have their own events, so they are compared with what was built.
+            if (rebuild):
+                self.digests[component.id] = digest
+            console.event("redeploy", component.id, status="redeployed", rebuilt=rebuild,
+                          duration=round(time.monotonic() - start, 3))
+            console.log(f"* {component.id} was {'rebuilt and ' if rebuild else ''}redeployed in {time.monotonic() - start:.1f}s.")
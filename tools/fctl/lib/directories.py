@@ -4,4 +4,7 @@ FILE_DIR = path.dirname(path.abspath(__file__))
 FCTL_DIR = path.dirname(FILE_DIR)
 TOOLS_DIR = path.dirname(FCTL_DIR)
 ROOT_DIR = path.dirname(TOOLS_DIR)
-SRC_DIR = path.join(ROOT_DIR, "src")
\ No newline at end of file
+SRC_DIR = path.join(ROOT_DIR, "src")
+CACHE_DIR = path.join(ROOT_DIR, ".fctl")
+
+RENDER_DIR = path.join(CACHE_DIR, "render")
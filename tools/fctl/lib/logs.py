@@ -0,0 +1,204 @@
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Union
+
+class LogStream:
+    """ Bounded buffer of the lines read from a single container. When it's full, the oldest lines are dropped. """
+
+    def __init__(self, key: str, component: str, prefix: str, size: int) -> None:
+        self.key: str = key
+        self.component: str = component
+        self.prefix: str = prefix
+        self.lines: deque = deque(maxlen=size)
+        self.dropped: int = 0
+        self.done: bool = False
+
+Watcher = Callable[["LogMultiplexer", threading.Event], None]
+
+class LogMultiplexer:
+    """
+    Follows the logs of many containers at once, each read on its own thread into a bounded buffer, and writes them
+    to a single output with a colored prefix per component. Lines are taken from every buffer in turns, so a chatty
+    container can't hold back the others: if it outgrows its buffer, its oldest lines are dropped instead. When not
+    'lossy' (i.e. not following), a full buffer makes its reader wait instead, so no line is lost.
+    """
+
+    colors: list = ["cyan", "magenta", "green", "yellow", "blue", "bright_cyan", "bright_magenta", "bright_green",
+                    "bright_yellow", "bright_blue"]
+
+    # Lines written from each buffer per turn.
+    batch: int = 100
+
+    def __init__(self, console, buffer_size: int = 1000, lossy: bool = True) -> None:
+        self.console = console
+        self.buffer_size = buffer_size
+        self.lossy = lossy
+        self.streams: Dict[str, LogStream] = {}
+        self.styles: Dict[str, str] = {}
+        self.width: int = 0
+        self.changed = threading.Event()
+        self.drained = threading.Event()
+        self.stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def attach(self, key: str, component: str, prefix: str, chunks: Iterable[Union[bytes, str]],
+               close: Callable[[], None] = None) -> bool:
+        """
+        Starts reading a log stream, unless one with the same key is still being read. 'chunks' may split lines
+        anywhere, and 'close' is called once the stream ends, or right away when it isn't attached. Returns whether
+        the stream was attached.
+        """
+        with self._lock:
+            if (self.is_attached(key)):
+                if (close is not None):
+                    close()
+                return False
+
+            stream = LogStream(key, component, prefix, self.buffer_size)
+            self.streams[key] = stream
+            self.width = max(self.width, len(prefix))
+            self.styles.setdefault(component, self.colors[len(self.styles) % len(self.colors)])
+
+        threading.Thread(target=self._read, args=(stream, chunks, close), daemon=True).start()
+        return True
+
+    def is_attached(self, key: str) -> bool:
+        """ Returns whether a stream with the key is still being read. """
+        return key in self.streams and not self.streams[key].done
+
+    def run(self, watchers: List[Watcher] = None, follow: bool = True) -> None:
+        """
+        Writes the buffered lines until Ctrl+C. Watchers run on background threads and attach the streams of containers
+        that start later. Without 'follow', returns once every stream has ended.
+        """
+        for watcher in watchers or []:
+            threading.Thread(target=watcher, args=(self, self.stop), daemon=True).start()
+
+        try:
+            while True:
+                if (self.changed.wait(timeout=0.5)):
+                    self.changed.clear()
+
+                # Checked before flushing, so lines read right before a stream ended are still written.
+                finished = not follow and all(stream.done for stream in list(self.streams.values()))
+                if (not self._flush() and finished):
+                    break
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop.set()
+
+    def _read(self, stream: LogStream, chunks: Iterable[Union[bytes, str]], close: Optional[Callable[[], None]]) -> None:
+        try:
+            for line in LogMultiplexer.lines(chunks):
+                if (self.stop.is_set()):
+                    break
+
+                while (not self.lossy and len(stream.lines) == stream.lines.maxlen and not self.stop.is_set()):
+                    self.drained.clear()
+                    self.drained.wait(timeout=0.1)
+
+                with self._lock:
+                    if (len(stream.lines) == stream.lines.maxlen):
+                        stream.dropped += 1
+                    stream.lines.append(line)
+
+                self.changed.set()
+        except Exception as error:
+            with self._lock:
+                stream.lines.append(f"(log stream failed: {error})")
+        finally:
+            if (close is not None):
+                close()
+
+            stream.done = True
+            self.changed.set()
+
+    def _flush(self) -> bool:
+        """ Writes up to 'batch' lines from each buffer. Returns whether anything was written. """
+        if (self.console.json):
+            return self._emit()
+
+        from rich.text import Text
+
+        output = Text()
+        with self._lock:
+            for stream in list(self.streams.values()):
+                if (not stream.lines and not stream.dropped):
+                    continue
+
+                style = self.styles[stream.component]
+                prefix = stream.prefix.ljust(self.width) + " | "
+
+                if (stream.dropped):
+                    output.append(prefix, style=style)
+                    output.append(f"... {stream.dropped} lines dropped\n", style="bright_black italic")
+                    stream.dropped = 0
+
+                for _ in range(min(self.batch, len(stream.lines))):
+                    output.append(prefix, style=style)
+                    output.append(stream.lines.popleft() + "\n")
+
+        self.drained.set()
+        if (not output):
+            return False
+
+        output.rstrip()
+        self.console.print(output, soft_wrap=True, highlight=False)
+        return True
+
+    def _emit(self) -> bool:
+        """ Writes up to 'batch' lines from each buffer as 'line' events. Returns whether anything was written. """
+        events = []
+        with self._lock:
+            for stream in list(self.streams.values()):
+                if (stream.dropped):
+                    events.append({"event": "line", "component": stream.component, "source": stream.prefix,
+                                   "dropped": stream.dropped})
+                    stream.dropped = 0
+
+                for _ in range(min(self.batch, len(stream.lines))):
+                    events.append({"event": "line", "component": stream.component, "source": stream.prefix,
+                                   "line": stream.lines.popleft()})
+
+        self.drained.set()
+        for event in events:
+            self.console.emit(event)
+
+        return bool(events)
+
+    @staticmethod
+    def lines(chunks: Iterable[Union[bytes, str]]) -> Iterator[str]:
+        """ Splits a stream of chunks into lines. """
+        rest = b""
+        for chunk in chunks:
+            if (isinstance(chunk, str)):
+                chunk = chunk.encode()
+
+            *lines, rest = (rest + chunk).split(b"\n")
+            for line in lines:
+                yield line.rstrip(b"\r").decode(errors="replace")
+
+        if (rest):
+            yield rest.decode(errors="replace")
+
+def parse_since(value: Optional[str]) -> Optional[int]:
+    """
+    Parses a relative duration such as '30s', '10m', '2h' or '1d', or an ISO 8601 timestamp, into the number of
+    seconds to look back. Raises ValueError if the value is not valid.
+    """
+    if (not value):
+        return None
+
+    match = re.fullmatch(r"(\d+)([smhd]?)", value.strip())
+    if (match):
+        return int(match.group(1)) * {"": 1, "s": 1, "m": 60, "h": 3600, "d": 86400}[match.group(2)]
+
+    timestamp = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    if (timestamp.tzinfo is None):
+        timestamp = timestamp.astimezone()
+
+    return max(0, int(time.time() - timestamp.astimezone(timezone.utc).timestamp()))
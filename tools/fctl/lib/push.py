@@ -0,0 +1,152 @@
+import random
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from lib.scheduler import BuildError
+
+class PushResult:
+    def __init__(self, tag: str, digest: Optional[str], skipped: bool, attempts: int) -> None:
+        self.tag: str = tag
+        self.digest: Optional[str] = digest
+        self.skipped: bool = skipped
+        self.attempts: int = attempts
+
+    def __str__(self) -> str:
+        return self.tag
+
+class ImagePusher:
+    """
+    Pushes images through the Docker SDK, reporting the progress of every layer. Transient failures (dropped
+    connections, timeouts, 5xx and 429 responses) are retried with exponential backoff and jitter, while errors such
+    as denied access fail right away. Images whose digest is already in the registry are not pushed again.
+    """
+
+    # Fragments of error messages that are worth retrying.
+    transient_errors: list = ["timeout", "timed out", "connection reset", "connection refused", "broken pipe", "eof",
+                              "tls handshake", "500", "502", "503", "504", "429", "too many requests",
+                              "service unavailable", "bad gateway", "internal server error"]
+
+    def __init__(self, client, retries: int = 4, backoff: float = 1.0,
+                 on_progress: Callable[[str, str], None] = None, auth_configs: Dict[str, dict] = None) -> None:
+        self.client = client
+        self.retries = retries
+        self.backoff = backoff
+        self.on_progress = on_progress
+
+        # Credentials by registry ('docker.io' for Docker Hub). Registries left out use the Docker config.
+        self.auth_configs = auth_configs or {}
+
+    def auth_config(self, repository: str) -> Optional[dict]:
+        from docker.auth import resolve_repository_name
+
+        registry, _ = resolve_repository_name(repository)
+        return self.auth_configs.get(registry)
+
+    def push(self, tag: str, cancel: threading.Event = None) -> PushResult:
+        """ Pushes an image, unless the registry already has it. Raises BuildError when every attempt fails. """
+        from docker.errors import APIError
+        from docker.utils import parse_repository_tag
+        from requests.exceptions import RequestException
+
+        repository, version = parse_repository_tag(tag)
+        version = version or "latest"
+
+        existing = self.remote_digest(tag)
+        if (existing is not None and existing in self.local_digests(repository)):
+            return PushResult(tag, existing, True, 0)
+
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                digest = self._push(repository, version, cancel)
+                return PushResult(tag, digest, False, attempt)
+            except (APIError, RequestException, BuildError) as error:
+                message = getattr(error, "explanation", None) or str(error)
+                if (cancel is not None and cancel.is_set()):
+                    raise BuildError("Cancelled.")
+
+                if (attempt > self.retries or not ImagePusher.is_transient(message)):
+                    raise BuildError(f"Failed to push {tag} after {attempt} attempt(s).", message)
+
+                delay = self.backoff * (2 ** (attempt - 1)) * random.uniform(0.5, 1.5)
+                self._report(tag, f"retrying in {delay:.1f}s ({message.strip()[:80]})")
+                if (cancel is not None and cancel.wait(delay)):
+                    raise BuildError("Cancelled.")
+                elif (cancel is None):
+                    time.sleep(delay)
+
+    def push_all(self, tags: List[str], cancel: threading.Event = None) -> List[PushResult]:
+        """ Pushes the same image to several registries concurrently. """
+        if (len(tags) <= 1):
+            return [self.push(tag, cancel) for tag in tags]
+
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers=len(tags), thread_name_prefix="fctl-push") as pool:
+            return list(pool.map(lambda tag: self.push(tag, cancel), tags))
+
+    def remote_digest(self, tag: str) -> Optional[str]:
+        """ Returns the digest of the image in the registry, or None if it doesn't exist or can't be checked. """
+        from docker.errors import APIError
+        from docker.utils import parse_repository_tag
+        from requests.exceptions import RequestException
+
+        try:
+            auth_config = self.auth_config(parse_repository_tag(tag)[0])
+            return self.client.api.inspect_distribution(tag, auth_config=auth_config)["Descriptor"]["digest"]
+        except (APIError, RequestException, KeyError):
+            return None
+
+    def local_digests(self, repository: str) -> List[str]:
+        """ Returns the registry digests the local image is known by, recorded by earlier pushes and pulls. """
+        from docker.errors import APIError
+
+        try:
+            repo_digests = self.client.api.inspect_image(repository)["RepoDigests"] or []
+        except (APIError, KeyError):
+            return []
+
+        return [entry.split("@", 1)[1] for entry in repo_digests if entry.split("@", 1)[0] == repository]
+
+    def _push(self, repository: str, version: str, cancel: Optional[threading.Event]) -> Optional[str]:
+        tag = repository + ":" + version
+        layers: Dict[str, Tuple[int, int, str]] = {}
+        digest = None
+
+        for event in self.client.images.push(repository, tag=version, stream=True, decode=True,
+                                             auth_config=self.auth_config(repository)):
+            if (cancel is not None and cancel.is_set()):
+                raise BuildError("Cancelled.")
+
+            if ("error" in event):
+                raise BuildError(event["error"], event.get("errorDetail", {}).get("message", event["error"]))
+
+            if ("aux" in event and "Digest" in event["aux"]):
+                digest = event["aux"]["Digest"]
+
+            if ("id" in event and "status" in event):
+                detail = event.get("progressDetail") or {}
+                current, total, _ = layers.get(event["id"], (0, 0, ""))
+                layers[event["id"]] = (detail.get("current", current), detail.get("total", total), event["status"])
+                self._report(tag, ImagePusher.summarize(layers))
+
+        return digest
+
+    def _report(self, tag: str, message: str) -> None:
+        if (self.on_progress is not None):
+            self.on_progress(tag, message)
+
+    @staticmethod
+    def summarize(layers: Dict[str, Tuple[int, int, str]]) -> str:
+        """ Summarizes the layers of a push, e.g. '3/5 layers, 12.1/40.0 MB'. """
+        done = len([layer for layer in layers.values() if layer[2] in ["Pushed", "Layer already exists"]])
+        current = sum(layer[0] for layer in layers.values()) / 1e6
+        total = sum(layer[1] for layer in layers.values()) / 1e6
+        return f"{done}/{len(layers)} layers, {current:.1f}/{total:.1f} MB"
+
+    @staticmethod
+    def is_transient(message: str) -> bool:
+        message = message.lower()
+        return any(fragment in message for fragment in ImagePusher.transient_errors)
@@ -0,0 +1,88 @@
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+class ReadinessResult:
+    states: list = ["waiting", "ready", "failed", "timeout"]
+
+    def __init__(self, component: str, timeout: float) -> None:
+        self.component: str = component
+        self.timeout: float = timeout
+        self.state: str = "waiting"
+        self.elapsed: Optional[float] = None
+        self.details: str = ""
+
+class ReadinessTracker:
+    """
+    Tracks which components of a tier are ready, each with its own timeout counted from when the tracker is created.
+    Waiters report what they observe through 'update', and call 'expire' to time out the components past their
+    deadline.
+    """
+
+    def __init__(self, timeouts: Dict[str, float], on_change: Callable[[ReadinessResult], None] = None) -> None:
+        self.start = time.monotonic()
+        self.results: Dict[str, ReadinessResult] = {id: ReadinessResult(id, timeout) for id, timeout in timeouts.items()}
+        self.on_change = on_change
+        self._lock = threading.Lock()
+
+    def pending(self) -> List[str]:
+        return [id for id, result in self.results.items() if result.state == "waiting"]
+
+    def update(self, id: str, ready: bool, details: str = "", failed: bool = False) -> None:
+        """ Records the latest state of a component. Components that are done are never updated again. """
+        with self._lock:
+            result = self.results[id]
+            if (result.state != "waiting"):
+                return
+
+            result.details = details
+            if (ready or failed):
+                result.state = "ready" if ready else "failed"
+                result.elapsed = time.monotonic() - self.start
+
+        if (self.on_change is not None and result.state != "waiting"):
+            self.on_change(result)
+
+    def remaining(self) -> float:
+        """ Returns the seconds left until the earliest deadline of the pending components. """
+        now = time.monotonic()
+        return min((self.start + self.results[id].timeout - now for id in self.pending()), default=0)
+
+    def expire(self) -> None:
+        now = time.monotonic()
+        for id in self.pending():
+            result = self.results[id]
+            if (now < self.start + result.timeout):
+                continue
+
+            with self._lock:
+                if (result.state != "waiting"):
+                    continue
+
+                result.state = "timeout"
+                result.elapsed = now - self.start
+
+                if (self.on_change is not None):
+                    self.on_change(result)
+
+    def failed(self) -> List[ReadinessResult]:
+        return [result for result in self.results.values() if result.state in ["failed", "timeout"]]
+
+def readiness_table(results: List[ReadinessResult], title: str = "Readiness"):
+    """ Returns a table with the state of each component and how long it took to become ready. """
+    from rich.table import Table
+
+    styles = {"ready": "green", "failed": "red", "timeout": "red", "waiting": "yellow"}
+
+    table = Table(title=title)
+    table.add_column("Component")
+    table.add_column("State")
+    table.add_column("Ready after", justify="right")
+    table.add_column("Details", style="bright_black")
+
+    for result in results:
+        style = styles[result.state]
+        elapsed = f"{result.elapsed:.1f}s" if result.state == "ready" and result.elapsed is not None else "-"
+        table.add_row(result.component, f"[{style}]{result.state}[/{style}]", elapsed, result.details)
+
+    return table
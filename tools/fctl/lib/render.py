@@ -0,0 +1,324 @@
+import copy
+import hashlib
+import json
+import os
+from typing import List, Optional, Tuple
+
+from lib.builder import ImageBuilder
+from lib.component import Component
+from lib.configuration import Configuration
+from lib.directories import RENDER_DIR, ROOT_DIR
+
+class RenderedFile:
+    def __init__(self, path: str, digest: str, changed: bool, component: Optional[Component] = None) -> None:
+        self.path: str = path
+        self.digest: str = digest
+        self.changed: bool = changed
+        self.component: Optional[Component] = component
+
+    def __str__(self) -> str:
+        return self.path
+
+def render_dir(environment: Optional[str] = None) -> str:
+    """ Returns the directory the files of an environment are rendered to. """
+    return RENDER_DIR if environment is None else os.path.join(RENDER_DIR, "environments", environment)
+
+class RenderedState:
+    """ Remembers the content hash of the last rendered file successfully deployed for each component. """
+
+    def __init__(self, path: str = os.path.join(RENDER_DIR, "applied.json")) -> None:
+        self.path = path
+        try:
+            with open(path) as f:
+                self.digests: dict = json.load(f)
+        except (OSError, ValueError):
+            self.digests = {}
+
+    @staticmethod
+    def of(environment: Optional[str]) -> "RenderedState":
+        return RenderedState(os.path.join(render_dir(environment), "applied.json"))
+
+    def get(self, id: str) -> Optional[str]:
+        return self.digests.get(id)
+
+    def set(self, id: str, digest: str) -> None:
+        self.digests[id] = digest
+
+    def clear(self, ids: Optional[List[str]] = None) -> None:
+        """ Forgets the given components, or every component when none are given. """
+        self.digests = {} if ids is None else {id: digest for id, digest in self.digests.items() if id not in ids}
+        self.save()
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "w") as f:
+            json.dump(self.digests, f)
+
+class Renderer:
+    """
+    Generates the Docker Compose file and the Kubernetes manifests of every component from the configuration.
+    Files are only written when their content changes, so their modification times can be trusted by later steps.
+
+    Hand-written files are used as a base: the 'docker-compose.yml' service and the manifest of each component keep
+    what the configuration doesn't describe, such as environment variables, secrets and volumes, while images,
+    replicas, labels and ports come from the configuration.
+    """
+
+    # Compose service keys generated from the configuration. Every other key is kept from 'docker-compose.yml'.
+    generated_keys: list = ["hostname", "build", "image", "expose", "labels", "deploy", "depends_on"]
+
+    def __init__(self, configuration: Configuration, output: str,
+                 compose_file: str = os.path.join(ROOT_DIR, "docker-compose.yml"), username: Optional[str] = None) -> None:
+        self.configuration = configuration
+        self.output = output
+        self.compose_file = compose_file
+        # Images are rendered under this username when there is no registry, so rendering never needs credentials.
+        self.username = username or configuration.settings["image_namespace"]
+
+    def compose_path(self) -> str:
+        return os.path.join(self.output, "docker-compose.yml")
+
+    def kubernetes_path(self, component: Component) -> str:
+        return os.path.join(self.output, "kubernetes", component.id + ".yml")
+
+    def image(self, component: Component) -> str:
+        """ Returns the image of the component, tagged as 'kubernetes build' tags it unless it is set explicitly. """
+        if (component.image is not None):
+            return component.image
+        return ImageBuilder(self.configuration, True).tag(component, self.username)
+
+    def labels(self, component: Component) -> dict:
+        return {
+            "io.foundation.api": self.configuration.api,
+            "io.foundation." + component.type: component.name,
+        }
+
+    def source_compose(self) -> dict:
+        """ Returns the hand-written Compose file, with its relative host paths made absolute. """
+        import yaml
+
+        try:
+            with open(self.compose_file) as f:
+                data = yaml.safe_load(f) or {}
+        except OSError:
+            return {}
+
+        # The rendered file lives elsewhere, so paths relative to the hand-written one would point to the wrong place.
+        directory = os.path.dirname(os.path.abspath(self.compose_file))
+        for service in (data.get("services") or {}).values():
+            env_file = service.get("env_file")
+            if (isinstance(env_file, str)):
+                service["env_file"] = os.path.join(directory, env_file)
+            elif (isinstance(env_file, list)):
+                service["env_file"] = [os.path.join(directory, file) if isinstance(file, str)
+                                       else {**file, "path": os.path.join(directory, file["path"])}
+                                       for file in env_file]
+
+            volumes = []
+            for volume in service.get("volumes") or []:
+                if (isinstance(volume, str) and volume.startswith(".")):
+                    volume = os.path.join(directory, volume)
+                elif (isinstance(volume, dict) and volume.get("type") == "bind"
+                      and str(volume.get("source", "")).startswith(".")):
+                    volume = {**volume, "source": os.path.join(directory, volume["source"])}
+                volumes.append(volume)
+            if (volumes):
+                service["volumes"] = volumes
+
+        return data
+
+    def compose(self) -> dict:
+        """ Returns the Docker Compose definition of all components. """
+        source = self.source_compose()
+        sources = source.get("services") or {}
+        services = {}
+
+        for component in self.configuration.components:
+            service = {"hostname": component.service_name}
+
+            if (component.build.platforms.build_on_compose):
+                # Absolute, since the rendered file isn't next to the sources.
+                service["build"] = {
+                    "context": os.path.normpath(os.path.join(ROOT_DIR, component.build.context)),
+                    "dockerfile": component.build.dockerfile,
+                }
+
+                if (component.build.target is not None):
+                    service["build"]["target"] = component.build.target
+                if (component.build.args):
+                    service["build"]["args"] = dict(component.build.args)
+
+                # Compose builds with BuildKit, so caches use the same values as buildx.
+                builder = ImageBuilder(self.configuration, True)
+                cache_from = builder.cache_from(component, self.image(component))
+                cache_to = builder.cache_to(component)
+                if (cache_from):
+                    service["build"]["cache_from"] = cache_from
+                if (cache_to):
+                    service["build"]["cache_to"] = cache_to
+
+                # Images are only tagged for pushing when the component is set to push on Compose mode.
+                if (component.build.platforms.push_on_compose or component.image is not None):
+                    service["image"] = self.image(component)
+            else:
+                service["image"] = self.image(component)
+
+            if (component.ports):
+                service["expose"] = [str(port.container_port) for port in component.ports]
+
+            service["labels"] = self.labels(component)
+
+            if (component.replicas != 1):
+                service["deploy"] = {"replicas": component.replicas}
+
+            dependencies = [self.configuration.get_by_id(id).service_name for id in component.depends_on]
+            if (dependencies):
+                service["depends_on"] = dependencies
+
+            for key, value in (sources.get(component.service_name) or {}).items():
+                if (key not in self.generated_keys):
+                    service[key] = value
+
+            services[component.service_name] = service
+
+        # Named volumes, networks, configs and secrets declared at the top level are used by the services kept above.
+        rendered = {key: value for key, value in source.items() if key not in ["services", "version"]}
+        rendered["services"] = services
+        return rendered
+
+    def source_manifests(self, component: Component) -> List[dict]:
+        """ Returns the documents of the hand-written manifest of a component, or none when it doesn't exist. """
+        import yaml
+
+        try:
+            with open(os.path.join(ROOT_DIR, component.path)) as f:
+                return [document for document in yaml.safe_load_all(f) if document]
+        except OSError:
+            return []
+
+    def kubernetes(self, component: Component) -> List[dict]:
+        """
+        Returns the manifests of a component: its hand-written manifest, with the image, replicas, labels and ports
+        of the configuration merged in, or a generated Service and Deployment when there is none.
+        """
+        generated = self.generate_kubernetes(component)
+        manifests = copy.deepcopy(self.source_manifests(component))
+        if (not manifests):
+            return generated
+
+        labels = self.labels(component)
+        kinds = [manifest.get("kind") for manifest in manifests]
+
+        for manifest in manifests:
+            manifest.setdefault("metadata", {}).setdefault("labels", {}).update(labels)
+
+            if (manifest.get("kind") == "Service"):
+                ports = manifest.setdefault("spec", {}).setdefault("ports", [])
+                known = [port.get("port") for port in ports]
+                ports += [port for port in generated[0]["spec"]["ports"] if port["port"] not in known] if component.ports else []
+
+            elif (manifest.get("kind") == "Deployment"):
+                spec = manifest.setdefault("spec", {})
+                spec["replicas"] = component.replicas
+
+                template = spec.setdefault("template", {})
+                template.setdefault("metadata", {}).setdefault("labels", {}).update(labels)
+
+                # The first container runs the image of the component; sidecars are left alone.
+                containers = template.setdefault("spec", {}).setdefault("containers", [])
+                if (containers):
+                    container = containers[0]
+                    container["image"] = self.image(component)
+
+                    container_ports = container.setdefault("ports", [])
+                    known = [port.get("containerPort") for port in container_ports]
+                    container_ports += [{"containerPort": port.container_port} for port in component.ports
+                                        if port.container_port not in known]
+                    if (not container_ports):
+                        del container["ports"]
+
+        # Objects the hand-written manifest lacks are generated.
+        if (component.ports and "Service" not in kinds):
+            manifests.insert(0, generated[0])
+        if (not any(kind in ["Deployment", "StatefulSet", "DaemonSet"] for kind in kinds)):
+            manifests.append(generated[-1])
+
+        return manifests
+
+    def generate_kubernetes(self, component: Component) -> List[dict]:
+        """ Returns the Service and Deployment manifests of a component, generated from the configuration alone. """
+        labels = self.labels(component)
+        selector = {"io.foundation." + component.type: component.name}
+
+        manifests = []
+        if (component.ports):
+            manifests.append({
+                "apiVersion": "v1",
+                "kind": "Service",
+                "metadata": {"name": component.service_name, "labels": labels},
+                "spec": {
+                    "selector": selector,
+                    "ports": [{"name": f"port-{port.expose}", "protocol": "TCP", "port": port.expose,
+                               "targetPort": port.container_port} for port in component.ports],
+                },
+            })
+
+        container = {"name": component.service_name + "-pod", "image": self.image(component)}
+        if (component.ports):
+            container["ports"] = [{"containerPort": port.container_port} for port in component.ports]
+
+        manifests.append({
+            "apiVersion": "apps/v1",
+            "kind": "Deployment",
+            "metadata": {"name": component.service_name + "-deployment", "labels": labels},
+            "spec": {
+                "replicas": component.replicas,
+                "selector": {"matchLabels": selector},
+                "template": {
+                    "metadata": {"labels": dict(labels)},
+                    "spec": {"containers": [container]},
+                },
+            },
+        })
+
+        return manifests
+
+    def render(self, compose: bool = True, kubernetes: bool = True) -> List[RenderedFile]:
+        """ Writes the generated files. Returns every file, flagging the ones whose content changed. """
+        import yaml
+
+        files = []
+
+        if (compose):
+            content = yaml.safe_dump(self.compose(), sort_keys=False)
+            files.append(RenderedFile(self.compose_path(), *Renderer.write(self.compose_path(), content)))
+
+        if (kubernetes):
+            for component in self.configuration.components:
+                path = self.kubernetes_path(component)
+                content = yaml.safe_dump_all(self.kubernetes(component), sort_keys=False)
+                files.append(RenderedFile(path, *Renderer.write(path, content), component))
+
+        return files
+
+    @staticmethod
+    def write(path: str, content: str) -> Tuple[str, bool]:
+        """ Writes the file unless it already has the same content. Returns its content hash and whether it was written. """
+        data = content.encode()
+        digest = hashlib.sha256(data).hexdigest()
+
+        try:
+            with open(path, "rb") as f:
+                if (hashlib.sha256(f.read()).hexdigest() == digest):
+                    return digest, False
+        except OSError:
+            pass
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        temporary = path + ".tmp"
+        with open(temporary, "wb") as f:
+            f.write(data)
+        os.replace(temporary, path)
+
+        return digest, True
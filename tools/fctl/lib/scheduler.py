@@ -0,0 +1,225 @@
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional, Tuple
+
+from lib.component import Component
+from lib.trace import tracer
+
+class BuildResult:
+    states: list = ["pending", "building", "built", "pushing", "pushed", "failed", "cancelled"]
+
+    def __init__(self, component: Component, push: bool) -> None:
+        self.component: Component = component
+        self.push: bool = push
+        self.state: str = "pending"
+        self.error: Optional[str] = None
+
+    def __str__(self) -> str:
+        return self.component.id + " (" + self.state + ")"
+
+class BuildError(Exception):
+    """ Raised by a build or push step to report a failure. Carries the step output to be shown to the user. """
+
+    def __init__(self, message: str, output: str = "") -> None:
+        super().__init__(message)
+        self.output = output
+
+class BuildFailedError(Exception):
+    """ Raised by the scheduler once every running step has stopped after a failure. """
+
+    def __init__(self, failed: BuildResult, results: List[BuildResult]) -> None:
+        super().__init__("Failed to build " + failed.component.id + ".")
+        self.failed: BuildResult = failed
+        self.results: List[BuildResult] = results
+
+Step = Callable[[Component, threading.Event], None]
+
+class BuildScheduler:
+    """
+    Builds components concurrently on a pool of workers. A component is only built after every component listed in
+    its 'depends_on' has been built, and its push is started as soon as its own build finishes, so uploads overlap
+    with the remaining builds. When any step fails, no new steps are started and running ones are cancelled.
+    """
+
+    def __init__(self, build: Step, push: Step, jobs: int = 1,
+                 on_progress: Callable[[BuildResult], None] = None, push_jobs: int = None) -> None:
+        if (jobs < 1 or (push_jobs is not None and push_jobs < 1)):
+            raise ValueError("The number of jobs must be at least 1.")
+
+        self.build = build
+        self.push = push
+        self.jobs = jobs
+        self.push_jobs = push_jobs or jobs
+        self.on_progress = on_progress
+
+        self.cancel = threading.Event()
+        self._lock = threading.Lock()
+
+    def run(self, components: List[Component], push: Callable[[Component], bool] = lambda _: True,
+            units: List[List[Component]] = None) -> List[BuildResult]:
+        """
+        Builds (and pushes) the given components. Returns the results in the same order as the components.
+
+        Components in the same unit are built one after the other on a single worker, once the dependencies of all
+        of them have been built, so a build step that builds the whole unit at once never waits for its dependencies
+        or holds other workers. Other components are units of their own.
+        """
+        results = {component.id: BuildResult(component, push(component)) for component in components}
+
+        # Only dependencies that are part of this run are waited for.
+        waiting = {component.id: set(d for d in component.depends_on if d in results) for component in components}
+        dependents: Dict[str, List[str]] = {component.id: [] for component in components}
+        for id, dependencies in waiting.items():
+            for dependency in dependencies:
+                dependents[dependency].append(id)
+
+        self._check_cycles(waiting, dependents)
+
+        unit_of: Dict[str, Tuple[str, ...]] = {}
+        for unit in units or []:
+            members = set(component.id for component in unit)
+            ids = tuple(component.id for component in components if component.id in members)
+            for id in ids:
+                unit_of[id] = ids
+        for component in components:
+            unit_of.setdefault(component.id, (component.id,))
+            waiting[component.id] -= set(unit_of[component.id])
+
+        build_pool = ThreadPoolExecutor(max_workers=self.jobs, thread_name_prefix="fctl-build")
+        push_pool = ThreadPoolExecutor(max_workers=self.push_jobs, thread_name_prefix="fctl-push")
+        running: Dict[Future, Tuple[str, List[BuildResult]]] = {}
+        submitted = set()
+        failed: Optional[BuildResult] = None
+
+        def submit(pool: ThreadPoolExecutor, kind: str, unit: List[BuildResult]) -> None:
+            step = self.build if kind == "build" else self.push
+            running[pool.submit(self._run_unit, step, kind, unit)] = (kind, unit)
+
+        def ready(id: str) -> None:
+            unit = unit_of[id]
+            if (unit not in submitted and not any(waiting[member] for member in unit)):
+                submitted.add(unit)
+                submit(build_pool, "build", [results[member] for member in unit])
+
+        try:
+            for id in waiting:
+                ready(id)
+
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    kind, unit = running.pop(future)
+
+                    if (future.cancelled()):
+                        for result in unit:
+                            self._update(result, "cancelled")
+                        continue
+
+                    failure = future.result()
+                    if (failure is not None):
+                        result, error = failure
+                        index = unit.index(result)
+
+                        # Components of the unit built before the failing one keep their images.
+                        for other in unit[:index] if kind == "build" else []:
+                            self._update(other, "built")
+
+                        if (failed is not None):
+                            # Steps that were terminated because of an earlier failure.
+                            self._update(result, "cancelled")
+                        else:
+                            result.error = getattr(error, "output", None) or str(error)
+                            self._update(result, "failed")
+
+                            failed = result
+                            self._stop(running)
+
+                        for other in unit[index + 1:]:
+                            self._update(other, "cancelled")
+                        continue
+
+                    if (self.cancel.is_set()):
+                        # Steps that completed after a failure keep their result, but nothing is started after them.
+                        for result in unit:
+                            self._update(result, "built" if kind == "build" else "pushed")
+                        continue
+
+                    if (kind == "push"):
+                        self._update(unit[0], "pushed")
+                        continue
+
+                    for result in unit:
+                        self._update(result, "built")
+                        if (result.push):
+                            submit(push_pool, "push", [result])
+
+                    for result in unit:
+                        for dependent in dependents[result.component.id]:
+                            waiting[dependent].discard(result.component.id)
+                            ready(dependent)
+        except BaseException:
+            # Interrupted (e.g. Ctrl+C): make running steps terminate their processes before leaving.
+            self._stop(running)
+            wait(running)
+            raise
+        finally:
+            build_pool.shutdown(wait=True, cancel_futures=True)
+            push_pool.shutdown(wait=True, cancel_futures=True)
+
+        for result in results.values():
+            if (result.state == "pending"):
+                self._update(result, "cancelled")
+
+        ordered = [results[component.id] for component in components]
+        if (failed is not None):
+            raise BuildFailedError(failed, ordered)
+
+        return ordered
+
+    def _run_unit(self, step: Step, kind: str, unit: List[BuildResult]) -> Optional[Tuple[BuildResult, Exception]]:
+        """ Runs the step for each component of the unit in order. Returns the component that failed, with its error. """
+        for result in unit:
+            try:
+                self._run_step(step, kind, result)
+            except Exception as error:
+                return result, error
+
+        return None
+
+    def _run_step(self, step: Step, kind: str, result: BuildResult) -> None:
+        if (self.cancel.is_set()):
+            raise BuildError("Cancelled.")
+
+        self._update(result, "building" if kind == "build" else "pushing")
+        with tracer.span(kind + " " + result.component.id, kind, component=result.component.id):
+            step(result.component, self.cancel)
+
+    def _stop(self, running: Dict[Future, Tuple[str, BuildResult]]) -> None:
+        self.cancel.set()
+        for future in running:
+            future.cancel()
+
+    def _update(self, result: BuildResult, state: str) -> None:
+        with self._lock:
+            result.state = state
+            if (self.on_progress is not None):
+                self.on_progress(result)
+
+    @staticmethod
+    def _check_cycles(waiting: Dict[str, set], dependents: Dict[str, List[str]]) -> None:
+        remaining = {id: len(dependencies) for id, dependencies in waiting.items()}
+        ready = [id for id, count in remaining.items() if count == 0]
+        visited = 0
+
+        while ready:
+            id = ready.pop()
+            visited += 1
+            for dependent in dependents[id]:
+                remaining[dependent] -= 1
+                if (remaining[dependent] == 0):
+                    ready.append(dependent)
+
+        if (visited != len(waiting)):
+            cyclic = ", ".join(sorted(id for id, count in remaining.items() if count > 0))
+            raise ValueError("Circular 'depends_on' between components: " + cyclic + ".")
@@ -1,10 +1,125 @@
+import os
 import subprocess
-from typing import List, Tuple
+import threading
+import time
+from collections import deque
+from typing import IO, Callable, Deque, Dict, List, Optional, Tuple
+
+from lib.trace import tracer
+
+class ShellTimeoutError(Exception):
+    def __init__(self, cmd: List[str], timeout: float, output: str, error: str) -> None:
+        super().__init__(f"Command '{' '.join(cmd)}' timed out after {timeout} seconds.")
+        self.cmd = cmd
+        self.timeout = timeout
+        self.output = output
+        self.error = error
 
 class Shell:
+    # Number of lines kept from each stream of a command, returned for error reporting.
+    tail_lines: int = 200
+
+    # Seconds a command gets to exit after being asked to terminate, before it is killed.
+    grace_period: float = 5
+
+    @staticmethod
+    def execute(cmd: List[str], *args, cwd: str = None, env: Dict[str, str] = None, cancel: threading.Event = None,
+                timeout: float = None, on_output: Callable[[str], None] = None) -> Tuple[int, str, str]:
+        """
+        Runs a command, streaming its stdout and stderr line by line to 'on_output' as they are written.
+        Returns the exit code and the last lines of stdout and stderr. The command is terminated when 'cancel' is set,
+        and a ShellTimeoutError is raised if it runs for longer than 'timeout' seconds.
+        """
+        with tracer.span(" ".join(cmd[:3]), "shell", cmd=" ".join(cmd), cwd=cwd) as span:
+            code, output, error, sizes = Shell._execute(cmd, *args, cwd=cwd, env=env, cancel=cancel, timeout=timeout,
+                                                        on_output=on_output)
+            span.attributes.update(code=code, stdin_bytes=len("".join(args).encode()), stdout_bytes=sizes[0],
+                                   stderr_bytes=sizes[1])
+
+        return code, output, error
+
+    @staticmethod
+    def _execute(cmd: List[str], *args, cwd: str = None, env: Dict[str, str] = None, cancel: threading.Event = None,
+                 timeout: float = None, on_output: Callable[[str], None] = None) -> Tuple[int, str, str, List[int]]:
+        environment = {**os.environ, **env} if env else None
+        stdin = subprocess.PIPE if args else subprocess.DEVNULL
+
+        step = subprocess.Popen(cmd, cwd=cwd, env=environment, stdin=stdin,
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+        output: Deque[str] = deque(maxlen=Shell.tail_lines)
+        error: Deque[str] = deque(maxlen=Shell.tail_lines)
+        sizes = [0, 0]
+
+        threads = [
+            threading.Thread(target=Shell._read, args=(step.stdout, output, on_output, sizes, 0), daemon=True),
+            threading.Thread(target=Shell._read, args=(step.stderr, error, on_output, sizes, 1), daemon=True),
+        ]
+        if (args):
+            threads.append(threading.Thread(target=Shell._write, args=(step.stdin, "".join(args)), daemon=True))
+
+        for thread in threads:
+            thread.start()
+
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        timed_out = False
+
+        try:
+            while True:
+                try:
+                    step.wait(timeout=0.1)
+                    break
+                except subprocess.TimeoutExpired:
+                    pass
+
+                if (cancel is not None and cancel.is_set()):
+                    Shell._stop(step)
+                    break
+
+                if (deadline is not None and time.monotonic() > deadline):
+                    Shell._stop(step)
+                    timed_out = True
+                    break
+        except BaseException:
+            # Never leave the command running behind us (e.g. on Ctrl+C).
+            Shell._stop(step)
+            raise
+        finally:
+            for thread in threads:
+                thread.join()
+
+        if (timed_out):
+            raise ShellTimeoutError(cmd, timeout, "\n".join(output), "\n".join(error))
+
+        return step.returncode, "\n".join(output), "\n".join(error), sizes
+
+    @staticmethod
+    def _read(stream: IO[bytes], tail: Deque[str], on_output: Optional[Callable[[str], None]], sizes: List[int],
+              index: int) -> None:
+        with stream:
+            for raw in iter(stream.readline, b""):
+                sizes[index] += len(raw)
+                line = raw.decode(errors="replace").rstrip("\r\n")
+                tail.append(line)
+                if (on_output is not None):
+                    on_output(line)
+
     @staticmethod
-    def execute(cmd: List[str], *args, cwd: str = None) -> Tuple[int, str, str]:
-        step = subprocess.Popen(cmd, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        step.wait()
-        output, error = step.communicate(args)
-        return step.returncode, output, error
\ No newline at end of file
+    def _write(stream: IO[bytes], data: str) -> None:
+        try:
+            with stream:
+                stream.write(data.encode())
+        except BrokenPipeError:
+            pass
+
+    @staticmethod
+    def _stop(step: subprocess.Popen) -> None:
+        if (step.poll() is not None):
+            return
+
+        step.terminate()
+        try:
+            step.wait(timeout=Shell.grace_period)
+        except subprocess.TimeoutExpired:
+            step.kill()
+            step.wait()
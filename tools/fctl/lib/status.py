@@ -0,0 +1,124 @@
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+class StatusRow:
+    def __init__(self, component: str, kind: str, name: str, state: str, details: str = "",
+                 healthy: Optional[bool] = None) -> None:
+        self.component: str = component
+        self.kind: str = kind
+        self.name: str = name
+        self.state: str = state
+        self.details: str = details
+        self.healthy: Optional[bool] = healthy
+
+Watcher = Callable[["StatusBoard", threading.Event], None]
+
+class StatusBoard:
+    """
+    Holds the latest state of every object of a deployment and renders it as a single table. Rows are replaced in
+    bulk from a snapshot, or one by one from watch streams running on background threads.
+    """
+
+    kinds: list = ["service", "deployment", "pod", "container"]
+
+    def __init__(self, title: str, components: Optional[List[str]] = None) -> None:
+        self.title = title
+        self.components = components
+        self.rows: Dict[Tuple[str, str], StatusRow] = {}
+        self.changed = threading.Event()
+        self._lock = threading.Lock()
+
+    def replace(self, kind: str, rows: List[StatusRow]) -> None:
+        """ Replaces every row of a kind, e.g. with the result of a list call. """
+        with self._lock:
+            self.rows = {key: row for key, row in self.rows.items() if key[0] != kind}
+            for row in rows:
+                if (self.shows(row)):
+                    self.rows[(kind, row.name)] = row
+
+        self.changed.set()
+
+    def update(self, kind: str, name: str, row: Optional[StatusRow]) -> None:
+        """ Updates a single row, or removes it when 'row' is None. """
+        with self._lock:
+            if (row is None or not self.shows(row)):
+                self.rows.pop((kind, name), None)
+            else:
+                self.rows[(kind, name)] = row
+
+        self.changed.set()
+
+    def shows(self, row: StatusRow) -> bool:
+        """ Returns whether a row belongs to the selected components, if only some of them are shown. """
+        return self.components is None or row.component in self.components
+
+    def table(self):
+        from rich.table import Table
+
+        table = Table(title=self.title)
+        table.add_column("Component")
+        table.add_column("Kind")
+        table.add_column("Name")
+        table.add_column("Status")
+        table.add_column("Details", style="bright_black")
+
+        with self._lock:
+            rows = sorted(self.rows.values(), key=lambda row: (row.component, StatusBoard._kind_order(row.kind), row.name))
+
+        for row in rows:
+            style = {True: "green", False: "red", None: "yellow"}[row.healthy]
+            table.add_row(row.component, row.kind, row.name, f"[{style}]{row.state}[/{style}]", row.details)
+
+        return table
+
+    def watch(self, console, watchers: List[Watcher]) -> None:
+        """
+        Runs the watchers on background threads and redraws the table whenever a row changes, until Ctrl+C. In JSON
+        mode, changed rows are reported as events instead.
+        """
+        from rich.live import Live
+
+        stop = threading.Event()
+        for watcher in watchers:
+            threading.Thread(target=watcher, args=(self, stop), daemon=True).start()
+
+        try:
+            if (console.json):
+                # Rows are reported as they change instead of redrawing the table.
+                reported = {}
+                while True:
+                    reported = self.report(console, reported)
+                    self.changed.wait(timeout=0.5)
+                    self.changed.clear()
+
+            with Live(self.table(), console=console, refresh_per_second=4) as live:
+                while True:
+                    if (self.changed.wait(timeout=0.5)):
+                        self.changed.clear()
+                        live.update(self.table())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            stop.set()
+
+    def report(self, console, reported: Dict[Tuple[str, str], tuple]) -> Dict[Tuple[str, str], tuple]:
+        """ Emits a 'status' event for every row that changed since the last report. Returns the rows reported. """
+        with self._lock:
+            rows = dict(self.rows)
+
+        current = {key: (row.component, row.state, row.details, row.healthy) for key, row in rows.items()}
+        for key, state in current.items():
+            if (reported.get(key) != state):
+                component, status, details, healthy = state
+                console.emit({"event": "status", "component": component, "kind": key[0], "name": key[1],
+                              "status": status, "details": details or None, "healthy": healthy})
+
+        for key in reported.keys() - current.keys():
+            console.emit({"event": "status", "component": reported[key][0], "kind": key[0], "name": key[1],
+                          "status": "deleted"})
+
+        return current
+
+    @staticmethod
+    def _kind_order(kind: str) -> int:
+        return StatusBoard.kinds.index(kind) if kind in StatusBoard.kinds else len(StatusBoard.kinds)
@@ -0,0 +1,130 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+class Span:
+    def __init__(self, name: str, category: str, attributes: Dict[str, Any]) -> None:
+        self.name: str = name
+        self.category: str = category
+        self.attributes: Dict[str, Any] = attributes
+        self.thread: int = threading.get_ident()
+        self.start: float = time.perf_counter()
+        self.end: Optional[float] = None
+
+    @property
+    def duration(self) -> float:
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+class Tracer:
+    """
+    Records timed spans of the steps of a run (commands, builds, pushes, applies and API calls) with their
+    attributes, such as exit codes and byte counts. It is disabled by default, in which case spans are not kept.
+    Recorded spans can be summarized as a table, or written as a Chrome trace to be opened in chrome://tracing or
+    Perfetto and compared between runs.
+    """
+
+    def __init__(self) -> None:
+        self.enabled: bool = False
+        self.spans: List[Span] = []
+        self.threads: Dict[int, str] = {}
+        self.origin: float = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def enable(self) -> None:
+        self.enabled = True
+
+    def begin(self, name: str, category: str, **attributes) -> Span:
+        return Span(name, category, attributes)
+
+    def finish(self, span: Span) -> None:
+        span.end = time.perf_counter()
+        if (not self.enabled):
+            return
+
+        with self._lock:
+            self.spans.append(span)
+            self.threads.setdefault(span.thread, threading.current_thread().name)
+
+    @contextmanager
+    def span(self, name: str, category: str, **attributes) -> Iterator[Span]:
+        """ Times the enclosed block. Attributes can be added to the yielded span until the block ends. """
+        span = self.begin(name, category, **attributes)
+        try:
+            yield span
+        except Exception as error:
+            span.attributes["error"] = type(error).__name__
+            raise
+        finally:
+            self.finish(span)
+
+    def wrap(self, target: Any, method: str, category: str, name: Callable[..., str],
+             attributes: Callable[[Any], Dict[str, Any]] = None) -> None:
+        """
+        Replaces a method of an object with one that records a span around each call. 'name' gets the arguments of
+        the call, and 'attributes' its result.
+        """
+        function = getattr(target, method)
+
+        @wraps(function)
+        def traced(*args, **kwargs):
+            with self.span(name(*args, **kwargs), category) as span:
+                result = function(*args, **kwargs)
+                if (attributes is not None):
+                    span.attributes.update(attributes(result))
+
+                return result
+
+        setattr(target, method, traced)
+
+    def write(self, path: str) -> None:
+        """ Writes the recorded spans in the Chrome trace event format. """
+        pid = os.getpid()
+
+        events = [{"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+                  for tid, name in self.threads.items()]
+
+        for span in sorted(self.spans, key=lambda span: span.start):
+            events.append({
+                "name": span.name,
+                "cat": span.category,
+                "ph": "X",
+                "ts": round((span.start - self.origin) * 1e6),
+                "dur": round(span.duration * 1e6),
+                "pid": pid,
+                "tid": span.thread,
+                "args": span.attributes,
+            })
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, default=str)
+
+    def summary(self):
+        """ Returns a table with the count, total and longest duration of the spans of each category and name. """
+        from rich.table import Table
+
+        groups: Dict[tuple, List[Span]] = {}
+        for span in self.spans:
+            groups.setdefault((span.category, span.name), []).append(span)
+
+        table = Table(title="Trace")
+        table.add_column("Category")
+        table.add_column("Span")
+        table.add_column("Count", justify="right")
+        table.add_column("Total", justify="right")
+        table.add_column("Max", justify="right")
+        table.add_column("Errors", justify="right")
+
+        for (category, name), spans in sorted(groups.items(), key=lambda group: -sum(s.duration for s in group[1])):
+            errors = len([span for span in spans if "error" in span.attributes or span.attributes.get("code")])
+            table.add_row(category, name, str(len(spans)), f"{sum(span.duration for span in spans):.3f}s",
+                          f"{max(span.duration for span in spans):.3f}s", f"[red]{errors}[/red]" if errors else "")
+
+        return table
+
+tracer = Tracer()
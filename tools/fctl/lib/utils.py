@@ -1,16 +1,43 @@
-from docker.errors import APIError
-from rich.prompt import Prompt
+import threading
+from typing import List, Optional
+import typer
+from typing_extensions import Annotated
 
+from lib.component import Component
+from lib.configuration import get_configuration
 from lib.console import console
 from lib.shell import Shell
+from lib.trace import tracer
 
-from platforms.compose.api import client
+# Component selectors shared by every command. Components are referenced by id, name or service name.
+Only = Annotated[Optional[List[str]], typer.Option("--only", help="Only acts on these components. Can be repeated or comma-separated.")]
+Except = Annotated[Optional[List[str]], typer.Option("--except", help="Leaves these components out. Can be repeated or comma-separated.")]
+WithDeps = Annotated[bool, typer.Option("--with-deps", help="Also selects what the selected components depend on.")]
+WithDependents = Annotated[bool, typer.Option("--with-dependents", help="Also selects the components that depend on the selected ones.")]
+
+# Environments defined under 'environments' in foundation.yml, whose overlays are merged over the base configuration.
+Environments = Annotated[Optional[str], typer.Option("--env", "-e", help="Environments to use, comma-separated, as defined under 'environments'.")]
 
 class Utils:
+    # Credentials of the registries logged into, by registry, to be passed to pushes as their 'auth_config'.
+    auth_configs: dict = {}
+
+    _credentials: dict = {}
+    _credentials_lock = threading.Lock()
+
     @staticmethod
     def login_to_registry(host: str = None) -> str:
-        """ Logs into the Docker registry. Returns the username used to login. """
+        """
+        Logs into the Docker registry with the first credentials found by the credential chain. Logins are reused
+        until 'login_ttl' runs out, without asking the registry again. Returns the username used to login.
+        """
+        from docker import auth
+        from docker.errors import APIError
+
+        from lib.credentials import LoginCache
+        from platforms.compose.api import get_client
 
+        configuration = get_configuration()
         registry_name = host or "Docker Hub"
 
         # Login to registry
@@ -19,20 +46,119 @@ class Utils:
         else:
             console.info("Using registry host at " + host + ".")
 
-        username = Prompt.ask("Enter your registry username: ", show_default=False)
-        password = Prompt.ask("Enter your registry password: ", show_default=False, password=True)
+        credentials = Utils.registry_credentials(host)
+
+        # The Docker client reads its config by itself, so those credentials need no login.
+        if (credentials.source == "docker config"):
+            console.done(f"Using the Docker credentials of {credentials.username} for {registry_name}.")
+            return credentials.username
+
+        cache = LoginCache(configuration.settings["login_ttl"])
+        key = host or auth.INDEX_NAME
+        auth_config = {"username": credentials.username, "password": credentials.password, "serveraddress": key}
+
+        if (cache.is_valid(key, credentials)):
+            Utils.auth_configs[key] = auth_config
+            console.done(f"Reusing the login of {credentials.username} to {registry_name}.")
+            return credentials.username
 
         with console.status("[bold blue]Logging in to registry...") as status:
             try:
-                client.login(username, password, registry=host)
+                with tracer.span("login " + registry_name, "login", source=credentials.source):
+                    get_client().login(credentials.username, credentials.password, registry=host)
             except APIError as error:
                 console.error("Failed to login to registry.")
                 console.error_panel(error.explanation)
                 exit(1)
-        
+
+        cache.record(key, credentials)
+        Utils.auth_configs[key] = auth_config
+
         if (host is None):
             console.done("Logged in to Docker Hub.")
         else:
             console.done("Logged in to registry at " + registry_name + ".")
 
-        return username
+        return credentials.username
+
+    @staticmethod
+    def registry_credentials(host: str = None):
+        """
+        Returns the credentials found by the credential chain for a registry, resolving them once per invocation so
+        the user is prompted at most once. Exits when there are none.
+        """
+        from lib.credentials import CredentialChain
+
+        with Utils._credentials_lock:
+            if (host not in Utils._credentials):
+                credentials = CredentialChain(host, get_configuration().settings["credentials_file"]).resolve()
+                if (credentials is None):
+                    console.error("No credentials found for " + (host or "Docker Hub") + ".")
+                    console.info(f"Set {CredentialChain.username_variable} and {CredentialChain.password_variable}, "
+                                 "login with 'docker login', or set 'credentials_file' in the settings.")
+                    exit(1)
+
+                Utils._credentials[host] = credentials
+
+            return Utils._credentials[host]
+
+    @staticmethod
+    def select_components(only: Optional[List[str]], exclude: Optional[List[str]] = None, with_deps: bool = False,
+                          with_dependents: bool = False) -> Optional[List[Component]]:
+        """
+        Resolves the components selected on the command line, in 'order'. Dependencies are the 'depends_on' of a
+        component, or else the tier before its own. Returns None when nothing was left out, meaning all.
+        """
+        if (not only and not exclude):
+            return None
+
+        configuration = get_configuration()
+        selected = Utils._resolve(only) if only else list(configuration.components)
+        selected = configuration.closure(selected, dependencies=with_deps, dependents=with_dependents)
+
+        excluded = Utils._resolve(exclude or [])
+        selected = [component for component in selected if component not in excluded]
+        if (not selected):
+            console.error("No components selected.")
+            exit(1)
+
+        return selected
+
+    @staticmethod
+    def select_environments(value: Optional[str]) -> List[Optional[str]]:
+        """ Resolves the environments given with --env. Returns [None], meaning the base configuration, when none were. """
+        names = list(dict.fromkeys(name.strip() for name in (value or "").split(",") if name.strip()))
+        if (not names):
+            return [None]
+
+        known = get_configuration().environments
+        for name in names:
+            if (name not in known):
+                console.error(f"Unknown environment '{name}'." + (f" Known environments: {', '.join(known)}." if known else ""))
+                exit(1)
+
+        return names
+
+    @staticmethod
+    def select_environment(value: Optional[str]) -> Optional[str]:
+        """ Resolves the environment of commands that act on a single one. """
+        environments = Utils.select_environments(value)
+        if (len(environments) > 1):
+            console.error("This command only takes one environment.")
+            exit(1)
+
+        return environments[0]
+
+    @staticmethod
+    def _resolve(references: List[str]) -> List[Component]:
+        configuration = get_configuration()
+        components = []
+        for reference in [part.strip() for value in references for part in value.split(",") if part.strip()]:
+            found = configuration.find(reference)
+            if (not found):
+                console.error(f"Unknown component '{reference}'.")
+                exit(1)
+
+            components += [component for component in found if component not in components]
+
+        return components
@@ -0,0 +1,183 @@
+import os
+import select
+import struct
+import time
+from typing import Dict, List, Set
+
+from lib.directories import CACHE_DIR
+
+# Directories that are never watched: fctl's own cache and version control metadata.
+IGNORED_DIRS = [CACHE_DIR]
+IGNORED_NAMES = [".git"]
+
+class FileWatcher:
+    """
+    Reports the files that change under a set of directories. Uses inotify on Linux, where changes are reported as
+    soon as they happen, and otherwise polls the modification times of every file.
+    """
+
+    def __init__(self, roots: List[str]) -> None:
+        self.roots = [os.path.abspath(root) for root in dict.fromkeys(roots)]
+
+    @staticmethod
+    def create(roots: List[str], interval: float = 1.0) -> "FileWatcher":
+        """ Returns an inotify watcher when the platform supports it, otherwise a polling one. """
+        try:
+            return InotifyWatcher(roots)
+        except OSError:
+            return PollingWatcher(roots, interval)
+
+    def changes(self, timeout: float) -> Set[str]:
+        """ Waits up to 'timeout' seconds for changes. Returns the absolute paths that changed, if any. """
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+    def walk(self, root: str):
+        for directory, directories, names in os.walk(root):
+            directories[:] = [d for d in directories
+                              if d not in IGNORED_NAMES and os.path.join(directory, d) not in IGNORED_DIRS]
+            yield directory, names
+
+class InotifyWatcher(FileWatcher):
+    """ Watches every directory under the roots with inotify, adding watches for directories created later. """
+
+    IN_MODIFY = 0x2
+    IN_ATTRIB = 0x4
+    IN_CLOSE_WRITE = 0x8
+    IN_MOVED_FROM = 0x40
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_Q_OVERFLOW = 0x4000
+    IN_IGNORED = 0x8000
+    IN_ISDIR = 0x40000000
+
+    mask: int = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    header = struct.Struct("iIII")
+
+    def __init__(self, roots: List[str]) -> None:
+        super().__init__(roots)
+
+        import ctypes
+        import ctypes.util
+
+        if (not hasattr(os, "O_NONBLOCK")):
+            raise OSError("inotify is not supported on this platform.")
+
+        try:
+            self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            self.libc.inotify_init1
+        except (OSError, AttributeError):
+            raise OSError("inotify is not supported on this platform.")
+
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if (self.fd < 0):
+            raise OSError(ctypes.get_errno(), "Failed to initialize inotify.")
+
+        self.directories: Dict[int, str] = {}
+        try:
+            for root in self.roots:
+                self.add(root)
+        except OSError:
+            self.close()
+            raise
+
+    def add(self, root: str) -> List[str]:
+        """ Watches a directory and every directory under it. Returns the files found, which may be new. """
+        import ctypes
+
+        files = []
+        for directory, names in self.walk(root):
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), self.mask)
+            if (wd < 0):
+                error = ctypes.get_errno()
+                # Directories may be deleted while being walked, but running out of watches is fatal.
+                if (error == 28):
+                    raise OSError(error, "Out of inotify watches. Raise fs.inotify.max_user_watches.")
+                continue
+
+            self.directories[wd] = directory
+            files += [os.path.join(directory, name) for name in names]
+
+        return files
+
+    def changes(self, timeout: float) -> Set[str]:
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if (not readable):
+            return set()
+
+        try:
+            data = os.read(self.fd, 1 << 16)
+        except BlockingIOError:
+            return set()
+
+        changed = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = self.header.unpack_from(data, offset)
+            name = data[offset + self.header.size:offset + self.header.size + length].rstrip(b"\0")
+            offset += self.header.size + length
+
+            if (mask & self.IN_Q_OVERFLOW):
+                # Events were dropped, so anything may have changed.
+                changed.update(self.roots)
+                continue
+
+            if (mask & self.IN_IGNORED):
+                self.directories.pop(wd, None)
+                continue
+
+            directory = self.directories.get(wd)
+            if (directory is None):
+                continue
+
+            path = os.path.join(directory, os.fsdecode(name)) if name else directory
+            if (mask & self.IN_ISDIR and mask & (self.IN_CREATE | self.IN_MOVED_TO)):
+                if (path not in IGNORED_DIRS and os.path.basename(path) not in IGNORED_NAMES):
+                    changed.update(self.add(path))
+
+            changed.add(path)
+
+        return changed
+
+    def close(self) -> None:
+        if (self.fd >= 0):
+            os.close(self.fd)
+            self.fd = -1
+
+class PollingWatcher(FileWatcher):
+    """ Compares the size and modification time of every file under the roots every 'interval' seconds. """
+
+    def __init__(self, roots: List[str], interval: float = 1.0) -> None:
+        super().__init__(roots)
+        self.interval = interval
+        self.state = self.scan()
+
+    def scan(self) -> Dict[str, tuple]:
+        state = {}
+        for root in self.roots:
+            for directory, names in self.walk(root):
+                for name in names:
+                    path = os.path.join(directory, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+
+                    state[path] = (stat.st_size, stat.st_mtime_ns)
+
+        return state
+
+    def changes(self, timeout: float) -> Set[str]:
+        deadline = time.monotonic() + timeout
+        while True:
+            time.sleep(max(0.0, min(self.interval, deadline - time.monotonic())))
+
+            state = self.scan()
+            changed = set(path for path in state.keys() | self.state.keys() if state.get(path) != self.state.get(path))
+            self.state = state
+
+            if (changed or time.monotonic() >= deadline):
+                return changed
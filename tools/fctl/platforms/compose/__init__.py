@@ -1,23 +1,78 @@
-from rich.columns import Columns
-from rich.table import Table
+from os import path
+import time
+from typing import Dict, List, Optional, Tuple
 import typer
 from typer import Typer
 from typing_extensions import Annotated
 
+from lib.analysis import ImageAnalyzer, ImageHistory, ImageReport, analysis_table, over_budget
+from lib.builder import ImageBuilder
+from lib.cache import BuildCache
+from lib.component import Component
 from lib.console import console
-from lib.directories import ROOT_DIR
+from lib.configuration import get_configuration
+from lib.directories import RENDER_DIR, ROOT_DIR
 from lib.checks import Checks
+from lib.readiness import ReadinessResult, ReadinessTracker, readiness_table
+from lib.render import Renderer
 from lib.shell import Shell
+from lib.status import StatusBoard
+from lib.trace import tracer
+from lib.utils import Except, Only, Utils, WithDeps, WithDependents
 
-from platforms.compose.api import client
+from platforms.compose.api import get_client
+from platforms.compose.readiness import HealthWaiter
 
 # Create the app.
 app: Typer = Typer()
 
+# Name of the Compose project Foundation runs as.
+PROJECT_NAME = "fndtn"
+
+def prepare_builder(components: List[Component]) -> Optional[str]:
+    """ Returns the buildx builder that exports the caches of the components, creating one when none is configured. """
+    builder = ImageBuilder(get_configuration(), Checks.get_buildx()[0])
+    try:
+        builder.prepare(components)
+    except RuntimeError as error:
+        console.error_panel(str(error))
+        exit(1)
+
+    return builder.builder
+
+def analyze_images(services: Dict[str, Tuple[str, str]]) -> Dict[str, ImageReport]:
+    """
+    Analyzes the images built for services, given as their component and 'image'. Services without an 'image' are
+    built as '<project>-<service>'. Images that can't be inspected are left out with a warning.
+    """
+    from docker.errors import APIError
+
+    analyzer = ImageAnalyzer(get_client())
+    history = ImageHistory()
+    reports = {}
+
+    for name, (component, image) in services.items():
+        try:
+            report = analyzer.analyze(component, image or f"{PROJECT_NAME}-{name}")
+        except APIError as error:
+            console.warn(f"Failed to inspect the image of {name}: {error.explanation or error}")
+            continue
+
+        report.previous = history.get(component)
+        reports[name] = report
+
+    return reports
+
 # Add the subcommands.
 @app.command("build")
 def build_command(
-    push: Annotated[bool, typer.Option("-p", help="Pushes the images to the registry after building.")] = True
+    push: Annotated[bool, typer.Option("-p", help="Pushes the images to the registry after building.")] = True,
+    incremental: Annotated[bool, typer.Option("--incremental", "-i", help="Skips services that did not change since their last build.")] = False,
+    rendered: Annotated[bool, typer.Option("--rendered", help="Uses the Compose file generated from 'foundation.yml', with its targets, build args and caches.")] = False,
+    only: Only = None,
+    exclude: Except = None,
+    with_deps: WithDeps = False,
+    with_dependents: WithDependents = False,
 ):
     """Builds the container images."""
 
@@ -30,29 +85,136 @@ def build_command(
     console.warn("Warning! Compose mode will push images to the registry according to each services 'image' property.")
     console.warn("If you want to push to a registry, please edit the 'docker-compose.yml' file and set 'image' property for each service.")
 
+    import yaml
+
+    compose_file = path.join(ROOT_DIR, "docker-compose.yml")
+    files = []
+    if (rendered):
+        renderer = Renderer(get_configuration(), RENDER_DIR)
+        renderer.render(kubernetes=False)
+        compose_file = renderer.compose_path()
+        files = ["-f", compose_file]
+
+    # Hash the build context of every service that is built by Compose.
+    cache = BuildCache()
+    services = {}
+    with open(compose_file) as f:
+        for name, service in (yaml.safe_load(f).get("services") or {}).items():
+            build = service.get("build")
+            if (build is None):
+                continue
+
+            if (isinstance(build, str)):
+                build = {"context": build}
+
+            # Contexts are relative to the Compose file.
+            context = path.join(path.dirname(compose_file), build.get("context", "."))
+            args = build.get("args") or {}
+            if (isinstance(args, list)):
+                args = [arg.split("=", 1) if "=" in arg else (arg, None) for arg in args]
+            args = dict(args)
+            if (build.get("target")):
+                args["--target"] = build["target"]
+            digest = cache.digest(context, build.get("dockerfile", "Dockerfile"), args)
+            services[name] = (digest, service.get("image", ""))
+
+    targets = list(services.keys())
+    selected = Utils.select_components(only, exclude, with_deps, with_dependents)
+    if (selected is not None):
+        targets = [name for name in targets if name in [c.service_name for c in selected]]
+        if (not targets):
+            console.warn("None of the selected components are built on Compose mode.")
+            return
+
+    if (incremental):
+        fresh = [name for name in targets if cache.is_fresh("compose:" + name, *services[name], push)]
+        targets = [name for name in targets if name not in fresh]
+
+        for name in fresh:
+            console.log(f"[italic bright_black]Service {name} is up to date. Skipping...")
+
+        if (not targets):
+            console.done("Container images are up to date on Compose mode.")
+            return
+
+    # Caches other than inline ones can't be exported by the default builder, so one is set up as on Kubernetes mode.
+    env = {"COMPOSE_PROJECT_NAME": PROJECT_NAME}
+    builder = prepare_builder([c for c in get_configuration().components if c.service_name in targets]) if rendered else None
+    if (builder is not None):
+        env["BUILDX_BUILDER"] = builder
+
+    # Services are reported as the components they belong to.
+    ids = {c.service_name: c.id for c in get_configuration().components}
+
+    def report(phase: str, status: str, start: float, error: str = None) -> None:
+        for name in targets:
+            console.event(phase, ids.get(name, name), service=name, status=status, tag=services[name][1] or None,
+                          duration=round(time.monotonic() - start, 3), error=error)
+
     with console.status("[bold blue]Building container images...") as status:
         # Build images
         # TODO: Properly read the component definition from services.yml to determine if it should be built.
-        code, _, error = Shell.execute(cmd + ["build"], cwd=ROOT_DIR)
+        start = time.monotonic()
+        code, _, error = Shell.execute(cmd + files + ["build"] + targets, cwd=ROOT_DIR, env=env,
+                                       on_output=console.stream(status, "[bold blue]Building container images..."))
+        report("build", "built" if code == 0 else "failed", start, error if code != 0 else None)
         if (code != 0):
             console.error("Failed to build images.")
-            console.log(error, style="red")
+            console.error_panel(error)
             exit(1)
 
+        # Every image is analyzed once built, so images over their size budget fail before they are pushed.
+        status.update("[bold blue]Analyzing images...")
+        reports = analyze_images({name: (ids.get(name, name), services[name][1]) for name in targets})
+        budgets = {c.id: c.size_budget for c in get_configuration().components}
+        for name, report in reports.items():
+            over = over_budget(report, budgets.get(report.component))
+            if (over is not None):
+                console.print(analysis_table(list(reports.values()), budgets))
+                console.error(over[0])
+                console.error_panel(over[1])
+                exit(1)
+
+        for name in targets:
+            cache.record("compose:" + name, services[name][0], services[name][1], False)
+        cache.save()
+
         if (push): # TODO: Properly read the component definition from services.yml to determine if it should be pushed.
             status.update("Pushing to registry...")
-            code, _, error = Shell.execute(cmd + ["push"], cwd=ROOT_DIR)
+            start = time.monotonic()
+            code, _, error = Shell.execute(cmd + files + ["push"] + targets, cwd=ROOT_DIR, env=env,
+                                           on_output=console.stream(status, "Pushing to registry..."))
+            report("push", "pushed" if code == 0 else "failed", start, error if code != 0 else None)
             if (code != 0):
                 console.error("Failed to push images.")
                 console.error_panel(error)
                 exit(1)
 
+            for name in targets:
+                cache.record("compose:" + name, services[name][0], services[name][1], True)
+            cache.save()
+
+            history = ImageHistory()
+            for report in reports.values():
+                history.record(report)
+            history.save()
+
+    if (reports):
+        console.print(analysis_table(list(reports.values()), budgets))
+
     console.done("Built container images on Compose mode.")
 
 @app.command("up")
 def up_command(
     build: Annotated[bool, typer.Option("-b", help="Builds the images before starting.")] = False,
     restart: Annotated[bool, typer.Option("-r", help="Kills the services before starting.")] = False,
+    rendered: Annotated[bool, typer.Option("--rendered", help="Uses the Compose file generated from 'foundation.yml'.")] = False,
+    wait: Annotated[bool, typer.Option("--wait", help="Starts one tier at a time, waiting for its containers to be running and healthy.")] = False,
+    timeout: Annotated[int, typer.Option("--timeout", min=1, help="Seconds to wait for each component with --wait, unless it sets 'ready_timeout'.")] = 300,
+    only: Only = None,
+    exclude: Except = None,
+    with_deps: WithDeps = False,
+    with_dependents: WithDependents = False,
 ):
     """Starts Foundation on Compose mode."""
 
@@ -62,23 +224,93 @@ def up_command(
         console.alert_docker_compose_not_found()
         exit(1)
 
+    selection = {"only": only, "exclude": exclude, "with_deps": with_deps, "with_dependents": with_dependents}
+    selected = Utils.select_components(only, exclude, with_deps, with_dependents)
+
     if (restart):
-        down_command()
+        down_command(**selection)
 
     if (build):
-        build_command(False)
+        build_command(push=False, rendered=rendered, **selection)
+
+    # Compose only recreates the services whose definition changed, and the file is only rewritten when it changes.
+    compose_file = path.join(ROOT_DIR, "docker-compose.yml")
+    files = []
+    if (rendered):
+        renderer = Renderer(get_configuration(), RENDER_DIR)
+        renderer.render(kubernetes=False)
+        compose_file = renderer.compose_path()
+        files = ["-f", compose_file]
+
+    # With --wait, each tier of 'order' is started and waited for before the next one, then everything else unless
+    # only some components were selected. Selected services are started without the ones they depend on in Compose.
+    steps = [[]]
+    if (wait or selected is not None):
+        import yaml
+
+        with open(compose_file) as f:
+            defined = set((yaml.safe_load(f).get("services") or {}).keys())
+
+        tiers = [[c for c in tier if c.service_name in defined and (selected is None or c in selected)]
+                 for tier in get_configuration().tiers]
+        steps = [tier for tier in tiers if tier] if wait else [[c for tier in tiers for c in tier]]
+        if (selected is None):
+            steps.append([])
+        elif (not any(steps)):
+            console.warn("None of the selected components are started on Compose mode.")
+            return
+
+    readiness = []
+    with console.status("[bold blue]Starting Foundation on Compose mode...") as status:
+        for tier in steps:
+            services = [c.service_name for c in tier]
+            no_deps = ["--no-deps"] if selected is not None else []
+            start = time.monotonic()
+            code, _, error = Shell.execute(cmd + files + ["up", "-d"] + no_deps + services, cwd=ROOT_DIR,
+                                           env={"COMPOSE_PROJECT_NAME": PROJECT_NAME},
+                                           on_output=console.stream(status, "[bold blue]Starting Foundation on Compose mode..."))
+            for component in tier or [None]:
+                console.event("start", component and component.id, status="started" if code == 0 else "failed",
+                              duration=round(time.monotonic() - start, 3), error=error if code != 0 else None)
+            if (code != 0):
+                console.error("Failed to start Foundation on Compose mode.")
+                console.error_panel(error)
+                exit(1)
+
+            if (not wait or not tier):
+                continue
+
+            status.update("[bold blue]Waiting for " + ", ".join(services) + "...")
+            tracker = ReadinessTracker({c.id: c.ready_timeout or timeout for c in tier}, on_change=report_readiness)
+            with tracer.span("wait " + ", ".join(services), "deploy"):
+                HealthWaiter(get_client(), PROJECT_NAME).wait(tracker, {c.service_name: c.id for c in tier})
+
+            readiness += tracker.results.values()
+            if (tracker.failed()):
+                console.print(readiness_table(readiness))
+                exit(1)
+
+    if (wait):
+        console.print(readiness_table(readiness))
 
-    with console.status("[bold blue]Starting Foundation on Compose mode..."):
-        code, _, error = Shell.execute(['COMPOSE_PROJECT_NAME="fndtn"'] + cmd + ["up", "-d"], cwd=ROOT_DIR)
-        if (code != 0):
-            console.error("Failed to start Foundation on Compose mode.")
-            console.error_panel(error)
-            exit(1)
-    
     console.done("Started Foundation on Compose mode.")
 
+def report_readiness(result: ReadinessResult) -> None:
+    console.event("ready", result.component, status=result.state, duration=round(result.elapsed, 3),
+                  details=result.details or None)
+
+    if (result.state == "ready"):
+        console.log(f"* {result.component} is ready after {result.elapsed:.1f}s.")
+    else:
+        console.error(f"{result.component} is not ready ({result.state}): {result.details}")
+
 @app.command("down")
-def down_command():
+def down_command(
+    only: Only = None,
+    exclude: Except = None,
+    with_deps: WithDeps = False,
+    with_dependents: WithDependents = False,
+):
     """Stops Foundation on Compose mode and deletes all containers."""
 
     # Check if Docker Compose is installed.
@@ -87,8 +319,13 @@ def down_command():
         console.alert_docker_compose_not_found()
         exit(1)
 
-    with console.status("[bold blue]Stopping Foundation on Compose mode..."):
-        code, _, error = Shell.execute(cmd + ["down"], cwd=ROOT_DIR)
+    # Selected services are only stopped and removed, keeping the networks the others use.
+    selected = Utils.select_components(only, exclude, with_deps, with_dependents)
+    args = ["down"] if selected is None else ["rm", "--stop", "--force"] + [c.service_name for c in selected]
+
+    with console.status("[bold blue]Stopping Foundation on Compose mode...") as status:
+        code, _, error = Shell.execute(cmd + args, cwd=ROOT_DIR, env={"COMPOSE_PROJECT_NAME": PROJECT_NAME},
+                                       on_output=console.stream(status, "[bold blue]Stopping Foundation on Compose mode..."))
         if (code != 0):
             console.error_panel(error)
             exit(1)
@@ -96,7 +333,12 @@ def down_command():
     console.done("Stopped Foundation on Compose.")
 
 @app.command("restart")
-def restart_command():
+def restart_command(
+    only: Only = None,
+    exclude: Except = None,
+    with_deps: WithDeps = False,
+    with_dependents: WithDependents = False,
+):
     """Restarts Foundation on Compose mode."""
 
     # Check if Docker Compose is installed.
@@ -105,8 +347,12 @@ def restart_command():
         console.alert_docker_compose_not_found()
         exit(1)
 
-    with console.status("Restarting Foundation on Compose mode..."):
-        code, _, error = Shell.execute(cmd + ["restart"], cwd=ROOT_DIR)
+    selected = Utils.select_components(only, exclude, with_deps, with_dependents)
+    services = [c.service_name for c in selected] if selected is not None else []
+
+    with console.status("Restarting Foundation on Compose mode...") as status:
+        code, _, error = Shell.execute(cmd + ["restart"] + services, cwd=ROOT_DIR, env={"COMPOSE_PROJECT_NAME": PROJECT_NAME},
+                                       on_output=console.stream(status, "Restarting Foundation on Compose mode..."))
         if (code != 0):
             console.error_panel(error)
             exit(1)
@@ -114,24 +360,138 @@ def restart_command():
     console.done("Restarted Foundation on Compose.")
 
 @app.command("status")
-def status_command():
-    """To be implemented."""
-    services = client.services.list()
-    containers = client.containers.list()
+def status_command(
+    watch: Annotated[bool, typer.Option("--watch", "-w", help="Keeps the table updated as containers change.")] = False,
+    only: Only = None,
+    exclude: Except = None,
+    with_deps: WithDeps = False,
+    with_dependents: WithDependents = False,
+):
+    """Shows the state of every container of Foundation on Compose mode."""
+    from platforms.compose.status import ComposeStatus
+
+    selected = Utils.select_components(only, exclude, with_deps, with_dependents)
+    status = ComposeStatus(get_client(), PROJECT_NAME)
+    board = StatusBoard("Foundation on Compose", [c.service_name for c in selected] if selected is not None else None)
+    status.snapshot(board)
+
+    if (watch):
+        board.watch(console, [status.watch])
+    else:
+        console.print(board.table())
+
+@app.command("logs")
+def logs_command(
+    components: Annotated[Optional[List[str]], typer.Argument(help="Components to show the logs of. Defaults to all.")] = None,
+    follow: Annotated[bool, typer.Option("--follow/--no-follow", "-f", help="Keeps following the logs, attaching restarted containers.")] = True,
+    since: Annotated[Optional[str], typer.Option("--since", help="Only shows logs newer than a duration (e.g. 10m) or a timestamp.")] = None,
+    tail: Annotated[Optional[int], typer.Option("--tail", "-n", help="Number of lines to show from the end of each container's logs.")] = None,
+    only: Only = None,
+    exclude: Except = None,
+    with_deps: WithDeps = False,
+    with_dependents: WithDependents = False,
+):
+    """Shows the logs of every container of Foundation on Compose mode."""
+    from lib.logs import LogMultiplexer, parse_since
+    from platforms.compose.logs import ComposeLogs
 
-    services_table = Table(headers=Columns(["Name", "Containers", "Ports"]),title="Services")
-    containers_table = Table(headers=Columns(["Name", "Service", "Status", "Ports"]), title="Containers")
+    selected = Utils.select_components((components or []) + (only or []), exclude, with_deps, with_dependents)
+    try:
+        seconds = parse_since(since)
+    except ValueError:
+        console.error(f"Invalid value '{since}' for --since.")
+        exit(1)
 
-    for service in services:
-        services_table.add_row(service.name, len(service.tasks), "---")
+    logs = ComposeLogs(get_client(), PROJECT_NAME, [c.service_name for c in selected] if selected else None,
+                       seconds, tail, follow)
 
-    for container in containers:
-        containers_table.add_row(container.name, container.labels["com.docker.compose.service"], container.status, "---")
+    multiplexer = LogMultiplexer(console, lossy=follow)
+    if (logs.start(multiplexer) == 0 and not follow):
+        console.warn("No containers found on Compose mode.")
+        return
 
-    console.print(services_table)
-    console.print(containers_table)
+    multiplexer.run([logs.watch] if follow else [], follow)
 
-@app.command("logs")
-def logs_command():
-    """To be implemented."""
-    pass
\ No newline at end of file
+@app.command("dev")
+def dev_command(
+    rendered: Annotated[bool, typer.Option("--rendered", help="Uses the Compose file generated from 'foundation.yml'.")] = False,
+    wait: Annotated[bool, typer.Option("--wait", help="Waits for each recreated container to be running and healthy.")] = False,
+    timeout: Annotated[int, typer.Option("--timeout", min=1, help="Seconds to wait for each component with --wait, unless it sets 'ready_timeout'.")] = 300,
+    debounce: Annotated[float, typer.Option("--debounce", min=0, help="Seconds without changes to wait for before rebuilding.")] = 0.5,
+    only: Only = None,
+    exclude: Except = None,
+    with_deps: WithDeps = False,
+    with_dependents: WithDependents = False,
+):
+    """Watches the components, rebuilding and recreating only the containers whose files change."""
+    from lib.dev import DevError, DevLoop
+
+    # Check if Docker Compose is installed.
+    installed, cmd = Checks.get_docker_compose()
+    if (not installed):
+        console.alert_docker_compose_not_found()
+        exit(1)
+
+    import yaml
+
+    # Everything is loaded once and kept warm: the configuration, the Compose file and the Docker client.
+    compose_file = path.join(ROOT_DIR, "docker-compose.yml")
+    files = []
+    if (rendered):
+        renderer = Renderer(get_configuration(), RENDER_DIR)
+        renderer.render(kubernetes=False)
+        compose_file = renderer.compose_path()
+        files = ["-f", compose_file]
+
+    with open(compose_file) as f:
+        built = set(name for name, service in (yaml.safe_load(f).get("services") or {}).items() if service.get("build"))
+
+    selected = Utils.select_components(only, exclude, with_deps, with_dependents)
+    components = [c for c in selected or get_configuration().components if c.service_name in built]
+    if (not components):
+        console.warn("None of the selected components are built on Compose mode.")
+        return
+
+    env = {"COMPOSE_PROJECT_NAME": PROJECT_NAME}
+    builder = prepare_builder(components) if rendered else None
+    if (builder is not None):
+        env["BUILDX_BUILDER"] = builder
+
+    client = get_client() if wait else None
+
+    with console.status("[bold blue]Watching for changes...") as status:
+        stream = console.stream(status, "[bold blue]Rebuilding...")
+
+        def recreate(component: Component, rebuild: bool) -> None:
+            if (rebuild):
+                status.update("[bold blue]Rebuilding " + component.id + "...")
+                code, _, error = Shell.execute(cmd + files + ["build", component.service_name], cwd=ROOT_DIR, env=env,
+                                               on_output=stream)
+                if (code != 0):
+                    raise DevError("Failed to build " + component.id + ".", error)
+
+            # Compose recreates the container since its image changed, leaving the services it depends on alone.
+            status.update("[bold blue]Recreating " + component.id + "...")
+            code, _, error = Shell.execute(cmd + files + ["up", "-d", "--no-deps", component.service_name], cwd=ROOT_DIR,
+                                           env=env, on_output=stream)
+            if (code != 0):
+                raise DevError("Failed to start " + component.id + ".", error)
+
+            if (wait):
+                status.update("[bold blue]Waiting for " + component.id + "...")
+                tracker = ReadinessTracker({component.id: component.ready_timeout or timeout}, on_change=report_readiness)
+                HealthWaiter(client, PROJECT_NAME).wait(tracker, {component.service_name: component.id})
+                if (tracker.failed()):
+                    raise DevError(component.id + " did not become ready.")
+
+        # Only build inputs are watched, since the Compose file is not split by component.
+        loop = DevLoop(components, recreate, BuildCache(), debounce, manifests=False,
+                       watched=[compose_file, path.join(ROOT_DIR, "foundation.yml")],
+                       on_idle=lambda: status.update("[bold blue]Watching for changes..."))
+        console.log(f"Watching {len(components)} components for changes. Press Ctrl+C to stop.")
+        try:
+            loop.run()
+        except KeyboardInterrupt:
+            pass
+
+    console.done("Stopped watching.")
@@ -1,3 +1,20 @@
-import docker
+from functools import lru_cache
 
-client = docker.from_env()
\ No newline at end of file
+from lib.trace import tracer
+
+@lru_cache(maxsize=None)
+def get_client():
+    """ Returns the Docker client, connecting to the daemon on first use. """
+    import docker
+
+    client = docker.from_env()
+    if (tracer.enabled):
+        # Every request of the SDK goes through the 'send' method of its session.
+        from urllib.parse import urlparse
+
+        tracer.wrap(client.api, "send", "docker", lambda request, *args, **kwargs:
+                    request.method + " " + urlparse(request.url).path,
+                    lambda response: {"status": response.status_code,
+                                      "bytes": int(response.headers.get("Content-Length") or 0)})
+
+    return client
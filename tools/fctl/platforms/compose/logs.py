@@ -0,0 +1,70 @@
+import threading
+import time
+from typing import List, Optional
+
+from lib.logs import LogMultiplexer
+
+class ComposeLogs:
+    """
+    Streams the logs of the containers of a Compose project through the Docker API. 'since' and 'tail' are passed to
+    the daemon, so older lines are never sent. Containers that start later are attached as soon as they start.
+    """
+
+    def __init__(self, client, project: str, services: Optional[List[str]] = None, since: Optional[int] = None,
+                 tail: Optional[int] = None, follow: bool = True) -> None:
+        self.client = client
+        self.project = project
+        self.services = services
+        self.since = since
+        self.tail = tail
+        self.follow = follow
+
+    def label(self) -> str:
+        return "com.docker.compose.project=" + self.project
+
+    def start(self, multiplexer: LogMultiplexer) -> int:
+        """ Attaches every container of the project. Returns how many were attached. """
+        since = int(time.time()) - self.since if self.since is not None else None
+
+        attached = 0
+        for container in self.client.api.containers(all=True, filters={"label": self.label()}):
+            if (self.attach(multiplexer, container["Id"], container.get("Labels") or {},
+                            (container.get("Names") or [container["Id"][:12]])[0], since, self.tail)):
+                attached += 1
+
+        return attached
+
+    def watch(self, multiplexer: LogMultiplexer, stop: threading.Event) -> None:
+        """ Attaches containers as they start, including restarts, only reading what they log from then on. """
+        events = self.client.api.events(filters={"type": "container", "event": "start", "label": self.label()},
+                                        decode=True)
+        try:
+            for event in events:
+                if (stop.is_set()):
+                    break
+
+                actor = event.get("Actor", {})
+                attributes = actor.get("Attributes", {})
+                self.attach(multiplexer, actor.get("ID") or event.get("id"), attributes,
+                            attributes.get("name", ""), event.get("time"), None)
+        finally:
+            events.close()
+
+    def attach(self, multiplexer: LogMultiplexer, id: str, labels: dict, name: str, since: Optional[int],
+               tail: Optional[int]) -> bool:
+        service = labels.get("com.docker.compose.service", "")
+        if (self.services is not None and service not in self.services):
+            return False
+
+        # Containers already being read are seen again on every restart event, and opening a stream for them is wasted.
+        if (multiplexer.is_attached(id)):
+            return False
+
+        chunks = self.client.api.logs(id, stream=True, follow=self.follow, since=since,
+                                      tail="all" if tail is None else tail)
+
+        prefix = name.lstrip("/")
+        if (prefix.startswith(self.project + "-")):
+            prefix = prefix[len(self.project) + 1:]
+
+        return multiplexer.attach(id, service, prefix, chunks, chunks.close)
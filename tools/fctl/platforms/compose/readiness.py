@@ -0,0 +1,78 @@
+import time
+from typing import Dict, List, Tuple
+
+from lib.readiness import ReadinessTracker
+
+class HealthWaiter:
+    """
+    Waits for the containers of the services of a tier to be running, and healthy when they have a health check.
+    Follows Docker events instead of polling, and checks the containers again whenever one of them changes.
+    """
+
+    def __init__(self, client, project: str) -> None:
+        self.client = client
+        self.project = project
+
+    def wait(self, tracker: ReadinessTracker, services: Dict[str, str]) -> None:
+        """ Returns once every component of the tracker is ready or timed out. 'services' maps services to components. """
+        label = "com.docker.compose.project=" + self.project
+
+        # Events are read from before the first evaluation, so a change right after it is not missed. Events of the
+        # same second may be read again, which only evaluates the containers once more.
+        since = int(time.time())
+        self.evaluate(tracker, services)
+
+        while tracker.pending():
+            remaining = tracker.remaining()
+            if (remaining <= 0):
+                break
+
+            # Events are only read until the earliest deadline, so timeouts are noticed without any new event.
+            until = int(time.time() + remaining) + 1
+            events = self.client.api.events(since=since, until=until, filters={"type": "container", "label": label},
+                                            decode=True)
+            try:
+                for _ in events:
+                    self.evaluate(tracker, services)
+                    if (not tracker.pending()):
+                        break
+            finally:
+                events.close()
+
+            # The next stream starts where this one ended.
+            since = until
+            tracker.expire()
+
+        tracker.expire()
+
+    def evaluate(self, tracker: ReadinessTracker, services: Dict[str, str]) -> None:
+        containers = self.client.api.containers(all=True, filters={"label": "com.docker.compose.project=" + self.project})
+
+        by_service: Dict[str, List[dict]] = {}
+        for container in containers:
+            service = (container.get("Labels") or {}).get("com.docker.compose.service", "")
+            by_service.setdefault(service, []).append(container)
+
+        for service, id in services.items():
+            if (id not in tracker.pending()):
+                continue
+
+            statuses = [HealthWaiter.health(container) for container in by_service.get(service, [])]
+            if (not statuses):
+                tracker.update(id, False, "No containers yet.")
+                continue
+
+            waiting = [details for ready, details in statuses if not ready]
+            tracker.update(id, not waiting, "; ".join(waiting) or ", ".join(details for _, details in statuses))
+
+    @staticmethod
+    def health(container: dict) -> Tuple[bool, str]:
+        """ Returns whether a container is ready and its status, e.g. 'Up 5 seconds (healthy)'. """
+        state = container.get("State", "")
+        status = container.get("Status", "")
+
+        # Containers that ran to completion (e.g. migrations) are ready too.
+        if (state == "exited" and status.startswith("Exited (0)")):
+            return True, status
+
+        return state == "running" and "(health: starting)" not in status and "(unhealthy)" not in status, status
@@ -0,0 +1,56 @@
+import threading
+from typing import List
+
+from lib.status import StatusBoard, StatusRow
+
+class ComposeStatus:
+    """ Collects the state of every container of a Compose project with a single API call, and follows its events. """
+
+    def __init__(self, client, project: str) -> None:
+        self.client = client
+        self.project = project
+
+    def label(self) -> str:
+        return "com.docker.compose.project=" + self.project
+
+    def snapshot(self, board: StatusBoard) -> None:
+        containers = self.client.api.containers(all=True, filters={"label": self.label()})
+        board.replace("container", [ComposeStatus.row(container) for container in containers])
+
+    def watch(self, board: StatusBoard, stop: threading.Event) -> None:
+        """ Follows container events, only refreshing the container each event refers to. """
+        events = self.client.api.events(filters={"type": "container", "label": self.label()}, decode=True)
+
+        try:
+            for event in events:
+                if (stop.is_set()):
+                    break
+
+                actor = event.get("Actor", {})
+                id = actor.get("ID") or event.get("id")
+                name = actor.get("Attributes", {}).get("name", id)
+
+                containers = self.client.api.containers(all=True, filters={"id": id})
+                board.update("container", name, ComposeStatus.row(containers[0]) if containers else None)
+        finally:
+            events.close()
+
+    @staticmethod
+    def row(container: dict) -> StatusRow:
+        labels = container.get("Labels") or {}
+        name = (container.get("Names") or [container["Id"][:12]])[0].lstrip("/")
+        status = container.get("Status", "")
+
+        healthy = container.get("State") == "running" and "unhealthy" not in status
+        if ("health: starting" in status):
+            healthy = None
+
+        return StatusRow(labels.get("com.docker.compose.service", ""), "container", name, container.get("State", ""),
+                         status + ComposeStatus.ports(container.get("Ports") or []), healthy)
+
+    @staticmethod
+    def ports(ports: List[dict]) -> str:
+        published = sorted(set(f"{port['PublicPort']}->{port['PrivatePort']}/{port['Type']}"
+                               if port.get("PublicPort") else f"{port['PrivatePort']}/{port['Type']}"
+                               for port in ports))
+        return (", " + ", ".join(published)) if published else ""
@@ -1,17 +1,36 @@
+from concurrent.futures import ThreadPoolExecutor
 from os import path
+import time
+from threading import Event
+from typing import List, Optional
 from rich.panel import Panel
 import typer
 from typer import Typer
 from typing_extensions import Annotated
 
-from lib.configuration import configuration
+from lib.component import Component
+from lib.configuration import Configuration, get_configuration
 from lib.console import console
-from lib.directories import ROOT_DIR, SRC_DIR
+from lib.directories import ROOT_DIR
+from lib.analysis import ImageAnalyzer, ImageHistory, analysis_table, over_budget
+from lib.bake import BakeBuilder
+from lib.builder import ImageBuilder
+from lib.cache import BuildCache
 from lib.checks import Checks
+from lib.push import ImagePusher
+from lib.readiness import ReadinessTracker, readiness_table
+from lib.render import Renderer, RenderedState, render_dir
+from lib.scheduler import BuildError, BuildFailedError, BuildResult, BuildScheduler
 from lib.shell import Shell
-from lib.utils import Utils
+from lib.status import StatusBoard
+from lib.trace import tracer
+from lib.utils import Environments, Except, Only, Utils, WithDeps, WithDependents
 
-from platforms.compose.api import client
+from platforms.compose.api import get_client as get_docker_client
+from platforms.kubernetes.api import get_api_client, get_namespace
+from platforms.kubernetes.apply import ApplyEngine, ApplyError
+from platforms.kubernetes.deploy import Deployer, report_readiness, summary_table
+from platforms.kubernetes.readiness import RolloutWaiter
 
 # Create the app.
 app: Typer = Typer()
@@ -19,53 +38,193 @@ app: Typer = Typer()
 # Add the subcommands.
 @app.command("build")
 def build_command(
-    push: Annotated[bool, typer.Option("-p", help="Pushes the images to the registry after building.")] = True
+    push: Annotated[bool, typer.Option("-p", help="Pushes the images to the registry after building.")] = True,
+    jobs: Annotated[int, typer.Option("--jobs", "-j", min=1, help="Number of images to build concurrently.")] = 1,
+    incremental: Annotated[bool, typer.Option("--incremental", "-i", help="Skips components that did not change since their last build.")] = False,
+    bake: Annotated[bool, typer.Option("--bake", help="Builds components sharing a build context with a single buildx bake invocation.")] = False,
+    push_jobs: Annotated[int, typer.Option("--push-jobs", min=1, help="Number of images to push concurrently.")] = 4,
+    retries: Annotated[int, typer.Option("--retries", min=0, help="Times a push is retried after a transient failure.")] = 4,
+    only: Only = None,
+    exclude: Except = None,
+    with_deps: WithDeps = False,
+    with_dependents: WithDependents = False,
+    env: Environments = None,
 ) -> str:
     """Builds the container images."""
 
     console.warn("Warning! Kubernetes mode builds and pushes images to the registry according to the 'foundation.yml' file.")
     console.warn("If you want to push to a different registry, please edit the 'foundation.yml' file and set 'registry' property.")
 
+    configurations = [get_configuration(environment) for environment in Utils.select_environments(env)]
+    configuration = configurations[0]
     registry = configuration.settings["registry"]
-    created_images = []
+    selected = Utils.select_components(only, exclude, with_deps, with_dependents)
+    builder = ImageBuilder(configuration, Checks.get_buildx()[0])
+
+    if (bake and not builder.buildx):
+        console.warn("Bake builds require buildx, which was not found. Building each component separately...")
+        bake = False
+
+    cache = BuildCache()
+    components = []
+    cached = []
+    tags = {}
+    digests = {}
 
     username = Utils.login_to_registry(registry)
 
-    with console.status("[bold blue]Building images...") as status:
+    # Images are built once, and also pushed to the registries of the other environments.
+    environment_registries = list(dict.fromkeys(c.settings["registry"] for c in configurations[1:]
+                                                if c.settings["registry"] not in [None, registry]))
+    for other in environment_registries:
+        Utils.login_to_registry(other)
+
+    # TODO: Properly read the component definition from foundation.yml to determine if it should be pushed.
+    def should_push(component: Component) -> bool:
+        return component.build.platforms.push_on_kubernetes or push
+
+    for component in [configuration.by_id[c.id] for c in selected] if selected is not None else configuration.components:
+        if (not component.build.platforms.build_on_kubernetes):
+            console.log(f"[italic bright_black]Component {component.id} is set to not build on Kubernetes mode. Skipping...")
+            continue
+
+        dockerfile = path.join(ROOT_DIR, component.build.context, component.build.dockerfile)
+        if (not path.isfile(dockerfile)):
+            console.debug("No Dockerfile found at " + dockerfile + ". Skipping...")
+            continue
+
+        tag = builder.tag(component, username)
+        digest = cache.digest(path.join(ROOT_DIR, component.build.context), component.build.dockerfile,
+                              builder.digest_args(component))
+        tags[component.id] = tag
+        digests[component.id] = digest
 
-        # TODO: Properly read the component definition from foundation.yml to determine if it should be built.
-        for component in configuration.components:
-            if (not component.build.platforms.kubernetes.build):
-                status.update(f"Component {component.id} is set to not build on Kubernetes mode. Skipping...")
-                continue
+        if (incremental and cache.is_fresh(component.id, digest, tag, should_push(component))):
+            console.log(f"[italic bright_black]Component {component.id} is up to date. Skipping...")
+            cached.append(component)
+            continue
 
-            status.update("Building " + component.id + " from folder " + component.path + "...")
+        components.append(component)
 
-            service_folder = path.join(ROOT_DIR, component.path)
-            dockerfile = path.join(service_folder, "Dockerfile")
-            tag = registry and path.join(registry, component.id) or path.join(username, component.id)
+    try:
+        builder.prepare(components)
+    except RuntimeError as error:
+        console.error_panel(str(error))
+        exit(1)
 
-            has_dockerfile = path.isfile(dockerfile)
-            if (not has_dockerfile):
-                console.debug("No Dockerfile found in " + service_folder + ". Skipping...")
-                continue
+    with console.status("[bold blue]Building images...") as status:
+        progress = {}
+        stream = console.stream(status, "[bold blue]Building images...")
 
-            code, _, error = Shell.execute(["docker", "build", ".", "-f", component.build.dockerfile, "-t", tag],
-                                             cwd=path.join(ROOT_DIR, component.build.context))
+        def build(component: Component, cancel: Event) -> None:
+            code, _, error = Shell.execute(builder.command(component, tags[component.id]),
+                                           cwd=path.join(ROOT_DIR, component.build.context), cancel=cancel,
+                                           on_output=lambda line: stream(component.id + ": " + line))
             if (code != 0):
-                console.error("Failed to build " + component.id + ".")
-                console.error_panel(error)
-                exit(1)
+                raise BuildError("Failed to build " + component.id + ".", error)
 
-            if (component.build.platforms.push_on_kubernetes or push): # TODO: Properly read the component definition from foundation.yml to determine if it should be pushed.
-                status.update("Pushing " + component.id + " to registry...")
-                code, _, error = Shell.execute(["docker", "push", tag], cwd=ROOT_DIR)
-                if (code != 0):
-                    console.error("Failed to push " + component.id + ".")
-                    console.error_panel(error)
-                    exit(1)
+        # Components sharing a build context and dependencies are built together, as a single unit of the scheduler.
+        baker = None
+        units = None
+        if (bake):
+            baker = BakeBuilder(builder, tags, on_output=stream)
+            units = [group.components for group in baker.plan(components)]
+            for unit in units:
+                if (len(unit) > 1):
+                    console.log("* Baking " + ", ".join(c.id for c in unit) + " together.")
+
+        step = baker.build if bake else build
+
+        # Every image is analyzed once built, so images over their size budget fail before they are pushed.
+        analyzer = ImageAnalyzer(get_docker_client())
+        history = ImageHistory()
+        reports = {}
+
+        def build_and_analyze(component: Component, cancel: Event) -> None:
+            from docker.errors import APIError
+
+            step(component, cancel)
+            try:
+                report = analyzer.analyze(component.id, tags[component.id])
+            except APIError as error:
+                raise BuildError("Failed to inspect the image of " + component.id + ".", str(error))
+
+            report.previous = history.get(component.id)
+            reports[component.id] = report
+
+            over = over_budget(report, component.size_budget)
+            if (over is not None):
+                raise BuildError(*over)
+
+        # Images are pushed through the Docker SDK, to the configured registry and any other of the component.
+        pusher = ImagePusher(get_docker_client(), retries=retries, on_progress=lambda tag, line: stream(tag + ": " + line),
+                             auth_configs=Utils.auth_configs)
+        pushed = {}
+
+        def push_image(component: Component, cancel: Event) -> None:
+            registries = environment_registries + [r for c in configurations for r in c.by_id[component.id].registries]
+            targets = [tags[component.id]] + [path.join(r, component.id) for r in dict.fromkeys(registries)]
+            for target in targets[1:]:
+                get_docker_client().api.tag(tags[component.id], target)
+
+            pushed[component.id] = pusher.push_all(targets, cancel)
+
+        # Start of the running phase of each component, reported with its duration once it ends.
+        phases = {}
+
+        def report(result: BuildResult) -> None:
+            progress[result.component.id] = result
+            id = result.component.id
+            if (result.state in ["building", "pushing"]):
+                phases[id] = ("build" if result.state == "building" else "push", time.monotonic())
+            elif (id in phases):
+                phase, start = phases.pop(id)
+                digest = reports[id].image_id if id in reports else None
+                images = None
+                if (phase == "push"):
+                    images = [{"tag": r.tag, "digest": r.digest, "skipped": r.skipped, "attempts": r.attempts}
+                              for r in pushed.get(id, [])]
+                    digest = images[0]["digest"] if images else None
+
+                console.event(phase, id, status=result.state, duration=round(time.monotonic() - start, 3), tag=tags[id],
+                              digest=digest, size=reports[id].size if id in reports else None, images=images,
+                              error=result.error)
+            if (result.state == "pushed" and result.component.id in reports):
+                history.record(reports[result.component.id])
+
+            if (result.state in ["built", "pushed"]):
+                cache.record(result.component.id, digests[result.component.id], tags[result.component.id],
+                             result.state == "pushed")
+
+            if (result.state in ["built", "pushed", "failed"]):
+                digest = baker.digest(result.component) if baker is not None else None
+                console.log(f"* {result.component.id}: {result.state}" + (f" ({digest[:19]})." if digest else "."))
+
+            for push_result in pushed.get(result.component.id, []) if result.state == "pushed" else []:
+                console.log(f"  * {push_result.tag}: " + ("already in the registry" if push_result.skipped else
+                            f"pushed {push_result.digest or ''} after {push_result.attempts} attempt(s)") + ".")
+
+            active = [id for id, r in progress.items() if r.state in ["building", "pushing"]]
+            finished = len([r for r in progress.values() if r.state in ["pushed", "failed", "cancelled"]
+                            or (r.state == "built" and not r.push)])
+            status.update(f"[bold blue]Building images ({finished}/{len(components)})... [/bold blue]" + ", ".join(active))
+
+        scheduler = BuildScheduler(build_and_analyze, push_image, jobs=jobs, on_progress=report, push_jobs=push_jobs)
+        try:
+            results = scheduler.run(components, push=should_push, units=units)
+        except BuildFailedError as error:
+            console.error(str(error))
+            console.error_panel(error.failed.error)
+            exit(1)
+        finally:
+            cache.save()
+            history.save()
+
+    if (reports):
+        console.print(analysis_table([reports[c.id] for c in components if c.id in reports],
+                                     {c.id: c.size_budget for c in components}))
 
-            created_images.append(tag)
+    created_images = [tags[result.component.id] for result in results] + [tags[c.id] for c in cached]
 
     image_list = "\n".join([("* " + x) for x in created_images])
     panel = Panel.fit(image_list, title="Images", border_style="blue")
@@ -82,77 +241,413 @@ def up_command(
     ignore: Annotated[str, typer.Option(help="Ignores if a configuration file fails and continues deploying.")] = False,
     build: Annotated[bool, typer.Option("-b", help="Builds the images before starting.")] = False,
     restart: Annotated[bool, typer.Option("-r", help="Kills the services before starting.")] = False,
+    rendered: Annotated[bool, typer.Option("--rendered", help="Applies the manifests generated from 'foundation.yml', skipping unchanged ones.")] = False,
+    reconcile: Annotated[bool, typer.Option("--reconcile", help="Only applies objects that differ from the cluster, and prunes removed ones.")] = False,
+    dry_run: Annotated[bool, typer.Option("--dry-run", help="Prints what --reconcile would change, without changing anything.")] = False,
+    wait: Annotated[bool, typer.Option("--wait", help="Waits for each tier to be rolled out before applying the next one.")] = False,
+    timeout: Annotated[int, typer.Option("--timeout", min=1, help="Seconds to wait for each component with --wait, unless it sets 'ready_timeout'.")] = 300,
+    only: Only = None,
+    exclude: Except = None,
+    with_deps: WithDeps = False,
+    with_dependents: WithDependents = False,
+    env: Environments = None,
 ):
     """Starts Foundation on Kubernetes mode. Creates services, deployments and pods for each Foundation service."""
-    # Check if docker-compose is installed.
+    environments = Utils.select_environments(env)
+    configurations = [get_configuration(environment) for environment in environments]
+
+    # Check if kubectl is installed. It is only used for kinds the apply engine can't handle.
     installed, cmd = Checks.get_kubernetes()
     if (not installed):
         console.alert_kubectl_not_found()
         exit(1)
 
-    if (restart):
-        down_command()
+    selection = {"only": only, "exclude": exclude, "with_deps": with_deps, "with_dependents": with_dependents}
+    selected = Utils.select_components(only, exclude, with_deps, with_dependents)
+
+    # Hand-written manifests set their own replicas and images, so overrides of those are only applied when rendered.
+    if (not rendered):
+        for configuration in configurations:
+            ignored = [f"{id} ({', '.join(field for field in fields if field in Configuration.rendered_only)})"
+                       for id, fields in configuration.overrides.items()
+                       if any(field in Configuration.rendered_only for field in fields)]
+            if (ignored):
+                console.warn(f"The overrides of {configuration.environment} for {', '.join(ignored)} are only applied "
+                             "with --rendered.")
+
+    if (restart and not dry_run):
+        for environment in environments:
+            down_command(env=environment, **selection)
+
+    # Images are built once, and pushed to the registry of every environment.
+    if (build and not dry_run):
+        build_command(push=False, env=env, **selection)
+
+    engines = [create_engine(configuration) for configuration in configurations]
+    options = {"selected": [c.id for c in selected] if selected is not None else None, "rendered": rendered,
+               "reconcile": reconcile, "dry_run": dry_run, "wait": wait, "timeout": timeout, "ignore": ignore}
 
-    if (build):
-        username = build_command(False, username)
+    if (len(configurations) == 1):
+        with console.status("[bold blue]Starting Foundation on Kubernetes mode...") as status:
+            result = Deployer(configurations[0], engines[0], on_status=status.update, **options).run()
 
-    with console.status("[bold blue]Starting Foundation on Kubernetes mode...") as status:
-        # Apply secrets
-        status.update("[bold blue]Applying secrets...")
-        code, _, error = Shell.execute(cmd + ["apply", "-f", configuration.settings["secrets_file"]],
-                                         cwd=SRC_DIR)
-        if (code != 0):
-            console.error("Failed to apply secrets.")
-            console.error_panel(error)
+        if (wait and result.readiness):
+            console.print(readiness_table(result.readiness))
+
+        if (result.error is not None):
+            console.error(str(result.error))
+            if (result.error.output):
+                console.error_panel(result.error.output)
             exit(1)
 
-        # Apply service configurations
-        status.update("Applying service configurations...")
-        for component in configuration.components:
-            console.log("* Applying " + component.id + "...")
-            service_file = path.join(component.path, "kubernetes.yml")
+        if (not dry_run):
+            console.done("Started Foundation on Kubernetes mode.")
+        return
 
-            code, _, error = Shell.execute(cmd + ["apply", "-f", service_file],
-                                             cwd=SRC_DIR)
-            if (code != 0):
-                console.error("[bold red]Failed to apply service " + component.id + ".")
-                console.error_panel(error)
-                if (ignore):
-                    console.log("[italic bright_black]Continuing...")
-                else:
-                    exit(1)
-    
-    console.done("Started Foundation on Kubernetes mode.")
+    # Every environment is deployed to its own cluster concurrently.
+    with console.status("[bold blue]Starting Foundation on " + ", ".join(environments) + "..."):
+        with ThreadPoolExecutor(max_workers=len(configurations), thread_name_prefix="fctl-env") as pool:
+            results = list(pool.map(lambda item: Deployer(*item, **options).run(), zip(configurations, engines)))
 
-@app.command("down")
-def down_command():
-    """Stops Foundation on Kubernetes mode and deletes all services, deployments and pods."""
-    # Check if kubectl is installed.
-    installed, cmd = Checks.get_kubernetes()
-    if (not installed):
-        console.alert_kubectl_not_found()
+    for result in results:
+        if (wait and result.readiness):
+            console.print(readiness_table(result.readiness, title="Readiness of " + result.environment))
+
+        if (result.error is not None and result.error.output):
+            console.error_panel(result.error.output)
+
+    console.print(summary_table(results, [c.settings["context"] or "(current)" for c in configurations]))
+    if (any(result.error is not None for result in results)):
+        exit(1)
+
+    if (not dry_run):
+        console.done("Started Foundation on " + ", ".join(environments) + ".")
+
+def create_engine(configuration: Configuration) -> ApplyEngine:
+    """ Returns the apply engine for the kubeconfig context and namespace of the environment of a configuration. """
+    context = configuration.settings["context"]
+    try:
+        namespace = configuration.settings["namespace"] or get_namespace(context)
+    except ValueError as error:
+        console.error(str(error))
         exit(1)
 
+    kubectl = configuration.settings["kubectl_command"] + (["--context", context] if context else [])
+    return ApplyEngine(get_api_client(context), kubectl, namespace=namespace, api=configuration.api)
+
+@app.command("down")
+def down_command(
+    timeout: Annotated[int, typer.Option("--timeout", min=1, help="Seconds to wait for the objects of each tier to be deleted.")] = 300,
+    only: Only = None,
+    exclude: Except = None,
+    with_deps: WithDeps = False,
+    with_dependents: WithDependents = False,
+    env: Environments = None,
+):
+    """Stops Foundation on Kubernetes mode, deleting the objects of each tier in reverse order."""
+    from platforms.kubernetes.teardown import Teardown
+
+    configuration = get_configuration(Utils.select_environment(env))
+    selected = Utils.select_components(only, exclude, with_deps, with_dependents)
+    ids = [c.id for c in selected] if selected is not None else None
+    tiers = [[c.id for c in tier if ids is None or c.id in ids] for tier in configuration.tiers]
+    engine = create_engine(configuration)
+
+    # The deleted components have to be applied again, even if deleting them fails halfway.
+    RenderedState.of(configuration.environment).clear(ids)
+
+    deleted = []
+
+    def report(owner: str, item: dict) -> None:
+        deleted.append(item)
+        console.event("delete", owner, object=f"{item['kind'].lower()}/{item['metadata']['name']}", status="deleted")
+        console.log(f"* Deleted {item['kind'].lower()}/{item['metadata']['name']} of {owner}.")
+
     with console.status("Stopping Foundation on Kubernetes mode..."):
-        code, _, error = Shell.execute(cmd + ["delete", "pods,deployments,services", "--all"],
-                                         cwd=ROOT_DIR)
-        if (code != 0):
-            console.error_panel(error)
+        try:
+            with tracer.span("teardown", "deploy"):
+                manifests = {c.id: path.join(ROOT_DIR, c.path) for c in configuration.by_id.values()}
+                failures = Teardown(engine, manifests, on_deleted=report).run(tiers, timeout)
+        except ApplyError as error:
+            console.error("Failed to stop Foundation on Kubernetes mode.")
+            console.error_panel(error.output or str(error))
             exit(1)
 
+    for item, error in failures:
+        console.event("delete", item["metadata"].get("labels", {}).get(engine.component_label),
+                      object=f"{item['kind'].lower()}/{item['metadata']['name']}", status="failed",
+                      error=error.output or str(error))
+        console.error(f"[bold red]Failed to delete {item['kind'].lower()}/{item['metadata']['name']}.")
+        console.error_panel(error.output or str(error))
+
+    if (failures):
+        exit(1)
+
+    if (not deleted):
+        console.warn("No objects of the components were found, so nothing was deleted.")
+
     console.done("Done.")
 
 @app.command("restart")
-def restart_command():
-    """To be implemented."""
-    pass
+def restart_command(
+    wait: Annotated[bool, typer.Option("--wait", help="Waits for the restarted deployments to be rolled out.")] = False,
+    timeout: Annotated[int, typer.Option("--timeout", min=1, help="Seconds to wait for each component with --wait, unless it sets 'ready_timeout'.")] = 300,
+    only: Only = None,
+    exclude: Except = None,
+    with_deps: WithDeps = False,
+    with_dependents: WithDependents = False,
+    env: Environments = None,
+):
+    """Restarts the deployments of Foundation on Kubernetes mode with rolling updates."""
+    from platforms.kubernetes.restart import RolloutRestart
+
+    configuration = get_configuration(Utils.select_environment(env))
+    selected = [configuration.by_id[c.id] for c in Utils.select_components(only, exclude, with_deps, with_dependents)
+                or configuration.components]
+    engine = create_engine(configuration)
+
+    with console.status("[bold blue]Restarting Foundation on Kubernetes mode...") as status:
+        try:
+            with tracer.span("restart", "deploy"):
+                results = RolloutRestart(engine).run([c.id for c in selected])
+        except ApplyError as error:
+            console.error("Failed to list the deployments of Foundation on Kubernetes mode.")
+            console.error_panel(error.output or str(error))
+            exit(1)
+
+        for result in results:
+            console.event("restart", result.owner, object=str(result), status="restarted" if result.error is None else "failed",
+                          error=result.error and (result.error.output or str(result.error)))
+            if (result.error is None):
+                console.log("* Restarted " + str(result) + " of " + result.owner + ".")
+            else:
+                console.error("[bold red]Failed to restart " + str(result) + " of " + result.owner + ".")
+                console.error_panel(result.error.output or str(result.error))
+
+        if (any(result.error is not None for result in results)):
+            exit(1)
+
+        if (not results):
+            console.warn("No deployments found on Kubernetes mode.")
+            return
+
+        tracker = None
+        if (wait):
+            restarted = set(result.owner for result in results)
+            status.update("[bold blue]Waiting for " + ", ".join(sorted(restarted)) + "...")
+
+            tracker = ReadinessTracker({c.id: c.ready_timeout or timeout for c in selected if c.id in restarted},
+                                       on_change=report_readiness)
+            try:
+                with tracer.span("wait restart", "deploy"):
+                    RolloutWaiter(engine).wait(tracker)
+            except ApplyError as error:
+                console.error("Failed to watch the rollout of " + ", ".join(sorted(restarted)) + ".")
+                console.error_panel(error.output or str(error))
+                exit(1)
+
+    if (tracker is not None):
+        console.print(readiness_table(list(tracker.results.values())))
+        if (tracker.failed()):
+            exit(1)
+
+    console.done("Restarted Foundation on Kubernetes mode.")
 
 @app.command("status")
-def status_command():
-    """To be implemented."""
-    pass
+def status_command(
+    watch: Annotated[bool, typer.Option("--watch", "-w", help="Keeps the table updated as objects change.")] = False,
+    only: Only = None,
+    exclude: Except = None,
+    with_deps: WithDeps = False,
+    with_dependents: WithDependents = False,
+    env: Environments = None,
+):
+    """Shows the state of the deployments, pods and services of Foundation on Kubernetes mode."""
+    from platforms.kubernetes.status import KubernetesStatus
+
+    configuration = get_configuration(Utils.select_environment(env))
+    engine = create_engine(configuration)
+
+    selected = Utils.select_components(only, exclude, with_deps, with_dependents)
+    status = KubernetesStatus(engine)
+    board = StatusBoard("Foundation on Kubernetes", [c.id for c in selected] if selected is not None else None)
+    try:
+        status.snapshot(board)
+    except ApplyError as error:
+        console.error("Failed to get the status of Foundation on Kubernetes mode.")
+        console.error_panel(error.output or str(error))
+        exit(1)
+
+    if (watch):
+        board.watch(console, status.watchers())
+    else:
+        console.print(board.table())
 
 @app.command("logs")
-def logs_command():
-    """To be implemented."""
-    pass
\ No newline at end of file
+def logs_command(
+    components: Annotated[Optional[List[str]], typer.Argument(help="Components to show the logs of. Defaults to all.")] = None,
+    follow: Annotated[bool, typer.Option("--follow/--no-follow", "-f", help="Keeps following the logs, attaching new pods and restarted containers.")] = True,
+    since: Annotated[Optional[str], typer.Option("--since", help="Only shows logs newer than a duration (e.g. 10m) or a timestamp.")] = None,
+    tail: Annotated[Optional[int], typer.Option("--tail", "-n", help="Number of lines to show from the end of each container's logs.")] = None,
+    only: Only = None,
+    exclude: Except = None,
+    with_deps: WithDeps = False,
+    with_dependents: WithDependents = False,
+    env: Environments = None,
+):
+    """Shows the logs of every pod of Foundation on Kubernetes mode."""
+    from lib.logs import LogMultiplexer, parse_since
+    from platforms.kubernetes.api import get_client
+    from platforms.kubernetes.logs import KubernetesLogs
+
+    selected = Utils.select_components((components or []) + (only or []), exclude, with_deps, with_dependents)
+    try:
+        seconds = parse_since(since)
+    except ValueError:
+        console.error(f"Invalid value '{since}' for --since.")
+        exit(1)
+
+    configuration = get_configuration(Utils.select_environment(env))
+    engine = create_engine(configuration)
+    logs = KubernetesLogs(engine, get_client(configuration.settings["context"]), [c.id for c in selected] if selected else None, seconds, tail, follow)
+
+    multiplexer = LogMultiplexer(console, lossy=follow)
+    try:
+        attached = logs.start(multiplexer)
+    except ApplyError as error:
+        console.error("Failed to list the pods of Foundation on Kubernetes mode.")
+        console.error_panel(error.output or str(error))
+        exit(1)
+
+    if (attached == 0 and not follow):
+        console.warn("No pods found on Kubernetes mode.")
+        return
+
+    multiplexer.run([logs.watch] if follow else [], follow)
+
+@app.command("dev")
+def dev_command(
+    push: Annotated[bool, typer.Option("--push/--no-push", help="Pushes rebuilt images. Disable it for clusters that run local images.")] = True,
+    wait: Annotated[bool, typer.Option("--wait", help="Waits for each redeployed component to be rolled out.")] = False,
+    timeout: Annotated[int, typer.Option("--timeout", min=1, help="Seconds to wait for each component with --wait, unless it sets 'ready_timeout'.")] = 300,
+    debounce: Annotated[float, typer.Option("--debounce", min=0, help="Seconds without changes to wait for before rebuilding.")] = 0.5,
+    only: Only = None,
+    exclude: Except = None,
+    with_deps: WithDeps = False,
+    with_dependents: WithDependents = False,
+    env: Environments = None,
+):
+    """Watches the components, rebuilding and redeploying only the ones whose files change."""
+    import yaml
+
+    from lib.dev import DevError, DevLoop
+    from lib.scheduler import BuildError
+    from platforms.kubernetes.restart import RolloutRestart
+
+    # Check if kubectl is installed. It is only used for kinds the apply engine can't handle.
+    installed, _ = Checks.get_kubernetes()
+    if (not installed):
+        console.alert_kubectl_not_found()
+        exit(1)
+
+    # Everything is loaded once and kept warm: the configuration, the login, the builder and both API clients.
+    configuration = get_configuration(Utils.select_environment(env))
+    registry = configuration.settings["registry"]
+    selected = Utils.select_components(only, exclude, with_deps, with_dependents)
+    components = [configuration.by_id[c.id] for c in selected] if selected is not None else configuration.components
+    components = [c for c in components if c.build.platforms.build_on_kubernetes
+                  and path.isfile(path.join(ROOT_DIR, c.build.context, c.build.dockerfile))]
+    if (not components):
+        console.warn("None of the selected components are built on Kubernetes mode.")
+        return
+
+    # Images are tagged as 'build' tags them, under the username when there is no registry, even when not pushed.
+    username = Utils.login_to_registry(registry) if push else None
+    if (username is None and not registry):
+        username = Utils.registry_credentials().username
+
+    builder = ImageBuilder(configuration, Checks.get_buildx()[0])
+    try:
+        builder.prepare(components)
+    except RuntimeError as error:
+        console.error_panel(str(error))
+        exit(1)
+
+    # Manifests are rendered, so they run the rebuilt images. Components set to run another image can't be redeployed.
+    renderer = Renderer(configuration, render_dir(configuration.environment), username=username)
+    for component in components:
+        if (renderer.image(component) != builder.tag(component, username)):
+            console.error(f"{component.id} runs {renderer.image(component)}, not the image it is built as "
+                          f"({builder.tag(component, username)}). Leave it out with --except.")
+            exit(1)
+
+    engine = create_engine(configuration)
+    cache = BuildCache()
+
+    with console.status("[bold blue]Watching for changes...") as status:
+        stream = console.stream(status, "[bold blue]Rebuilding...")
+        pusher = ImagePusher(get_docker_client(), on_progress=lambda tag, line: stream(tag + ": " + line),
+                             auth_configs=Utils.auth_configs)
+
+        def redeploy(component: Component, rebuild: bool) -> None:
+            tag = builder.tag(component, username)
+            if (rebuild):
+                status.update("[bold blue]Rebuilding " + component.id + "...")
+                code, _, error = Shell.execute(builder.command(component, tag),
+                                               cwd=path.join(ROOT_DIR, component.build.context), on_output=stream)
+                if (code != 0):
+                    raise DevError("Failed to build " + component.id + ".", error)
+
+                if (push):
+                    status.update("[bold blue]Pushing " + component.id + "...")
+                    targets = [tag] + [path.join(r, component.id) for r in component.registries]
+                    try:
+                        for target in targets[1:]:
+                            get_docker_client().api.tag(tag, target)
+                        pusher.push_all(targets)
+                    except BuildError as error:
+                        raise DevError(str(error), error.output)
+
+                digest = cache.digest(path.join(ROOT_DIR, component.build.context), component.build.dockerfile,
+                                      builder.digest_args(component))
+                cache.record(component.id, digest, tag, push)
+                cache.save()
+
+            status.update("[bold blue]Applying " + component.id + "...")
+            try:
+                manifests = renderer.kubernetes(component)
+            except yaml.YAMLError as error:
+                raise DevError("Failed to load the manifest of " + component.id + ".", str(error))
+
+            results = engine.apply_many([(component.id, manifest) for manifest in manifests])
+            failures = [result for result in results if result.error is not None]
+            if (failures):
+                raise DevError("Failed to apply " + str(failures[0]) + " of " + component.id + ".",
+                               failures[0].error.output or str(failures[0].error))
+
+            # The image tag doesn't change, so the pods are replaced explicitly to run the new image.
+            try:
+                if (rebuild):
+                    failures = [result for result in RolloutRestart(engine).run([component.id]) if result.error is not None]
+                    if (failures):
+                        raise DevError("Failed to restart " + str(failures[0]) + " of " + component.id + ".",
+                                       failures[0].error.output or str(failures[0].error))
+
+                if (wait):
+                    status.update("[bold blue]Waiting for " + component.id + "...")
+                    tracker = ReadinessTracker({component.id: component.ready_timeout or timeout}, on_change=report_readiness)
+                    RolloutWaiter(engine).wait(tracker)
+                    if (tracker.failed()):
+                        raise DevError(component.id + " did not become ready.")
+            except ApplyError as error:
+                raise DevError("Failed to roll out " + component.id + ".", error.output or str(error))
+
+        loop = DevLoop(components, redeploy, cache, debounce, watched=[path.join(ROOT_DIR, "foundation.yml")],
+                       on_idle=lambda: status.update("[bold blue]Watching for changes..."))
+        console.log(f"Watching {len(components)} components for changes. Press Ctrl+C to stop.")
+        try:
+            loop.run()
+        except KeyboardInterrupt:
+            pass
+
+    console.done("Stopped watching.")
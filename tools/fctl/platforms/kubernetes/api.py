@@ -1,5 +1,43 @@
-from kubernetes import client, config
+from functools import lru_cache
 
-config.load_kube_config()
+from lib.trace import tracer
 
-client = client.CoreV1Api()
\ No newline at end of file
+@lru_cache(maxsize=None)
+def get_api_client(context: str = None):
+    """ Returns the Kubernetes API client of a kubeconfig context, or of the current one, loading it on first use. """
+    from kubernetes import client, config
+
+    configuration = client.Configuration()
+    config.load_kube_config(context=context, client_configuration=configuration)
+
+    api_client = client.ApiClient(configuration)
+    if (tracer.enabled):
+        # Every request of the client goes through the 'request' method of its REST client.
+        from urllib.parse import urlparse
+
+        tracer.wrap(api_client.rest_client, "request", "kubernetes", lambda method, url, *args, **kwargs:
+                    method + " " + urlparse(url).path,
+                    lambda response: {"status": response.status, "bytes": int(
+                        getattr(response, "urllib3_response", response).headers.get("Content-Length") or 0)})
+
+    return api_client
+
+@lru_cache(maxsize=None)
+def get_client(context: str = None):
+    """ Returns the Kubernetes core API, sharing the connection pool of get_api_client(). """
+    from kubernetes import client
+
+    return client.CoreV1Api(get_api_client(context))
+
+@lru_cache(maxsize=None)
+def get_namespace(context: str = None) -> str:
+    """ Returns the namespace of a kubeconfig context, or of the current one. """
+    from kubernetes import config
+
+    contexts, current = config.list_kube_config_contexts()
+    if (context is not None):
+        current = next((entry for entry in contexts if entry["name"] == context), None)
+        if (current is None):
+            raise ValueError(f"Unknown kubeconfig context '{context}'.")
+
+    return current["context"].get("namespace") or "default"
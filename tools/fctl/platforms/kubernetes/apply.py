@@ -0,0 +1,296 @@
+import copy
+import json
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from lib.shell import Shell
+from lib.trace import tracer
+
+class ApplyError(Exception):
+    def __init__(self, message: str, output: str = "") -> None:
+        super().__init__(message)
+        self.output = output
+
+class ApplyResult:
+    def __init__(self, owner: str, manifest: dict, error: Optional[ApplyError] = None, fallback: bool = False) -> None:
+        self.owner: str = owner
+        self.kind: str = manifest.get("kind", "")
+        self.name: str = manifest.get("metadata", {}).get("name", "")
+        self.error: Optional[ApplyError] = error
+        self.fallback: bool = fallback
+
+    def __str__(self) -> str:
+        return self.kind.lower() + "/" + self.name
+
+class ApplyEngine:
+    """
+    Applies manifests in-process through the Kubernetes API using server-side apply, sharing a single pooled API
+    client. Kinds that are not known to the engine are applied by piping them to kubectl instead.
+    """
+
+    # Known kinds, keyed by (apiVersion, kind), mapped to their API path, resource name and whether they are namespaced.
+    kinds: Dict[Tuple[str, str], Tuple[str, str, bool]] = {
+        ("v1", "Namespace"): ("/api/v1", "namespaces", False),
+        ("v1", "ConfigMap"): ("/api/v1", "configmaps", True),
+        ("v1", "Secret"): ("/api/v1", "secrets", True),
+        ("v1", "Service"): ("/api/v1", "services", True),
+        ("v1", "ServiceAccount"): ("/api/v1", "serviceaccounts", True),
+        ("v1", "Pod"): ("/api/v1", "pods", True),
+        ("v1", "PersistentVolume"): ("/api/v1", "persistentvolumes", False),
+        ("v1", "PersistentVolumeClaim"): ("/api/v1", "persistentvolumeclaims", True),
+        ("apps/v1", "Deployment"): ("/apis/apps/v1", "deployments", True),
+        ("apps/v1", "StatefulSet"): ("/apis/apps/v1", "statefulsets", True),
+        ("apps/v1", "DaemonSet"): ("/apis/apps/v1", "daemonsets", True),
+        ("batch/v1", "Job"): ("/apis/batch/v1", "jobs", True),
+        ("batch/v1", "CronJob"): ("/apis/batch/v1", "cronjobs", True),
+        ("networking.k8s.io/v1", "Ingress"): ("/apis/networking.k8s.io/v1", "ingresses", True),
+        ("storage.k8s.io/v1", "StorageClass"): ("/apis/storage.k8s.io/v1", "storageclasses", False),
+    }
+
+    # Labels added to every applied object, identifying the API and the component it belongs to.
+    api_label: str = "io.foundation.api"
+    component_label: str = "io.foundation.component"
+
+    # Kinds whose pod template is labeled as well, so pods can be selected by component.
+    workload_kinds: list = ["Deployment", "StatefulSet", "DaemonSet", "Job"]
+
+    def __init__(self, api_client, kubectl: List[str], namespace: str = "default", field_manager: str = "fctl",
+                 jobs: int = 8, api: str = None) -> None:
+        self.api_client = api_client
+        self.kubectl = kubectl
+        self.namespace = namespace
+        self.field_manager = field_manager
+        self.jobs = jobs
+        self.api = api
+
+    @staticmethod
+    def load(path: str) -> List[dict]:
+        """ Parses every document of a manifest file. Raises ApplyError when it can't be read or parsed. """
+        import yaml
+
+        try:
+            with open(path) as f:
+                return [document for document in yaml.safe_load_all(f) if document]
+        except OSError as error:
+            raise ApplyError(f"Failed to read {path}.", error.strerror or str(error))
+        except yaml.YAMLError as error:
+            raise ApplyError(f"Failed to parse {path}.", str(error))
+
+    def label(self, manifest: dict, owner: str) -> dict:
+        """ Returns a copy of the manifest labeled with the API and the component that owns it. """
+        labeled = copy.deepcopy(manifest)
+        labels = {self.component_label: owner}
+        if (self.api is not None):
+            labels[self.api_label] = self.api
+
+        labeled.setdefault("metadata", {}).setdefault("labels", {}).update(labels)
+        if (labeled.get("kind") in self.workload_kinds and "template" in labeled.get("spec", {})):
+            template = labeled["spec"]["template"]
+            template.setdefault("metadata", {}).setdefault("labels", {}).update(labels)
+
+        return labeled
+
+    def selector(self, components: Optional[List[str]] = None) -> str:
+        """ Returns the label selector matching every object applied for the API, or only for some components. """
+        selector = f"{self.api_label}={self.api}" if self.api is not None else self.component_label
+        if (components is not None):
+            selector += f",{self.component_label} in ({','.join(components)})"
+
+        return selector
+
+    def namespace_of(self, manifest: dict) -> Optional[str]:
+        known = self.kinds.get((manifest.get("apiVersion"), manifest.get("kind")))
+        if (known is None or not known[2]):
+            return None
+
+        return manifest.get("metadata", {}).get("namespace") or self.namespace
+
+    def collection_path(self, api_version: str, kind: str, namespace: Optional[str] = None) -> Optional[str]:
+        """ Returns the API path listing the objects of a kind, or None if the kind is not known. """
+        known = self.kinds.get((api_version, kind))
+        if (known is None):
+            return None
+
+        prefix, resource, namespaced = known
+        if (namespaced):
+            return f"{prefix}/namespaces/{namespace or self.namespace}/{resource}"
+
+        return f"{prefix}/{resource}"
+
+    def path_of(self, manifest: dict) -> Optional[str]:
+        """ Returns the API path of the object described by the manifest, or None if the kind is not known. """
+        known = self.kinds.get((manifest.get("apiVersion"), manifest.get("kind")))
+        if (known is None):
+            return None
+
+        prefix, resource, namespaced = known
+        name = manifest["metadata"]["name"]
+
+        if (namespaced):
+            namespace = manifest["metadata"].get("namespace") or self.namespace
+            return f"{prefix}/namespaces/{namespace}/{resource}/{name}"
+
+        return f"{prefix}/{resource}/{name}"
+
+    def list_objects(self, api_version: str, kind: str, namespace: Optional[str] = None,
+                     label_selector: Optional[str] = None) -> List[dict]:
+        """ Lists the objects of a known kind with a single request. """
+        return self.list_collection(api_version, kind, namespace, label_selector)[0]
+
+    def list_collection(self, api_version: str, kind: str, namespace: Optional[str] = None,
+                        label_selector: Optional[str] = None) -> Tuple[List[dict], str]:
+        """ Lists the objects of a known kind. Returns them with the resource version to start watching from. """
+        query = [("labelSelector", label_selector)] if label_selector else []
+        response = self._request("GET", self.collection_path(api_version, kind, namespace), query)
+
+        items = response.get("items", [])
+        for item in items:
+            item["apiVersion"] = api_version
+            item["kind"] = kind
+
+        return items, response.get("metadata", {}).get("resourceVersion", "")
+
+    def watch_objects(self, api_version: str, kind: str, resource_version: str, namespace: Optional[str] = None,
+                      label_selector: Optional[str] = None, timeout: int = 300) -> Iterator[Tuple[str, dict]]:
+        """
+        Streams (type, object) watch events of a kind, starting after 'resource_version'. The stream ends after
+        'timeout' seconds, or with an 'ERROR' event when the resource version is too old and a new list is needed.
+        """
+        from kubernetes.client.rest import ApiException
+        from kubernetes.watch.watch import iter_resp_lines
+        from urllib3.exceptions import HTTPError
+
+        query = [("watch", "true"), ("resourceVersion", resource_version), ("timeoutSeconds", str(timeout)),
+                 ("allowWatchBookmarks", "true")]
+        if (label_selector):
+            query.append(("labelSelector", label_selector))
+
+        try:
+            response = self.api_client.call_api(self.collection_path(api_version, kind, namespace), "GET",
+                                                query_params=query, header_params={"Accept": "application/json"},
+                                                auth_settings=["BearerToken"], _return_http_data_only=True,
+                                                _preload_content=False)
+        except (ApiException, HTTPError, OSError) as error:
+            raise ApplyError(f"Failed to watch {kind} objects.", ApplyEngine._explain(error))
+
+        try:
+            for line in iter_resp_lines(response):
+                event = json.loads(line)
+                item = event.get("object", {})
+                if (event.get("type") not in ["ERROR", "BOOKMARK"]):
+                    item["apiVersion"] = api_version
+                    item["kind"] = kind
+
+                yield event.get("type"), item
+        except (HTTPError, OSError) as error:
+            raise ApplyError(f"Failed to watch {kind} objects.", str(error))
+        finally:
+            response.release_conn()
+
+    def get(self, manifest: dict) -> Optional[dict]:
+        """ Returns the live object described by the manifest, or None if it doesn't exist. """
+        path = self.path_of(manifest)
+        if (path is None):
+            raise ApplyError(f"Can't get {manifest.get('kind')} objects.")
+
+        try:
+            item = self._request("GET", path, [])
+        except ApplyError as error:
+            if ("not found" in error.output):
+                return None
+            raise
+
+        item["apiVersion"] = manifest["apiVersion"]
+        item["kind"] = manifest["kind"]
+        return item
+
+    def delete(self, manifest: dict) -> None:
+        """ Deletes the object described by the manifest, letting its dependents be collected in the background. """
+        path = self.path_of(manifest)
+        if (path is None):
+            raise ApplyError(f"Can't delete {manifest.get('kind')} objects.")
+
+        self._request("DELETE", path, [("propagationPolicy", "Background")])
+
+    def patch(self, manifest: dict, patch: dict) -> dict:
+        """ Merges a patch into the live object described by the manifest. Returns the patched object. """
+        path = self.path_of(manifest)
+        if (path is None):
+            raise ApplyError(f"Can't patch {manifest.get('kind')} objects.")
+
+        return self._request("PATCH", path, [("fieldManager", self.field_manager)], patch,
+                             f"Failed to patch {manifest['kind']} {manifest['metadata']['name']}.",
+                             "application/merge-patch+json")
+
+    def apply(self, manifest: dict) -> bool:
+        """ Applies a single object. Returns whether kubectl had to be used. Raises ApplyError on failure. """
+        path = self.path_of(manifest)
+        if (path is None):
+            self._apply_with_kubectl(manifest)
+            return True
+
+        self._request("PATCH", path, [("fieldManager", self.field_manager), ("force", "true")], manifest,
+                      f"Failed to apply {manifest['kind']} {manifest['metadata']['name']}.")
+
+        return False
+
+    def apply_many(self, objects: List[Tuple[str, dict]]) -> List[ApplyResult]:
+        """ Applies (owner, manifest) pairs concurrently. Returns one result per object, in the same order. """
+        def run(owner: str, manifest: dict) -> ApplyResult:
+            result = ApplyResult(owner, manifest)
+            with tracer.span("apply " + str(result), "apply", component=owner) as span:
+                try:
+                    result.fallback = span.attributes["fallback"] = self.apply(self.label(manifest, owner))
+                except ApplyError as error:
+                    result.error = error
+                    span.attributes["error"] = "ApplyError"
+                except Exception as error:
+                    # Anything else, such as a malformed manifest, fails this object only instead of the whole batch.
+                    result.error = ApplyError(f"Failed to apply {result}.", str(error))
+                    span.attributes["error"] = type(error).__name__
+
+            return result
+
+        if (len(objects) <= 1):
+            return [run(owner, manifest) for owner, manifest in objects]
+
+        with ThreadPoolExecutor(max_workers=self.jobs, thread_name_prefix="fctl-apply") as pool:
+            return list(pool.map(lambda item: run(*item), objects))
+
+    def _request(self, method: str, path: str, query: list, body: dict = None, message: str = None,
+                 content_type: str = "application/apply-patch+yaml") -> dict:
+        from kubernetes.client.rest import ApiException
+        from urllib3.exceptions import HTTPError
+
+        headers = {"Accept": "application/json"}
+        if (method == "PATCH"):
+            headers["Content-Type"] = content_type
+
+        try:
+            response = self.api_client.call_api(path, method, query_params=query, header_params=headers, body=body,
+                                                auth_settings=["BearerToken"], _return_http_data_only=True,
+                                                _preload_content=False)
+        except (ApiException, HTTPError, OSError) as error:
+            # Connection failures are raised by urllib3, and never reach the cluster.
+            raise ApplyError(message or f"Request {method} {path} failed.", ApplyEngine._explain(error))
+
+        return json.loads(response.data or b"{}")
+
+    def _apply_with_kubectl(self, manifest: dict) -> None:
+        try:
+            # Objects without a namespace go to the one of the environment, like the ones applied through the API.
+            namespace = [] if manifest.get("metadata", {}).get("namespace") else ["--namespace", self.namespace]
+            code, _, error = Shell.execute(self.kubectl + ["apply", "--server-side", "--force-conflicts",
+                                                           "--field-manager", self.field_manager] + namespace
+                                           + ["-f", "-"], json.dumps(manifest))
+        except OSError as error:
+            raise ApplyError(f"Failed to run {self.kubectl[0]}.", str(error))
+        if (code != 0):
+            raise ApplyError(f"Failed to apply {manifest.get('kind')} {manifest.get('metadata', {}).get('name')}.", error)
+
+    @staticmethod
+    def _explain(error) -> str:
+        try:
+            return json.loads(error.body)["message"]
+        except (AttributeError, TypeError, ValueError, KeyError):
+            return str(error)
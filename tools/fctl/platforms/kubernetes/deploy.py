@@ -0,0 +1,285 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from os import path
+from typing import Callable, List, Optional
+
+from rich.markup import escape
+
+from lib.configuration import Configuration
+from lib.console import console
+from lib.directories import ROOT_DIR
+from lib.readiness import ReadinessResult, ReadinessTracker
+from lib.render import Renderer, RenderedState, render_dir
+from lib.trace import tracer
+
+from platforms.kubernetes.apply import ApplyEngine, ApplyError, ApplyResult
+from platforms.kubernetes.readiness import RolloutWaiter
+from platforms.kubernetes.reconcile import Action, Reconciler
+
+class DeployError(Exception):
+    def __init__(self, message: str, output: str = "") -> None:
+        super().__init__(message)
+        self.output = output
+
+class DeployResult:
+    def __init__(self, environment: Optional[str]) -> None:
+        self.environment: Optional[str] = environment
+        self.applied: int = 0
+        self.failed: int = 0
+        self.pruned: int = 0
+        self.readiness: List[ReadinessResult] = []
+        self.error: Optional[DeployError] = None
+        self.elapsed: float = 0
+
+class Deployer:
+    """
+    Deploys the configuration of an environment to its cluster: the secrets first, then one tier of 'order' at a
+    time, optionally waiting for each tier to roll out, and finally prunes removed objects when reconciling. Fatal
+    failures raise DeployError, so several environments can be deployed concurrently.
+    """
+
+    def __init__(self, configuration: Configuration, engine: ApplyEngine, selected: Optional[List[str]] = None,
+                 rendered: bool = False, reconcile: bool = False, dry_run: bool = False, wait: bool = False,
+                 timeout: int = 300, ignore: bool = False, on_status: Callable[[str], None] = None) -> None:
+        self.configuration = configuration
+        self.engine = engine
+        self.selected = selected
+        self.rendered = rendered
+        self.reconcile = reconcile or dry_run
+        self.dry_run = dry_run
+        self.wait = wait
+        self.timeout = timeout
+        self.ignore = ignore
+        self.on_status = on_status
+
+        environment = configuration.environment
+        # Tags the log lines of the environment, which are interleaved with those of the others.
+        self.prefix = f"[{environment}] " if environment is not None else ""
+        self.result = DeployResult(environment)
+
+    def is_selected(self, id: str) -> bool:
+        # Secrets are shared, so they are applied whatever the selection.
+        return id == "secrets" or self.selected is None or id in self.selected
+
+    def run(self) -> DeployResult:
+        start = time.monotonic()
+        try:
+            self._run()
+        except DeployError as error:
+            self.result.error = error
+        finally:
+            self.result.elapsed = time.monotonic() - start
+
+        console.event("deploy", environment=self.result.environment, status="failed" if self.result.error else "deployed",
+                      duration=round(self.result.elapsed, 3), applied=self.result.applied, failed=self.result.failed,
+                      pruned=self.result.pruned, error=str(self.result.error) if self.result.error else None)
+        return self.result
+
+    def _run(self) -> None:
+        configuration = self.configuration
+        engine = self.engine
+
+        # Manifest of each component, and its content hash when rendered. Rendered manifests are skipped while they
+        # match the last one successfully applied, unless the cluster is reconciled.
+        manifests = {component.id: (path.join(ROOT_DIR, component.path), None) for component in configuration.components}
+        applied = RenderedState.of(configuration.environment)
+        if (self.rendered):
+            for file in Renderer(configuration, render_dir(configuration.environment)).render(compose=False):
+                manifests[file.component.id] = (file.path, file.digest)
+
+        # Objects to apply, one tier at a time, starting with the secrets.
+        try:
+            secrets = engine.load(path.join(ROOT_DIR, configuration.settings["secrets_file"]))
+        except ApplyError as error:
+            raise DeployError("Failed to load secrets.", error.output or str(error))
+
+        tiers = [[("secrets", manifest) for manifest in secrets]]
+        for tier in configuration.tiers:
+            objects = []
+            for component in tier:
+                if (not self.is_selected(component.id)):
+                    continue
+
+                manifest_file, digest = manifests[component.id]
+                if (not self.reconcile and digest is not None and applied.get(component.id) == digest):
+                    self.log("[italic bright_black]* " + component.id + " is unchanged. Skipping...")
+                    continue
+
+                try:
+                    objects += [(component.id, manifest) for manifest in engine.load(manifest_file)]
+                except ApplyError as error:
+                    raise DeployError(f"Failed to load the manifest of {component.id}.", error.output or str(error))
+
+            tiers.append(objects)
+
+        pruned = []
+        if (self.reconcile):
+            reconciler = Reconciler(engine)
+            self.status("[bold blue]Comparing with the cluster...")
+            try:
+                with tracer.span(self.prefix + "plan", "deploy"):
+                    actions = reconciler.plan([item for tier in tiers for item in tier])
+            except ApplyError as error:
+                raise DeployError("Failed to compare with the cluster.", error.output or str(error))
+
+            # Objects of components left out of the selection are not planned, so they must not be pruned either.
+            actions = [action for action in actions if action.operation != "delete" or self.is_selected(action.owner)]
+
+            print_plan(actions, "Plan" + (f" for {configuration.environment}" if configuration.environment else ""))
+            if (self.dry_run):
+                return
+
+            changed = set(reconciler.key(action.manifest) for action in actions if action.operation in ["create", "update"])
+            tiers = [[(owner, manifest) for owner, manifest in tier if reconciler.key(engine.label(manifest, owner)) in changed]
+                     for tier in tiers]
+            pruned = [action for action in actions if action.operation == "delete"]
+
+        # Apply secrets
+        self.status("[bold blue]Applying secrets...")
+        with tracer.span(self.prefix + "secrets", "deploy", objects=len(tiers[0])):
+            secrets_results = engine.apply_many(tiers[0])
+
+        self.result.applied += len(secrets_results)
+        self.report(secrets_results)
+        for result in secrets_results:
+            if (result.error is not None):
+                raise DeployError("Failed to apply secrets.", result.error.output or str(result.error))
+
+        # Apply service configurations, one tier at a time.
+        self.status("Applying service configurations...")
+        for index, objects in enumerate(tiers[1:]):
+            for owner in dict.fromkeys(owner for owner, _ in objects):
+                self.log("* Applying " + owner + "...")
+
+            with tracer.span(self.prefix + f"tier {index + 1}", "deploy", objects=len(objects)):
+                results = engine.apply_many(objects)
+            failures = [result for result in results if result.error is not None]
+            self.report(results)
+
+            self.result.applied += len(results) - len(failures)
+            self.result.failed += len(failures)
+            for result in failures:
+                console.error(escape(self.prefix) + "[bold red]Failed to apply " + str(result) + " of service " + result.owner + ".")
+                console.error_panel(result.error.output or str(result.error))
+
+            if (self.rendered):
+                for owner in set(result.owner for result in results) - set(result.owner for result in failures):
+                    applied.set(owner, manifests[owner][1])
+                applied.save()
+
+            if (failures):
+                if (self.ignore):
+                    self.log("[italic bright_black]Continuing...")
+                else:
+                    raise DeployError(f"Failed to apply tier {index + 1}.")
+
+            # The next tier is only applied once every component of this one is ready.
+            tier = [c for c in configuration.tiers[index] if self.is_selected(c.id)]
+            if (self.wait and tier):
+                self.wait_for(tier, index)
+
+        # Prune objects that are no longer part of the configuration.
+        if (pruned):
+            self.status("Pruning removed objects...")
+            with ThreadPoolExecutor(max_workers=engine.jobs) as pool:
+                for action, error in zip(pruned, pool.map(lambda action: delete_object(engine, action.manifest), pruned)):
+                    console.event("prune", action.owner, object=str(action), environment=self.result.environment,
+                                  status="deleted" if error is None else "failed", error=error and (error.output or str(error)))
+                    if (error is None):
+                        self.result.pruned += 1
+                        self.log("* Deleted " + str(action) + ".")
+                    else:
+                        console.error(escape(self.prefix) + "[bold red]Failed to delete " + str(action) + ".")
+                        console.error_panel(error.output or str(error))
+
+    def wait_for(self, tier: list, index: int) -> None:
+        self.status("[bold blue]Waiting for " + ", ".join(c.id for c in tier) + "...")
+
+        tracker = ReadinessTracker({c.id: c.ready_timeout or self.timeout for c in tier},
+                                   on_change=lambda result: report_readiness(result, self.result.environment))
+        try:
+            with tracer.span(self.prefix + f"wait tier {index + 1}", "deploy"):
+                RolloutWaiter(self.engine).wait(tracker)
+        except ApplyError as error:
+            raise DeployError("Failed to watch the rollout of " + ", ".join(c.id for c in tier) + ".",
+                              error.output or str(error))
+
+        self.result.readiness += tracker.results.values()
+        if (tracker.failed()):
+            if (self.ignore):
+                self.log("[italic bright_black]Continuing...")
+            else:
+                raise DeployError(", ".join(result.component for result in tracker.failed()) + " did not become ready.")
+
+    def report(self, results: List[ApplyResult]) -> None:
+        for result in results:
+            console.event("apply", result.owner, object=str(result), environment=self.result.environment,
+                          status="applied" if result.error is None else "failed",
+                          error=result.error and (result.error.output or str(result.error)))
+
+    def log(self, message: str) -> None:
+        console.log(escape(self.prefix) + message)
+
+    def status(self, message: str) -> None:
+        if (self.on_status is not None):
+            self.on_status(message)
+
+def report_readiness(result: ReadinessResult, environment: Optional[str] = None) -> None:
+    console.event("ready", result.component, status=result.state, duration=round(result.elapsed, 3),
+                  environment=environment, details=result.details or None)
+
+    prefix = escape(f"[{environment}] ") if environment is not None else ""
+    if (result.state == "ready"):
+        console.log(f"{prefix}* {result.component} is ready after {result.elapsed:.1f}s.")
+    else:
+        console.error(f"{prefix}{result.component} is not ready ({result.state}): {result.details}")
+
+def delete_object(engine: ApplyEngine, manifest: dict) -> Optional[ApplyError]:
+    try:
+        engine.delete(manifest)
+    except ApplyError as error:
+        return error
+
+    return None
+
+def print_plan(actions: List[Action], title: str = "Plan") -> None:
+    from rich.table import Table
+
+    styles = {"create": "green", "update": "yellow", "delete": "red", "unchanged": "bright_black"}
+
+    table = Table(title=title)
+    table.add_column("Component")
+    table.add_column("Object")
+    table.add_column("Action")
+
+    for action in actions:
+        style = styles[action.operation]
+        table.add_row(action.owner, str(action), f"[{style}]{action.operation}[/{style}]")
+
+    console.print(table)
+
+    counts = {operation: len([a for a in actions if a.operation == operation]) for operation in styles}
+    console.log(", ".join(f"{count} to {operation}" if operation != "unchanged" else f"{count} unchanged"
+                          for operation, count in counts.items()) + ".")
+
+def summary_table(results: List[DeployResult], contexts: List[str]):
+    """ Returns a table with the outcome of the deploy of each environment. """
+    from rich.table import Table
+
+    table = Table(title="Environments")
+    table.add_column("Environment")
+    table.add_column("Context")
+    table.add_column("Applied", justify="right")
+    table.add_column("Failed", justify="right")
+    table.add_column("Pruned", justify="right")
+    table.add_column("Ready", justify="right")
+    table.add_column("Time", justify="right")
+    table.add_column("Result")
+
+    for result, context in zip(results, contexts):
+        ready = len([r for r in result.readiness if r.state == "ready"])
+        outcome = "[green]deployed[/green]" if result.error is None else f"[red]{result.error}[/red]"
+        table.add_row(result.environment or "-", context, str(result.applied), str(result.failed), str(result.pruned),
+                      f"{ready}/{len(result.readiness)}" if result.readiness else "-", f"{result.elapsed:.1f}s", outcome)
+
+    return table
@@ -0,0 +1,87 @@
+import threading
+from typing import List, Optional
+
+from lib.logs import LogMultiplexer
+from platforms.kubernetes.apply import ApplyEngine, ApplyError
+
+class KubernetesLogs:
+    """
+    Streams the logs of the containers of every pod of the API through the Kubernetes API. 'since' and 'tail' are
+    passed to the server, so older lines are never sent. Pods are followed with a watch, attaching new pods and
+    restarted containers, which are told apart by their container ID.
+    """
+
+    def __init__(self, engine: ApplyEngine, client, components: Optional[List[str]] = None,
+                 since: Optional[int] = None, tail: Optional[int] = None, follow: bool = True) -> None:
+        self.engine = engine
+        self.client = client
+        self.components = components
+        self.since = since
+        self.tail = tail
+        self.follow = follow
+        self.version: str = ""
+
+    def selector(self) -> str:
+        return self.engine.selector(self.components)
+
+    def start(self, multiplexer: LogMultiplexer) -> int:
+        """ Attaches every running container of the selected pods. Returns how many were attached. """
+        pods, self.version = self.engine.list_collection("v1", "Pod", label_selector=self.selector())
+        return sum(self.attach(multiplexer, pod, self.since, self.tail) for pod in pods)
+
+    def watch(self, multiplexer: LogMultiplexer, stop: threading.Event) -> None:
+        """ Attaches containers as they start. A restarted container is read from the start of its new instance. """
+        while not stop.is_set():
+            try:
+                for type, pod in self.engine.watch_objects("v1", "Pod", self.version, label_selector=self.selector()):
+                    if (stop.is_set()):
+                        return
+
+                    if (type == "ERROR"):
+                        raise ApplyError(pod.get("message", "Watch expired."))
+
+                    self.version = pod.get("metadata", {}).get("resourceVersion", self.version)
+                    if (type in ["ADDED", "MODIFIED"]):
+                        self.attach(multiplexer, pod, None, None)
+            except ApplyError:
+                if (stop.wait(1)):
+                    return
+
+                try:
+                    for pod in self.engine.list_collection("v1", "Pod", label_selector=self.selector())[0]:
+                        self.attach(multiplexer, pod, None, None)
+                except ApplyError:
+                    continue
+
+    def attach(self, multiplexer: LogMultiplexer, pod: dict, since: Optional[int], tail: Optional[int]) -> int:
+        metadata = pod["metadata"]
+        component = metadata.get("labels", {}).get(self.engine.component_label, "")
+        statuses = pod.get("status", {}).get("containerStatuses") or []
+
+        attached = 0
+        for status in statuses:
+            # Containers that never started have no logs yet; they are attached once the watch sees them running.
+            state = status.get("state", {})
+            if (not status.get("containerID") or not ("running" in state or "terminated" in state)):
+                continue
+
+            key = status["containerID"]
+            if (key in multiplexer.streams):
+                continue
+
+            prefix = metadata["name"] if len(statuses) == 1 else metadata["name"] + "/" + status["name"]
+
+            from kubernetes.client.rest import ApiException
+
+            try:
+                response = self.client.read_namespaced_pod_log(
+                    metadata["name"], metadata.get("namespace") or self.engine.namespace, container=status["name"],
+                    follow=self.follow and "running" in state, since_seconds=since, tail_lines=tail,
+                    _preload_content=False)
+            except ApiException:
+                continue
+
+            if (multiplexer.attach(key, component, prefix, response.stream(4096), response.release_conn)):
+                attached += 1
+
+        return attached
@@ -0,0 +1,128 @@
+import math
+from typing import Dict, List, Tuple
+
+from lib.readiness import ReadinessTracker
+from platforms.kubernetes.apply import ApplyEngine, ApplyError
+
+class RolloutWaiter:
+    """
+    Waits for the deployments of the components of a tier to finish rolling out, the same way 'kubectl rollout
+    status' does, with a single watch over the deployments of every component instead of polling each one.
+    """
+
+    def __init__(self, engine: ApplyEngine) -> None:
+        self.engine = engine
+
+    def wait(self, tracker: ReadinessTracker) -> None:
+        """ Returns once every component of the tracker is ready, failed or timed out. """
+        selector = self.engine.selector(list(tracker.results.keys()))
+        items, version = self.engine.list_collection("apps/v1", "Deployment", label_selector=selector)
+        deployments = {item["metadata"]["name"]: item for item in items}
+
+        # Components without deployments have nothing to roll out.
+        owned = set(item["metadata"].get("labels", {}).get(self.engine.component_label) for item in items)
+        for id in tracker.pending():
+            if (id not in owned):
+                tracker.update(id, True, "No deployments.")
+
+        self.evaluate(tracker, deployments)
+
+        while tracker.pending():
+            remaining = tracker.remaining()
+            if (remaining <= 0):
+                break
+
+            try:
+                for type, item in self.engine.watch_objects("apps/v1", "Deployment", version, label_selector=selector,
+                                                            timeout=max(1, math.ceil(remaining))):
+                    if (type == "ERROR"):
+                        raise ApplyError(item.get("message", "Watch expired."))
+
+                    version = item.get("metadata", {}).get("resourceVersion", version)
+                    if (type == "BOOKMARK"):
+                        continue
+
+                    if (type == "DELETED"):
+                        deployments.pop(item["metadata"]["name"], None)
+                    else:
+                        deployments[item["metadata"]["name"]] = item
+
+                    self.evaluate(tracker, deployments)
+                    if (not tracker.pending()):
+                        break
+            except ApplyError:
+                items, version = self.engine.list_collection("apps/v1", "Deployment", label_selector=selector)
+                deployments = {item["metadata"]["name"]: item for item in items}
+                self.evaluate(tracker, deployments)
+
+            tracker.expire()
+
+        tracker.expire()
+
+        # Say why the components that didn't become ready are stuck.
+        for result in tracker.failed():
+            if (result.state == "timeout"):
+                result.details = self.explain(result.component) or result.details
+
+    def evaluate(self, tracker: ReadinessTracker, deployments: Dict[str, dict]) -> None:
+        by_component: Dict[str, List[dict]] = {}
+        for item in deployments.values():
+            by_component.setdefault(item["metadata"].get("labels", {}).get(self.engine.component_label), []).append(item)
+
+        for id in tracker.pending():
+            statuses = [RolloutWaiter.rollout(item) for item in by_component.get(id, [])]
+            if (not statuses):
+                continue
+
+            waiting = [details for ready, failed, details in statuses if not ready]
+            failed = [details for ready, failed, details in statuses if failed]
+            if (failed):
+                tracker.update(id, False, "; ".join(failed), failed=True)
+            else:
+                tracker.update(id, not waiting, "; ".join(waiting) or "Rolled out.")
+
+    def explain(self, id: str) -> str:
+        """ Returns why the pods of a component are not ready, e.g. 'CrashLoopBackOff'. """
+        try:
+            pods = self.engine.list_objects("v1", "Pod", label_selector=self.engine.selector([id]))
+        except ApplyError:
+            return ""
+
+        reasons = []
+        for pod in pods:
+            for container in pod.get("status", {}).get("containerStatuses") or []:
+                waiting = container.get("state", {}).get("waiting")
+                if (waiting):
+                    reasons.append(f"{pod['metadata']['name']}: {waiting.get('reason', 'Waiting')}")
+
+        return ", ".join(reasons)
+
+    @staticmethod
+    def rollout(item: dict) -> Tuple[bool, bool, str]:
+        """ Returns whether a deployment finished rolling out, whether it failed, and what it's waiting for. """
+        metadata = item.get("metadata", {})
+        spec = item.get("spec", {})
+        status = item.get("status", {})
+        name = metadata.get("name", "")
+
+        for condition in status.get("conditions") or []:
+            if (condition.get("type") == "Progressing" and condition.get("reason") == "ProgressDeadlineExceeded"):
+                return False, True, f"{name}: progress deadline exceeded."
+
+        if (status.get("observedGeneration", 0) < metadata.get("generation", 0)):
+            return False, False, f"{name}: waiting for the rollout to start."
+
+        replicas = spec.get("replicas", 1)
+        updated = status.get("updatedReplicas", 0)
+        available = status.get("availableReplicas", 0)
+
+        if (updated < replicas):
+            return False, False, f"{name}: {updated}/{replicas} replicas updated."
+
+        if (status.get("replicas", 0) > updated):
+            return False, False, f"{name}: {status.get('replicas', 0) - updated} old replicas pending termination."
+
+        if (available < updated):
+            return False, False, f"{name}: {available}/{updated} replicas available."
+
+        return True, False, ""
@@ -0,0 +1,125 @@
+import base64
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from platforms.kubernetes.apply import ApplyEngine
+
+Key = Tuple[str, str, Optional[str], str]
+
+class Action:
+    operations: list = ["create", "update", "unchanged", "delete"]
+
+    def __init__(self, operation: str, owner: str, manifest: dict) -> None:
+        self.operation: str = operation
+        self.owner: str = owner
+        self.manifest: dict = manifest
+
+    def __str__(self) -> str:
+        return self.manifest["kind"].lower() + "/" + self.manifest["metadata"]["name"]
+
+class Reconciler:
+    """
+    Compares the desired manifests with the live objects of the cluster, fetched with one list request per kind and
+    namespace, and plans which objects have to be created, updated or pruned. Fields set by the server are ignored.
+    """
+
+    # Metadata written by the server, never compared.
+    server_metadata: list = ["managedFields", "resourceVersion", "uid", "creationTimestamp", "generation", "selfLink"]
+
+    # Kinds that are never pruned, since deleting them may lose data or affect other workloads.
+    protected_kinds: list = ["PersistentVolumeClaim", "PersistentVolume", "StorageClass", "Namespace"]
+
+    def __init__(self, engine: ApplyEngine) -> None:
+        self.engine = engine
+
+    def plan(self, objects: List[Tuple[str, dict]], prune: bool = True) -> List[Action]:
+        """ Plans the actions for (owner, manifest) pairs. Unknown kinds are always updated. """
+        desired: Dict[Key, Tuple[str, dict]] = {}
+        for owner, manifest in objects:
+            labeled = self.engine.label(manifest, owner)
+            desired[self.key(labeled)] = (owner, labeled)
+
+        live = self.fetch(set((key[0], key[1], key[2]) for key in desired.keys()))
+
+        actions = []
+        for key, (owner, manifest) in desired.items():
+            if (self.engine.path_of(manifest) is None):
+                actions.append(Action("update", owner, manifest))
+            elif (key not in live):
+                actions.append(Action("create", owner, manifest))
+            elif (Reconciler.differs(self._normalize(manifest), live[key])):
+                actions.append(Action("update", owner, manifest))
+            else:
+                actions.append(Action("unchanged", owner, manifest))
+
+        if (prune):
+            for key, manifest in live.items():
+                if (key in desired or manifest["kind"] in self.protected_kinds):
+                    continue
+
+                owner = manifest["metadata"].get("labels", {}).get(self.engine.component_label, "")
+                actions.append(Action("delete", owner, manifest))
+
+        return actions
+
+    def fetch(self, kinds: set) -> Dict[Key, dict]:
+        """ Lists the live objects of the API for each (apiVersion, kind, namespace), concurrently. """
+        kinds = [kind for kind in kinds if self.engine.collection_path(*kind) is not None]
+
+        def list_kind(kind: Tuple[str, str, Optional[str]]) -> List[dict]:
+            return self.engine.list_objects(*kind, label_selector=self.engine.selector())
+
+        with ThreadPoolExecutor(max_workers=max(1, min(len(kinds), self.engine.jobs))) as pool:
+            listed = list(pool.map(list_kind, kinds))
+
+        live = {}
+        for items in listed:
+            for item in items:
+                live[self.key(item)] = item
+
+        return live
+
+    def key(self, manifest: dict) -> Key:
+        return (manifest.get("apiVersion"), manifest.get("kind"), self.engine.namespace_of(manifest),
+                manifest.get("metadata", {}).get("name"))
+
+    def _normalize(self, manifest: dict) -> dict:
+        """ Drops fields that are never compared, and encodes the 'stringData' of secrets like the server stores it. """
+        normalized = {key: value for key, value in manifest.items() if key != "status"}
+        normalized["metadata"] = {key: value for key, value in manifest.get("metadata", {}).items()
+                                  if key not in self.server_metadata}
+
+        if (manifest.get("kind") == "Secret" and "stringData" in manifest):
+            data = dict(manifest.get("data") or {})
+            for key, value in manifest["stringData"].items():
+                data[key] = base64.b64encode(str(value).encode()).decode()
+
+            normalized.pop("stringData")
+            normalized["data"] = data
+
+        return normalized
+
+    @staticmethod
+    def differs(desired: Any, live: Any) -> bool:
+        """
+        Returns whether the live value doesn't contain the desired one. Keys only present in the live object are
+        defaulted or managed by the server and don't count as differences.
+        """
+        # Unset and empty values match fields the server omits.
+        if (desired is None or (live is None and desired in [False, 0, "", [], {}])):
+            return False
+
+        if (isinstance(desired, dict)):
+            if (not isinstance(live, dict)):
+                return True
+
+            return any(Reconciler.differs(value, live.get(key)) for key, value in desired.items())
+
+        if (isinstance(desired, list)):
+            if (not isinstance(live, list) or len(desired) != len(live)):
+                return True
+
+            return any(Reconciler.differs(d, l) for d, l in zip(desired, live))
+
+        # Scalars written as strings (e.g. ports or quantities) are equal to the value the server returns.
+        return desired != live and str(desired) != str(live)
@@ -0,0 +1,38 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import List
+
+from platforms.kubernetes.apply import ApplyEngine, ApplyError, ApplyResult
+
+class RolloutRestart:
+    """
+    Restarts deployments the way 'kubectl rollout restart' does, by stamping their pod template with an annotation.
+    Each deployment then replaces its pods following its rolling update strategy, so its service is never down.
+    """
+
+    annotation: str = "kubectl.kubernetes.io/restartedAt"
+
+    def __init__(self, engine: ApplyEngine) -> None:
+        self.engine = engine
+
+    def run(self, components: List[str]) -> List[ApplyResult]:
+        """ Restarts the deployments of the components concurrently. Returns one result per deployment. """
+        deployments = self.engine.list_objects("apps/v1", "Deployment", label_selector=self.engine.selector(components))
+        patch = {"spec": {"template": {"metadata": {"annotations": {
+            self.annotation: datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        }}}}}
+
+        def restart(item: dict) -> ApplyResult:
+            result = ApplyResult(item["metadata"].get("labels", {}).get(self.engine.component_label, ""), item)
+            try:
+                self.engine.patch(item, patch)
+            except ApplyError as error:
+                result.error = error
+
+            return result
+
+        if (len(deployments) <= 1):
+            return [restart(item) for item in deployments]
+
+        with ThreadPoolExecutor(max_workers=self.engine.jobs, thread_name_prefix="fctl-restart") as pool:
+            return list(pool.map(restart, deployments))
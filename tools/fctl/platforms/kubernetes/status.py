@@ -0,0 +1,108 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Tuple
+
+from lib.status import StatusBoard, StatusRow
+from platforms.kubernetes.apply import ApplyEngine, ApplyError
+
+class KubernetesStatus:
+    """
+    Collects the state of the pods, deployments and services of the API with one list call per kind, filtered by
+    namespace and label selector, and keeps it updated from watch streams.
+    """
+
+    # (apiVersion, kind) of each watched kind, keyed by the kind shown in the status table.
+    kinds: Dict[str, Tuple[str, str]] = {
+        "deployment": ("apps/v1", "Deployment"),
+        "pod": ("v1", "Pod"),
+        "service": ("v1", "Service"),
+    }
+
+    def __init__(self, engine: ApplyEngine) -> None:
+        self.engine = engine
+        self.versions: Dict[str, str] = {}
+
+    def snapshot(self, board: StatusBoard) -> None:
+        with ThreadPoolExecutor(max_workers=len(self.kinds)) as pool:
+            for kind, (rows, version) in zip(self.kinds, pool.map(self._list, self.kinds)):
+                self.versions[kind] = version
+                board.replace(kind, rows)
+
+    def watchers(self) -> List[Callable[[StatusBoard, threading.Event], None]]:
+        return [lambda board, stop, kind=kind: self.watch(kind, board, stop) for kind in self.kinds]
+
+    def watch(self, kind: str, board: StatusBoard, stop: threading.Event) -> None:
+        """ Applies watch events of a kind to the board, listing again only when the watch can't be resumed. """
+        api_version, api_kind = self.kinds[kind]
+
+        while not stop.is_set():
+            try:
+                for type, item in self.engine.watch_objects(api_version, api_kind, self.versions[kind],
+                                                            label_selector=self.engine.selector()):
+                    if (stop.is_set()):
+                        return
+
+                    if (type == "ERROR"):
+                        raise ApplyError(item.get("message", "Watch expired."))
+
+                    self.versions[kind] = item.get("metadata", {}).get("resourceVersion", self.versions[kind])
+                    if (type == "BOOKMARK"):
+                        continue
+
+                    name = item["metadata"]["name"]
+                    board.update(kind, name, None if type == "DELETED" else self.row(kind, item))
+            except ApplyError:
+                # The resource version expired (or the connection failed): take a new snapshot of this kind and
+                # resume from it.
+                if (stop.wait(1)):
+                    return
+
+                try:
+                    rows, self.versions[kind] = self._list(kind)
+                    board.replace(kind, rows)
+                except ApplyError:
+                    continue
+
+    def _list(self, kind: str) -> Tuple[List[StatusRow], str]:
+        api_version, api_kind = self.kinds[kind]
+        items, version = self.engine.list_collection(api_version, api_kind, label_selector=self.engine.selector())
+        return [self.row(kind, item) for item in items], version
+
+    def row(self, kind: str, item: dict) -> StatusRow:
+        metadata = item.get("metadata", {})
+        component = metadata.get("labels", {}).get(self.engine.component_label, "")
+        spec = item.get("spec", {})
+        status = item.get("status", {})
+
+        if (kind == "deployment"):
+            replicas = spec.get("replicas", 1)
+            ready = status.get("readyReplicas", 0)
+            updated = status.get("updatedReplicas", 0)
+            return StatusRow(component, kind, metadata["name"], f"{ready}/{replicas} ready",
+                             f"{updated} up to date, {status.get('availableReplicas', 0)} available",
+                             ready >= replicas and updated >= replicas)
+
+        if (kind == "pod"):
+            containers = status.get("containerStatuses") or []
+            ready = len([container for container in containers if container.get("ready")])
+            restarts = sum(container.get("restartCount", 0) for container in containers)
+
+            phase = status.get("phase", "Unknown")
+            for container in containers:
+                waiting = container.get("state", {}).get("waiting")
+                if (waiting):
+                    phase = waiting.get("reason", phase)
+
+            if (metadata.get("deletionTimestamp")):
+                phase = "Terminating"
+
+            healthy = None if phase in ["Pending", "ContainerCreating", "Terminating"] else \
+                (phase == "Running" and ready == len(containers)) or phase == "Succeeded"
+            return StatusRow(component, kind, metadata["name"], phase,
+                             f"{ready}/{len(containers)} ready, {restarts} restarts, node {spec.get('nodeName', '-')}",
+                             healthy)
+
+        ports = ", ".join(f"{port.get('port')}->{port.get('targetPort', port.get('port'))}/{port.get('protocol', 'TCP')}"
+                          for port in spec.get("ports", []))
+        return StatusRow(component, kind, metadata["name"], spec.get("type", "ClusterIP"),
+                         f"{spec.get('clusterIP', '-')}, {ports}", True)
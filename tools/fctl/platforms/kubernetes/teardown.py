@@ -0,0 +1,144 @@
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from platforms.kubernetes.apply import ApplyEngine, ApplyError
+
+class Teardown:
+    """
+    Deletes the objects of components one tier at a time, in reverse 'order', so dependents go away before what they
+    depend on. The objects of a tier are deleted concurrently, and the next tier only starts once they, and the pods
+    they owned, are gone, which is followed through watch events instead of polling.
+    """
+
+    # (apiVersion, kind) of the objects deleted, in the order they are waited for. Pods owned by other objects are
+    # collected by Kubernetes, so they are only waited for.
+    kinds: List[Tuple[str, str]] = [
+        ("apps/v1", "Deployment"),
+        ("apps/v1", "StatefulSet"),
+        ("apps/v1", "DaemonSet"),
+        ("batch/v1", "CronJob"),
+        ("batch/v1", "Job"),
+        ("networking.k8s.io/v1", "Ingress"),
+        ("v1", "Service"),
+        ("v1", "ConfigMap"),
+        ("v1", "Pod"),
+    ]
+
+    def __init__(self, engine: ApplyEngine, manifests: Optional[Dict[str, str]] = None,
+                 on_deleted: Callable[[str, dict], None] = None) -> None:
+        self.engine = engine
+        # Manifest file of each component id, used to find the objects applied before they were labeled.
+        self.manifests = manifests or {}
+        self.on_deleted = on_deleted
+
+    def run(self, tiers: List[List[str]], timeout: float) -> List[Tuple[dict, ApplyError]]:
+        """
+        Tears down tiers of component ids, given in 'order'. Returns the objects that failed to be deleted, with why,
+        in which case the tiers below are kept.
+        Raises ApplyError when a tier is not gone after 'timeout' seconds.
+        """
+        failures = []
+        for tier in reversed([tier for tier in tiers if tier]):
+            objects = [(item["metadata"].get("labels", {}).get(self.engine.component_label, ""), item)
+                       for item in self.fetch(tier)]
+            labeled = bool(objects)
+            if (not labeled):
+                objects = self.fetch_by_name(tier)
+
+            deletable = [(owner, item) for owner, item in objects if not item["metadata"].get("ownerReferences")]
+
+            with ThreadPoolExecutor(max_workers=self.engine.jobs, thread_name_prefix="fctl-delete") as pool:
+                for (owner, item), error in zip(deletable, pool.map(self._delete, [item for _, item in deletable])):
+                    if (error is not None):
+                        failures.append((item, error))
+                    elif (self.on_deleted is not None):
+                        self.on_deleted(owner, item)
+
+            # What the failed objects depend on is kept.
+            if (failures):
+                break
+
+            if (labeled):
+                self.wait(tier, time.monotonic() + timeout)
+            else:
+                self.wait_by_name([item for _, item in deletable], time.monotonic() + timeout)
+
+        return failures
+
+    def fetch(self, components: List[str]) -> List[dict]:
+        """ Lists the objects of the components, with one request per kind. """
+        def list_kind(kind: Tuple[str, str]) -> List[dict]:
+            return self.engine.list_objects(*kind, label_selector=self.engine.selector(components))
+
+        with ThreadPoolExecutor(max_workers=len(self.kinds)) as pool:
+            return [item for items in pool.map(list_kind, self.kinds) for item in items]
+
+    def fetch_by_name(self, components: List[str]) -> List[Tuple[str, dict]]:
+        """
+        Lists the objects named in the manifests of the components, with their owner. Objects applied before they were
+        labeled, such as with 'kubectl apply -f', don't match the selector of the components, but keep these names.
+        """
+        manifests = [(component, manifest) for component in components if component in self.manifests
+                     for manifest in self.engine.load(self.manifests[component])
+                     if (manifest.get("apiVersion"), manifest.get("kind")) in self.kinds]
+
+        with ThreadPoolExecutor(max_workers=self.engine.jobs) as pool:
+            items = pool.map(lambda entry: self.engine.get(entry[1]), manifests)
+            return [(component, item) for (component, _), item in zip(manifests, items) if item is not None]
+
+    def wait_by_name(self, objects: List[dict], deadline: float) -> None:
+        """ Returns once none of the objects is left. Unlabeled objects can't be watched as a set, so they are polled. """
+        remaining = list(objects)
+        while remaining:
+            remaining = [item for item in remaining if self.engine.get(item) is not None]
+            if (not remaining):
+                break
+
+            if (time.monotonic() >= deadline):
+                raise ApplyError("Timed out waiting for objects to be deleted.",
+                                 ", ".join(f"{item['kind'].lower()}/{item['metadata']['name']}" for item in remaining))
+
+            time.sleep(1)
+
+    def wait(self, components: List[str], deadline: float) -> None:
+        """ Returns once no object of the components is left, following the deletions of each kind in turn. """
+        selector = self.engine.selector(components)
+
+        for api_version, kind in self.kinds:
+            items, version = self.engine.list_collection(api_version, kind, label_selector=selector)
+            remaining: Set[str] = set(item["metadata"]["name"] for item in items)
+
+            while remaining:
+                left = deadline - time.monotonic()
+                if (left <= 0):
+                    raise ApplyError(f"Timed out waiting for {kind} objects to be deleted.", ", ".join(sorted(remaining)))
+
+                try:
+                    for type, item in self.engine.watch_objects(api_version, kind, version, label_selector=selector,
+                                                                timeout=max(1, math.ceil(left))):
+                        if (type == "ERROR"):
+                            raise ApplyError(item.get("message", "Watch expired."))
+
+                        version = item.get("metadata", {}).get("resourceVersion", version)
+                        if (type == "DELETED"):
+                            remaining.discard(item["metadata"]["name"])
+                        elif (type in ["ADDED", "MODIFIED"]):
+                            remaining.add(item["metadata"]["name"])
+
+                        if (not remaining):
+                            break
+                except ApplyError:
+                    items, version = self.engine.list_collection(api_version, kind, label_selector=selector)
+                    remaining = set(item["metadata"]["name"] for item in items)
+
+    def _delete(self, item: dict) -> Optional[ApplyError]:
+        try:
+            self.engine.delete(item)
+        except ApplyError as error:
+            # Objects deleted in the meantime, e.g. by garbage collection, are fine.
+            if ("not found" not in error.output):
+                return error
+
+        return None